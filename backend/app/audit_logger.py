@@ -1,17 +1,136 @@
-from datetime import datetime
-from typing import Optional, Any, Dict
+"""
+Журнал аудита.
+
+log_action / log_detailed_action только ставят запись в очередь процесса.
+Фоновый поток (audit_sink) пишет очередь пачками — одним многострочным INSERT,
+когда набралось AUDIT_BATCH_SIZE записей или прошло AUDIT_FLUSH_SECONDS.
+Очередь ограничена AUDIT_QUEUE_SIZE: при переполнении новые записи
+отбрасываются (с подсчётом), чтобы аудит не тормозил основные запросы.
+При остановке приложения очередь дописывается целиком.
+"""
+
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+from typing import Optional, Any, Dict, List
 from fastapi import Request
 from app.database import SessionLocal
 from app.models import AuditLog
 
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "2"))
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+
+# Все строки пачки должны иметь одинаковый набор колонок
+_COLUMNS = (
+    "user_id", "action", "entity_type", "entity_id", "details", "summary",
+    "bath_name", "client_name", "event_datetime", "product_list",
+    "ip_address", "user_agent", "created_at",
+)
+
 
 def get_client_ip(request: Request) -> str:
     """Получить IP адрес клиента"""
     return request.client.host if request.client else None
 
 
+class AuditSink:
+    def __init__(
+        self,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        interval: float = AUDIT_FLUSH_SECONDS,
+        max_queue: int = AUDIT_QUEUE_SIZE,
+    ):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue)
+        # Пачка, которую не удалось записать, — повторяется первой
+        self._retry: List[Dict[str, Any]] = []
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.dropped = 0
+        self.written = 0
+
+    def enqueue(self, **values: Any) -> bool:
+        row = {column: values.get(column) for column in _COLUMNS}
+        row["created_at"] = row["created_at"] or datetime.now(timezone.utc)
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                print(f"Audit queue full, dropped {self.dropped} records")
+            return False
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def _take(self, limit: int) -> List[Dict[str, Any]]:
+        rows = self._retry[:limit]
+        self._retry = self._retry[limit:]
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def flush(self) -> int:
+        """Пишет всё, что накопилось в очереди. Возвращает число записанных строк."""
+        total = 0
+        with self._flush_lock:
+            while True:
+                rows = self._take(self.batch_size)
+                if not rows:
+                    return total
+                db = SessionLocal()
+                try:
+                    db.execute(AuditLog.__table__.insert(), rows)
+                    db.commit()
+                except Exception as e:
+                    db.rollback()
+                    # Повторить при следующем сбросе, если очередь не переполнена
+                    if len(self._retry) + len(rows) <= self._queue.maxsize:
+                        self._retry = rows + self._retry
+                    else:
+                        self.dropped += len(rows)
+                    print(f"Audit log error: {e}")
+                    return total
+                finally:
+                    db.close()
+                total += len(rows)
+                self.written += len(rows)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            # Сброс по размеру пачки (enqueue будит поток) или по таймеру
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-sink", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+            self._thread = None
+        self.flush()
+
+
+audit_sink = AuditSink()
+
+
 async def log_action(
-    db,
     user_id: int,
     action: str,
     entity_type: str,
@@ -22,30 +141,20 @@ async def log_action(
 ):
     """
     Записать действие в журнал аудита.
-    Использовать с BackgroundTasks для асинхронной записи без блокировки ответа.
+    Запись ставится в очередь audit_sink и пишется фоновым потоком пачкой.
     """
-    try:
-        audit_log = AuditLog(
-            user_id=user_id,
-            action=action,
-            entity_type=entity_type,
-            entity_id=entity_id,
-            details=details,
-            ip_address=ip_address,
-            user_agent=user_agent
-        )
-        db.add(audit_log)
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        # Логировать ошибку, но не прерывать основной поток
-        print(f"Audit log error: {e}")
-    finally:
-        db.close()
+    audit_sink.enqueue(
+        user_id=user_id,
+        action=action,
+        entity_type=entity_type,
+        entity_id=entity_id,
+        details=details,
+        ip_address=ip_address,
+        user_agent=user_agent
+    )
 
 
 async def log_detailed_action(
-    db,
     user_id: int,
     action: str,
     entity_type: str,
@@ -61,28 +170,19 @@ async def log_detailed_action(
 ):
     """
     Создать расширенную запись аудита с человеко-читаемым описанием.
-    Использовать с BackgroundTasks для асинхронной записи без блокировки ответа.
+    Запись ставится в очередь audit_sink и пишется фоновым потоком пачкой.
     """
-    try:
-        audit_log = AuditLog(
-            user_id=user_id,
-            action=action,
-            entity_type=entity_type,
-            entity_id=entity_id,
-            details=details,
-            summary=summary,
-            bath_name=bath_name,
-            client_name=client_name,
-            event_datetime=event_datetime,
-            product_list=product_list,
-            ip_address=ip_address,
-            user_agent=user_agent
-        )
-        db.add(audit_log)
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        # Логировать ошибку, но не прерывать основной поток
-        print(f"Audit log error: {e}")
-    finally:
-        db.close()
+    audit_sink.enqueue(
+        user_id=user_id,
+        action=action,
+        entity_type=entity_type,
+        entity_id=entity_id,
+        details=details,
+        summary=summary,
+        bath_name=bath_name,
+        client_name=client_name,
+        event_datetime=event_datetime,
+        product_list=product_list,
+        ip_address=ip_address,
+        user_agent=user_agent
+    )
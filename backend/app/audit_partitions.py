@@ -0,0 +1,239 @@
+"""
+Помесячные секции audit_logs: создание заранее, отсоединение и архивирование старых.
+
+Секция audit_logs_YYYY_MM покрывает [1-е число месяца, 1-е число следующего) по UTC.
+Записи вне созданных секций попадают в audit_logs_default.
+Обслуживание (раз в сутки в фоне или вручную: python -m app.audit_partitions):
+  - создаёт секции на AUDIT_PARTITIONS_AHEAD месяцев вперёд и секции для месяцев,
+    чьи строки лежат в default, перенося эти строки туда (иначе default растёт
+    без ограничения и не архивируется);
+  - секции старше AUDIT_RETENTION_MONTHS отсоединяет (DETACH), выгружает в
+    AUDIT_ARCHIVE_DIR/audit_logs_YYYY_MM.csv.gz и удаляет.
+При нескольких воркерах обслуживание выполняет один — под advisory lock.
+"""
+
+from __future__ import annotations
+
+import gzip
+import os
+import re
+import threading
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+from sqlalchemy import text
+
+from app.database import engine
+
+AUDIT_PARTITIONS_AHEAD = int(os.getenv("AUDIT_PARTITIONS_AHEAD", "3"))
+AUDIT_RETENTION_MONTHS = int(os.getenv("AUDIT_RETENTION_MONTHS", "12"))
+AUDIT_ARCHIVE_DIR = Path(os.getenv(
+    "AUDIT_ARCHIVE_DIR",
+    str(Path(__file__).resolve().parent.parent / "archive" / "audit_logs"),
+))
+MAINTENANCE_INTERVAL_SECONDS = 24 * 60 * 60
+# Сколько stop() ждёт завершения идущего обслуживания (архивация секции может быть долгой)
+STOP_TIMEOUT_SECONDS = 30
+# Ключ pg_try_advisory_lock для обслуживания секций
+ADVISORY_LOCK_KEY = 7314001
+
+_PARTITION_RE = re.compile(r"^audit_logs_(\d{4})_(\d{2})$")
+
+
+def _utc_today() -> date:
+    # Границы секций — по UTC, как created_at в timestamptz; локальная дата сдвигает месяц у полуночи
+    return datetime.now(timezone.utc).date()
+
+
+def _add_months(day: date, months: int) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"audit_logs_{month.year:04d}_{month.month:02d}"
+
+
+def is_partitioned(connection) -> bool:
+    return bool(connection.execute(text(
+        "SELECT 1 FROM pg_class WHERE relname = 'audit_logs' AND relkind = 'p'"
+    )).scalar())
+
+
+def list_partitions(connection) -> List[str]:
+    rows = connection.execute(text(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'audit_logs'
+        """
+    )).all()
+    return sorted(r[0] for r in rows)
+
+
+def ensure_partitions(connection, today: Optional[date] = None, ahead: int = AUDIT_PARTITIONS_AHEAD) -> List[str]:
+    """Создаёт секцию по умолчанию и секции с текущего месяца на ahead месяцев вперёд."""
+    if not is_partitioned(connection):
+        return []
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS audit_logs_default PARTITION OF audit_logs DEFAULT"
+    ))
+    existing = set(list_partitions(connection))
+    month = (today or _utc_today()).replace(day=1)
+    months = [_add_months(month, offset) for offset in range(ahead + 1)]
+    # Месяцы, строки которых попали в default (записи до создания секции, старые данные)
+    months += connection.execute(text(
+        """
+        SELECT DISTINCT CAST(date_trunc('month', created_at AT TIME ZONE 'UTC') AS DATE)
+        FROM audit_logs_default
+        """
+    )).scalars().all()
+    created = []
+    for start in sorted(set(months)):
+        name = partition_name(start)
+        if name in existing:
+            continue
+        # Ошибка одной секции не мешает старту приложения, но видна в логе
+        try:
+            with connection.begin_nested():
+                _create_partition(connection, name, start)
+        except Exception as e:
+            print(f"Audit partition {name} not created: {e}")
+            continue
+        existing.add(name)
+        created.append(name)
+    return created
+
+
+def _create_partition(connection, name: str, start: date) -> None:
+    """
+    Создаёт секцию месяца. PostgreSQL не создаёт секцию, пока строки её диапазона
+    лежат в default, поэтому default отсоединяется, строки переносятся в новую
+    секцию, и default присоединяется обратно — всё в одной транзакции.
+    """
+    bounds = {
+        "start": f"{start.isoformat()} 00:00:00+00",
+        "end": f"{_add_months(start, 1).isoformat()} 00:00:00+00",
+    }
+    create_sql = (
+        f"CREATE TABLE {name} PARTITION OF audit_logs "
+        f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+    )
+    in_range = "created_at >= CAST(:start AS TIMESTAMPTZ) AND created_at < CAST(:end AS TIMESTAMPTZ)"
+    has_rows = connection.execute(
+        text(f"SELECT EXISTS (SELECT 1 FROM audit_logs_default WHERE {in_range})"), bounds
+    ).scalar()
+    if not has_rows:
+        connection.execute(text(create_sql))
+        return
+    connection.execute(text("ALTER TABLE audit_logs DETACH PARTITION audit_logs_default"))
+    connection.execute(text(create_sql))
+    connection.execute(text(f"INSERT INTO {name} SELECT * FROM audit_logs_default WHERE {in_range}"), bounds)
+    connection.execute(text(f"DELETE FROM audit_logs_default WHERE {in_range}"), bounds)
+    connection.execute(text("ALTER TABLE audit_logs ATTACH PARTITION audit_logs_default DEFAULT"))
+
+
+def _archive_partition(name: str, archive_dir: Path) -> Path:
+    """Выгружает отсоединённую секцию в сжатый CSV (сначала во временный файл)."""
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    target = archive_dir / f"{name}.csv.gz"
+    tmp = target.with_suffix(".gz.tmp")
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        with gzip.open(tmp, "wt", encoding="utf-8") as fh:
+            cursor.copy_expert(f"COPY (SELECT * FROM {name} ORDER BY created_at, id) TO STDOUT WITH (FORMAT csv, HEADER)", fh)
+        raw.commit()
+    finally:
+        raw.close()
+    os.replace(tmp, target)
+    return target
+
+
+def archive_expired(
+    today: Optional[date] = None,
+    retention_months: int = AUDIT_RETENTION_MONTHS,
+    archive_dir: Path = AUDIT_ARCHIVE_DIR,
+) -> List[Path]:
+    """Отсоединяет, архивирует и удаляет секции, целиком старше срока хранения."""
+    cutoff = _add_months((today or _utc_today()).replace(day=1), -retention_months)
+    archived = []
+    with engine.connect() as connection:
+        names = list_partitions(connection)
+        # Отсоединённые, но не заархивированные при прошлом запуске
+        leftovers = connection.execute(text(
+            """
+            SELECT c.relname FROM pg_class c
+            WHERE c.relname ~ '^audit_logs_[0-9]{4}_[0-9]{2}$' AND c.relkind = 'r' AND NOT c.relispartition
+            """
+        )).all()
+    for name in sorted(set(names) | {r[0] for r in leftovers}):
+        match = _PARTITION_RE.match(name)
+        if not match:
+            continue
+        month = date(int(match.group(1)), int(match.group(2)), 1)
+        if _add_months(month, 1) > cutoff:
+            continue
+        with engine.begin() as connection:
+            if name in names:
+                connection.execute(text(f"ALTER TABLE audit_logs DETACH PARTITION {name}"))
+        archived.append(_archive_partition(name, archive_dir))
+        # Удаляем только после успешной записи архива
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE {name}"))
+    return archived
+
+
+def run_maintenance() -> None:
+    with engine.connect() as lock_conn:
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": ADVISORY_LOCK_KEY}).scalar():
+            return
+        try:
+            with engine.begin() as connection:
+                if not is_partitioned(connection):
+                    return
+                ensure_partitions(connection)
+            for path in archive_expired():
+                print(f"Audit partition archived: {path}")
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": ADVISORY_LOCK_KEY})
+            lock_conn.commit()
+
+
+class AuditPartitionMaintainer:
+    def __init__(self, interval: float = MAINTENANCE_INTERVAL_SECONDS):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        while True:
+            try:
+                run_maintenance()
+            except Exception as e:
+                print(f"Audit partition maintenance error: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-partitions", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=STOP_TIMEOUT_SECONDS)
+            self._thread = None
+
+
+audit_partitions = AuditPartitionMaintainer()
+
+
+if __name__ == "__main__":
+    run_maintenance()
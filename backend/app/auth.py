@@ -6,6 +6,9 @@ from fastapi.security import OAuth2PasswordBearer
 
 from app import models, schemas, database, security
 from app.security import verify_password
+from app.permission_bits import permission_catalog
+from app.session_cache import session_cache
+from app.session_touch import session_touches
 
 import os
 import hashlib
@@ -117,8 +120,15 @@ def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    # Check if session exists and is active
     token_hash = hash_token(token)
+    now = datetime.now(timezone.utc)
+
+    cached = session_cache.get(token_hash)
+    if cached is not None and cached.expires_at >= now and cached.user.user_id == int(user_id):
+        session_touches.record(cached.session_id, now)
+        return cached.user
+
+    # Check if session exists and is active
     session = db.query(models.UserSession).filter(
         models.UserSession.token_hash == token_hash,
         models.UserSession.is_active == True
@@ -128,23 +138,23 @@ def get_current_user(
         raise credentials_exception
     
     # Check if session has expired
-    now = datetime.now(timezone.utc)
     if session.expires_at < now:
         session.is_active = False
         db.commit()
+        session_cache.invalidate_token(token_hash)
         raise credentials_exception
     
-    # Update last_used_at
-    session.last_used_at = now
-    db.commit()
+    # last_used_at пишет фоновый session_touches, без commit на каждый запрос
+    session_touches.record(session.id, now)
     
     # Get user
     user = db.query(models.User).options(
-        joinedload(models.User.role_rel).joinedload(models.Role.permissions)
+        joinedload(models.User.role_rel)
     ).filter(models.User.user_id == int(user_id)).first()
     
     if user is None or not user.is_active:
         raise credentials_exception
     
-    return user
-
+    # Права роли — битовая маска из permission_catalog, без join по role_permissions
+    permission_mask = permission_catalog.role_mask(db, user.role_id)
+    return session_cache.put(token_hash, session.id, session.expires_at, user, permission_mask)
@@ -0,0 +1,247 @@
+"""
+Кэш занятости по (bath_id, дата) для публичной доступности и списка броней админки
+(для админки — только id броней дня, сами брони читаются из БД).
+
+Записи вытесняются по LRU и живут не дольше ENTRY_TTL_SECONDS. Инвалидация —
+write-through из путей записи броней: invalidate_reservation_span() сбрасывает
+все даты, которые задевает бронь. Для нескольких воркеров uvicorn инвалидация
+рассылается через бэкенд (AVAILABILITY_CACHE_BACKEND):
+  local    — только текущий процесс (один воркер);
+  postgres — NOTIFY/LISTEN в канале availability_invalidate.
+Через тот же бэкенд другие кэши процесса рассылают свои события сброса
+(register/publish_event; например, session_cache — logout и изменения прав).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.reservation_index import to_naive_local
+
+MAX_ENTRIES = int(os.getenv("AVAILABILITY_CACHE_MAX_ENTRIES", "5000"))
+ENTRY_TTL_SECONDS = int(os.getenv("AVAILABILITY_CACHE_TTL_SECONDS", "300"))
+NOTIFY_CHANNEL = "availability_invalidate"
+# Ограничение PostgreSQL на payload NOTIFY — 8000 байт
+NOTIFY_CHUNK = 200
+
+# Все бани на дату (список броней админки)
+ALL_BATHS = 0
+
+
+class AvailabilityCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl_seconds: int = ENTRY_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, int, date], Tuple[float, Any]]" = OrderedDict()
+        # Растёт при каждой инвалидации: результат запроса, начатого до неё, не кэшируется
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, kind: str, bath_id: int, day: date) -> Optional[Any]:
+        key = (kind, bath_id, day)
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if time.monotonic() - item[0] > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return item[1]
+
+    def set(self, kind: str, bath_id: int, day: date, value: Any, generation: Optional[int] = None) -> None:
+        key = (kind, bath_id, day)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, pairs: Iterable[Tuple[int, date]]) -> None:
+        """Сбрасывает записи бани на дату и общий список броней на эту дату."""
+        with self._lock:
+            self._generation += 1
+            for bath_id, day in pairs:
+                for kind in ("availability", "reservations"):
+                    self._entries.pop((kind, bath_id, day), None)
+                    self._entries.pop((kind, ALL_BATHS, day), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+class LocalBackend:
+    """Инвалидация только в текущем процессе."""
+
+    def __init__(self, cache: AvailabilityCache):
+        self.cache = cache
+        self._handlers: Dict[str, Callable[[Any], None]] = {}
+
+    def register(self, topic: str, handler: Callable[[Any], None]) -> None:
+        """handler(data) — событие topic; handler(None) — события могли потеряться, сбросить всё."""
+        self._handlers[topic] = handler
+
+    def _dispatch(self, topic: str, data: Any) -> None:
+        handler = self._handlers.get(topic)
+        if handler is not None:
+            handler(data)
+
+    def publish(self, pairs: List[Tuple[int, date]]) -> None:
+        self.cache.invalidate(pairs)
+
+    def publish_event(self, topic: str, data: Any) -> None:
+        """Событие для всех воркеров; вызывать после commit. Свой процесс обрабатывает сразу."""
+        self._dispatch(topic, data)
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+
+class PostgresNotifyBackend(LocalBackend):
+    """
+    Инвалидация во всех воркерах: NOTIFY после commit, фоновый поток слушает LISTEN.
+    Свой процесс сбрасывается сразу, не дожидаясь уведомления.
+    """
+
+    def __init__(self, cache: AvailabilityCache):
+        super().__init__(cache)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def publish(self, pairs: List[Tuple[int, date]]) -> None:
+        self.cache.invalidate(pairs)
+        from app.database import engine
+
+        try:
+            with engine.connect() as conn:
+                conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+                for i in range(0, len(pairs), NOTIFY_CHUNK):
+                    payload = json.dumps({
+                        "pid": os.getpid(),
+                        "pairs": [[b, d.isoformat()] for b, d in pairs[i:i + NOTIFY_CHUNK]],
+                    })
+                    conn.exec_driver_sql("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, payload))
+        except Exception as e:
+            # Другие воркеры досчитаются по TTL
+            print(f"Availability cache notify error: {e}")
+
+    def publish_event(self, topic: str, data: Any) -> None:
+        self._dispatch(topic, data)
+        from app.database import engine
+
+        try:
+            with engine.connect() as conn:
+                conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+                payload = json.dumps({"pid": os.getpid(), "topic": topic, "data": data})
+                conn.exec_driver_sql("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, payload))
+        except Exception as e:
+            # Другие воркеры сбросятся по TTL
+            print(f"Cache event notify error ({topic}): {e}")
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, name="availability-listen", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _listen(self) -> None:
+        from app.database import engine
+
+        while not self._stop.is_set():
+            raw = None
+            try:
+                raw = engine.raw_connection()
+                raw.set_isolation_level(0)  # autocommit
+                cursor = raw.cursor()
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                pg_conn = raw.driver_connection
+                # После переподключения уведомления могли потеряться
+                self.cache.clear()
+                for handler in list(self._handlers.values()):
+                    handler(None)
+                while not self._stop.is_set():
+                    if select.select([pg_conn], [], [], 5) == ([], [], []):
+                        continue
+                    pg_conn.poll()
+                    while pg_conn.notifies:
+                        self._handle(pg_conn.notifies.pop(0).payload)
+            except Exception as e:
+                print(f"Availability cache listener error: {e}")
+                self._stop.wait(5)
+            finally:
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+
+    def _handle(self, payload: str) -> None:
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            return
+        if data.get("pid") == os.getpid():
+            return
+        if "topic" in data:
+            self._dispatch(data["topic"], data.get("data"))
+            return
+        self.cache.invalidate(
+            (int(b), date.fromisoformat(d)) for b, d in data.get("pairs", [])
+        )
+
+
+def _make_backend(cache: AvailabilityCache) -> LocalBackend:
+    kind = os.getenv("AVAILABILITY_CACHE_BACKEND", "local").lower()
+    if kind == "postgres":
+        return PostgresNotifyBackend(cache)
+    return LocalBackend(cache)
+
+
+availability_cache = AvailabilityCache()
+backend = _make_backend(availability_cache)
+
+
+def span_dates(start: datetime, end: datetime) -> List[date]:
+    """Даты, с которыми пересекается интервал [start, end)."""
+    start = to_naive_local(start)
+    end = to_naive_local(end)
+    last = (end - timedelta(microseconds=1)).date() if end > start else start.date()
+    days = []
+    current = start.date()
+    while current <= last:
+        days.append(current)
+        current += timedelta(days=1)
+    return days
+
+
+def invalidate_reservation_span(bath_id: int, *spans: Tuple[datetime, datetime]) -> None:
+    """Сбрасывает кэш бани на все даты, задетые переданными интервалами брони."""
+    pairs = []
+    for start, end in spans:
+        if start is None or end is None:
+            continue
+        pairs.extend((bath_id, day) for day in span_dates(start, end))
+    if pairs:
+        backend.publish(sorted(set(pairs)))
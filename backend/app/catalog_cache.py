@@ -0,0 +1,126 @@
+"""
+Кэш ответов публичного каталога: список бань, страница бани, витрина категорий, sitemap.
+
+Ответ хранится готовыми JSON-байтами с ETag (SHA-256 тела) и привязан к версии
+каталога — счётчику в таблице catalog_version. Админские пути записи бань, фото,
+акций, категорий и товаров вызывают touch_catalog(db) до commit: счётчик растёт
+в той же транзакции, поэтому все воркеры увидят новую версию вместе с данными.
+Свой процесс перечитывает версию сразу после commit, остальные — не позже чем
+через CATALOG_VERSION_CHECK_SECONDS.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+CATALOG_VERSION_CHECK_SECONDS = float(os.getenv("CATALOG_VERSION_CHECK_SECONDS", "2"))
+# Браузер и CDN перепроверяют каждый раз и получают 304, пока каталог не изменился
+CATALOG_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+
+_BUMP_SQL = text("UPDATE catalog_version SET version = version + 1 WHERE id = 1")
+_VERSION_SQL = text("SELECT version FROM catalog_version WHERE id = 1")
+
+
+class CatalogCache:
+    def __init__(self, check_seconds: float = CATALOG_VERSION_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._entries: Dict[Hashable, Any] = {}
+        # Один ключ строит один поток, остальные ждут его результат
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+
+    def _clear(self) -> None:
+        """Под self._lock: сбрасывает записи и свободные блокировки ключей."""
+        self._entries.clear()
+        self._key_locks = {key: lock for key, lock in self._key_locks.items() if lock.locked()}
+
+    def _current_version(self, db: Session) -> int:
+        with self._lock:
+            if self._version is not None and time.monotonic() - self._checked_at < self.check_seconds:
+                return self._version
+        version = db.execute(_VERSION_SQL).scalar() or 0
+        with self._lock:
+            if version != self._version:
+                self._clear()
+                self._version = version
+            self._checked_at = time.monotonic()
+        return version
+
+    def get_or_compute(self, db: Session, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Значение для key в текущей версии каталога; compute() вызывается только при промахе."""
+        version = self._current_version(db)
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                if key in self._entries:
+                    return self._entries[key]
+            value = compute()
+            with self._lock:
+                # Версия сменилась, пока строили ответ, — он мог устареть
+                if self._version == version:
+                    self._entries[key] = value
+            return value
+
+    def get_or_build(self, db: Session, key: Hashable, build: Callable[[], Any]) -> Tuple[bytes, str]:
+        """(JSON-тело, ETag) для key."""
+        def compute():
+            body = json.dumps(jsonable_encoder(build()), ensure_ascii=False, separators=(",", ":")).encode()
+            return body, body_etag(body)
+
+        return self.get_or_compute(db, key, compute)
+
+    def invalidate(self) -> None:
+        """Следующий запрос перечитает версию из БД."""
+        with self._lock:
+            self._version = None
+            self._clear()
+
+
+catalog_cache = CatalogCache()
+
+
+def _after_commit(session: Session) -> None:
+    catalog_cache.invalidate()
+
+
+def touch_catalog(db: Session) -> None:
+    """Отмечает изменение каталога в текущей транзакции. Вызывать до commit."""
+    db.execute(_BUMP_SQL)
+    if not event.contains(db, "after_commit", _after_commit):
+        event.listen(db, "after_commit", _after_commit)
+
+
+def body_etag(body: bytes) -> str:
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def conditional_response(request: Request, body: bytes, etag: str, media_type: str) -> Response:
+    """Ответ с ETag; при совпадении If-None-Match — 304 без тела."""
+    headers = {"ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def cached_catalog_response(
+    request: Request, db: Session, key: Hashable, build: Callable[[], Any]
+) -> Response:
+    body, etag = catalog_cache.get_or_build(db, key, build)
+    return conditional_response(request, body, etag, "application/json")
@@ -0,0 +1,96 @@
+"""
+Сводка daily_bath_stats: брони по (день начала, баня) — количество, выручка,
+забронированные минуты, гости. Из неё читает дашборд.
+
+Пути записи броней вызывают refresh_daily_stats() в той же транзакции перед commit:
+строки затронутых (баня, день) пересчитываются из reservations по диапазону
+start_datetime (использует ix_reservations_bath_start). Пересчёт, а не приращение,
+поэтому сводка не расходится с бронями. Параллельные пересчёты одной пары
+упорядочиваются advisory-блокировкой транзакции. День брони и границы дня
+вычисляет PostgreSQL в часовом поясе сессии — так же, как start_datetime::DATE
+в полной перестройке, независимо от часового пояса процесса.
+
+Полная перестройка: python -m app.daily_stats
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+_REFRESH_SQL = text(
+    """
+    INSERT INTO daily_bath_stats (day, bath_id, reservation_count, revenue, booked_minutes, guests)
+    SELECT
+        :day,
+        :bath_id,
+        COUNT(*),
+        COALESCE(SUM(total_cost), 0),
+        COALESCE(SUM(EXTRACT(EPOCH FROM (end_datetime - start_datetime)) / 60), 0)::INTEGER,
+        COALESCE(SUM(guests), 0)
+    FROM reservations
+    WHERE bath_id = :bath_id
+      AND start_datetime >= CAST(:day AS TIMESTAMPTZ)
+      AND start_datetime < CAST(CAST(:day AS DATE) + 1 AS TIMESTAMPTZ)
+    ON CONFLICT (day, bath_id) DO UPDATE SET
+        reservation_count = EXCLUDED.reservation_count,
+        revenue = EXCLUDED.revenue,
+        booked_minutes = EXCLUDED.booked_minutes,
+        guests = EXCLUDED.guests
+    """
+)
+
+_DAY_SQL = text("SELECT CAST(CAST(:start AS TIMESTAMPTZ) AS DATE)")
+
+_BACKFILL_SQL = """
+    INSERT INTO daily_bath_stats (day, bath_id, reservation_count, revenue, booked_minutes, guests)
+    SELECT
+        start_datetime::DATE,
+        bath_id,
+        COUNT(*),
+        COALESCE(SUM(total_cost), 0),
+        COALESCE(SUM(EXTRACT(EPOCH FROM (end_datetime - start_datetime)) / 60), 0)::INTEGER,
+        COALESCE(SUM(guests), 0)
+    FROM reservations
+    GROUP BY start_datetime::DATE, bath_id
+"""
+
+
+def refresh_daily_stats(db: Session, *items: Tuple[Optional[int], Optional[datetime]]) -> None:
+    """
+    Пересчитывает сводку для пар (bath_id, start_datetime) — старые и новые значения брони.
+    Вызывать после flush и до commit.
+    """
+    pairs = set()
+    for bath_id, start in items:
+        if bath_id is None or start is None:
+            continue
+        pairs.add((bath_id, db.execute(_DAY_SQL, {"start": start}).scalar()))
+    for bath_id, day in sorted(pairs):
+        db.execute(
+            text("SELECT pg_advisory_xact_lock(:bath_id, :day_key)"),
+            {"bath_id": bath_id, "day_key": day.toordinal()},
+        )
+        db.execute(_REFRESH_SQL, {"day": day, "bath_id": bath_id})
+
+
+def backfill_daily_stats(connection, only_if_empty: bool = False) -> None:
+    """Перестраивает сводку целиком; only_if_empty — только если она ещё пуста."""
+    if only_if_empty:
+        if connection.execute(text("SELECT EXISTS (SELECT 1 FROM daily_bath_stats)")).scalar():
+            return
+    else:
+        connection.execute(text("LOCK TABLE daily_bath_stats IN EXCLUSIVE MODE"))
+        connection.execute(text("DELETE FROM daily_bath_stats"))
+    connection.execute(text(_BACKFILL_SQL))
+
+
+if __name__ == "__main__":
+    from app.database import engine
+
+    with engine.begin() as connection:
+        backfill_daily_stats(connection)
+    print("daily_bath_stats rebuilt")
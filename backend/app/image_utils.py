@@ -1,5 +1,31 @@
 from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+import hashlib
+import asyncio
 import io
+import multiprocessing
+import os
+import tempfile
+import threading
+
+# Обработка изображений вынесена из event loop в отдельные процессы
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(min(2, os.cpu_count() or 1))))
+IMAGE_TIMEOUT_SECONDS = float(os.getenv("IMAGE_TIMEOUT_SECONDS", "30"))
+# Ограничение адресного пространства процесса обработки (0 — без ограничения)
+IMAGE_WORKER_MEMORY_MB = int(os.getenv("IMAGE_WORKER_MEMORY_MB", "1024"))
+# Сколько изображений одновременно отправлено в пул (остальные ждут в event loop)
+IMAGE_MAX_IN_FLIGHT = IMAGE_WORKERS
+
+
+# Ширины адаптивных вариантов (srcset); самый широкий — основной image_url
+VARIANT_WIDTHS = (320, 640, 1280, 1920)
+
+
+class ImageProcessingError(ValueError):
+    """Изображение не удалось обработать (ошибка, таймаут или падение процесса)."""
 
 
 def process_image_to_webp(image_bytes: bytes, max_width: int = 1920, quality: int = 85) -> bytes:
@@ -14,6 +40,11 @@ def process_image_to_webp(image_bytes: bytes, max_width: int = 1920, quality: in
     Returns:
         WebP image bytes with no metadata
     """
+    img = _open_rgb(image_bytes)
+    return _encode_webp(_fit_width(img, max_width), quality)
+
+
+def _open_rgb(image_bytes: bytes) -> Image.Image:
     # Open image from bytes
     img = Image.open(io.BytesIO(image_bytes))
     
@@ -27,13 +58,19 @@ def process_image_to_webp(image_bytes: bytes, max_width: int = 1920, quality: in
         img = background
     elif img.mode != 'RGB':
         img = img.convert('RGB')
-    
+    return img
+
+
+def _fit_width(img: Image.Image, max_width: int) -> Image.Image:
     # Resize if too large (maintain aspect ratio)
     if img.width > max_width:
         ratio = max_width / img.width
         new_height = int(img.height * ratio)
         img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
-    
+    return img
+
+
+def _encode_webp(img: Image.Image, quality: int) -> bytes:
     # Save as WebP with no metadata
     # By default, Pillow does NOT save EXIF/metadata when saving to WebP
     # unless explicitly provided, so all metadata is stripped
@@ -46,3 +83,196 @@ def process_image_to_webp(image_bytes: bytes, max_width: int = 1920, quality: in
     )
     
     return output.getvalue()
+
+
+def process_image_variants(
+    image_bytes: bytes, widths: Tuple[int, ...] = VARIANT_WIDTHS, quality: int = 85
+) -> List[Tuple[int, bytes]]:
+    """
+    WebP-варианты изображения по ширинам widths (не шире оригинала), от узкого к широкому.
+    Последний вариант — оригинал, ужатый до max(widths), как у process_image_to_webp.
+    """
+    img = _open_rgb(image_bytes)
+    largest = _fit_width(img, max(widths))
+    variants = []
+    for width in sorted(widths):
+        if width >= largest.width:
+            break
+        variants.append((width, _encode_webp(_fit_width(largest, width), quality)))
+    variants.append((largest.width, _encode_webp(largest, quality)))
+    return variants
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    """
+    Пишет во временный *.part рядом и переименовывает: файл с тем же именем
+    уже раздаётся как immutable, и читатель не должен увидеть его обрезанным.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        # mkstemp создаёт файл с правами 0600, а загрузки раздаются как статика
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def save_image_variants(
+    variants: List[Tuple[int, bytes]],
+    directory: Path,
+    url_prefix: str,
+    lock: Optional[Callable[[List[str]], None]] = None,
+) -> Tuple[str, List[Dict[str, object]]]:
+    """
+    Сохраняет варианты под именами по SHA-256 содержимого.
+    lock(urls) вызывается до записи (media_store.lock_paths — защита от чистки).
+    Возвращает (image_url самого широкого варианта, [{"width", "url"}, ...] для Photo.variants).
+    """
+    files = []
+    meta = []
+    for width, data in variants:
+        filename = f"{hashlib.sha256(data).hexdigest()[:16]}.webp"
+        files.append((filename, data))
+        meta.append({"width": width, "url": f"{url_prefix.rstrip('/')}/{filename}"})
+    if lock is not None:
+        lock([item["url"] for item in meta])
+    for filename, data in files:
+        _write_atomic(directory / filename, data)
+    return meta[-1]["url"], meta
+
+
+def _init_worker(memory_mb: int) -> None:
+    if memory_mb > 0:
+        try:
+            import resource
+
+            limit = memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError):
+            # Не Linux или лимит ниже текущего потребления — работаем без него
+            pass
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+# Задачи, выполняющиеся в каждом пуле, и пулы, выведенные из работы после зависания
+_pool_tasks: Dict[ProcessPoolExecutor, int] = {}
+_retired_pools: Set[ProcessPoolExecutor] = set()
+_in_flight: Optional[asyncio.Semaphore] = None
+
+
+def _kill_pool(pool: ProcessPoolExecutor) -> None:
+    for process in list((getattr(pool, "_processes", None) or {}).values()):
+        process.kill()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _acquire_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: дочерний процесс не наследует потоки и соединения с БД воркера
+            _pool = ProcessPoolExecutor(
+                max_workers=IMAGE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(IMAGE_WORKER_MEMORY_MB,),
+            )
+        _pool_tasks[_pool] = _pool_tasks.get(_pool, 0) + 1
+        return _pool
+
+
+def _release_pool(pool: ProcessPoolExecutor) -> None:
+    with _pool_lock:
+        remaining = _pool_tasks.get(pool, 1) - 1
+        if remaining > 0:
+            _pool_tasks[pool] = remaining
+            return
+        _pool_tasks.pop(pool, None)
+        if pool not in _retired_pools:
+            return
+        _retired_pools.discard(pool)
+    _kill_pool(pool)
+
+
+def _retire_pool(pool: ProcessPoolExecutor) -> None:
+    """
+    Выводит пул с зависшей задачей из работы: новые задачи идут в новый пул,
+    а старый (вместе с зависшим процессом) убивается, когда в нём доработают остальные задачи.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+        _retired_pools.add(pool)
+
+
+def shutdown_image_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pools = [p for p in (_pool, *_retired_pools) if p is not None]
+        _pool = None
+        _retired_pools.clear()
+        _pool_tasks.clear()
+    for pool in pools:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def _run_in_pool(fn, *args):
+    """fn в пуле процессов с таймаутом IMAGE_TIMEOUT_SECONDS."""
+    global _in_flight
+    if _in_flight is None:
+        _in_flight = asyncio.Semaphore(IMAGE_MAX_IN_FLIGHT)
+    # Задач в пуле не больше, чем процессов: отправленная задача сразу начинает выполняться,
+    # и таймаут не включает ожидание в очереди пула
+    async with _in_flight:
+        pool = _acquire_pool()
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(pool, fn, *args),
+                timeout=IMAGE_TIMEOUT_SECONDS,
+            )
+        except asyncio.TimeoutError:
+            # Выполняющуюся задачу нельзя отменить — пул заменяется, чужие задачи в нём дорабатывают
+            _retire_pool(pool)
+            raise ImageProcessingError("Превышено время обработки изображения")
+        except BrokenProcessPool:
+            # Процесс упал — пул сломан для всех его задач
+            _retire_pool(pool)
+            raise ImageProcessingError("Процесс обработки изображения завершился аварийно")
+        except MemoryError:
+            raise ImageProcessingError("Изображение слишком большое")
+        finally:
+            _release_pool(pool)
+
+
+async def process_image_to_webp_async(image_bytes: bytes, max_width: int = 1920, quality: int = 85) -> bytes:
+    """process_image_to_webp в пуле процессов."""
+    return await _run_in_pool(process_image_to_webp, image_bytes, max_width, quality)
+
+
+async def process_images_to_webp(
+    images: List[bytes], max_width: int = 1920, quality: int = 85
+) -> List[Union[bytes, Exception]]:
+    """Параллельная обработка файлов одной загрузки; ошибки возвращаются на месте результата."""
+    return await asyncio.gather(
+        *(process_image_to_webp_async(content, max_width, quality) for content in images),
+        return_exceptions=True,
+    )
+
+
+async def process_images_to_variants(
+    images: List[bytes], widths: Tuple[int, ...] = VARIANT_WIDTHS, quality: int = 85
+) -> List[Union[List[Tuple[int, bytes]], Exception]]:
+    """process_image_variants для файлов одной загрузки параллельно; ошибки — на месте результата."""
+    return await asyncio.gather(
+        *(_run_in_pool(process_image_variants, content, widths, quality) for content in images),
+        return_exceptions=True,
+    )
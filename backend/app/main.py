@@ -1,45 +1,71 @@
 from fastapi import FastAPI, WebSocket
-from fastapi.staticfiles import StaticFiles  
-from app.database import Base, engine
+from app.media_static import MediaStaticFiles
+from app.database import Base, SessionLocal, engine
 from app import models  # noqa: F401 - важно для регистрации моделей в metadata
 from app.routers import api_router
 from app.routers import promotions
 from app.routers import audit_logs
 from app.routers.seo import router as seo_router
+from app.routers.img_resize import router as img_resize_router
 from app.websocket import websocket_endpoint
+from app.availability_cache import backend as availability_cache_backend
+from app.session_touch import session_touches
+from app.permission_bits import permission_catalog
+from app.pagination import CURSOR_HEADER
+from app.daily_stats import backfill_daily_stats
+from app.media_store import media_gc, sync_blobs as sync_media_blobs
+from app.image_utils import shutdown_image_pool
+from app.audit_logger import audit_sink
+from app.audit_partitions import audit_partitions, ensure_partitions as ensure_audit_partitions
 from fastapi.middleware.cors import CORSMiddleware
 import os
 from pathlib import Path
 from sqlalchemy import text
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
 
 
-# Middleware to increase request body size limit (50 MB)
-class MaxBodySizeMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        request._receive = self._receive_with_limit(request, call_next)
-        response = await call_next(request)
-        return response
-    
-    def _receive_with_limit(self, request, call_next):
-        original_receive = request.receive
-        max_body_size = 50 * 1024 * 1024  # 50 MB
-        
+# Предельный размер тела запроса (50 MB)
+MAX_BODY_SIZE = int(os.getenv("MAX_BODY_SIZE_MB", "50")) * 1024 * 1024
+
+
+class MaxBodySizeMiddleware:
+    """
+    ASGI-ограничение суммарного размера тела запроса: сразу по Content-Length
+    и по фактически прочитанным байтам (для chunked-запросов без заголовка).
+    """
+
+    def __init__(self, app, max_body_size: int = MAX_BODY_SIZE):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    def _too_large_detail(self) -> str:
+        return f"Request body too large. Maximum size is {self.max_body_size // (1024*1024)} MB"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_size:
+            response = JSONResponse(status_code=413, content={"detail": self._too_large_detail()})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
         async def receive_with_limit():
-            message = await original_receive()
+            nonlocal received
+            message = await receive()
             if message["type"] == "http.request":
-                body = message.get("body", b"")
-                if len(body) > max_body_size:
-                    from fastapi import HTTPException
-                    raise HTTPException(
-                        status_code=413,
-                        detail=f"Request body too large. Maximum size is {max_body_size // (1024*1024)} MB"
-                    )
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    # Поднимается внутри обработчика при чтении тела и превращается в ответ 413
+                    raise HTTPException(status_code=413, detail=self._too_large_detail())
             return message
-        
-        return receive_with_limit
+
+        await self.app(scope, receive_with_limit, send)
 
 
 Base.metadata.create_all(bind=engine)
@@ -75,6 +101,32 @@ with engine.begin() as connection:
         )
     )
 
+    connection.execute(
+        text(
+            """
+            ALTER TABLE photos
+            ADD COLUMN IF NOT EXISTS variants JSON
+            """
+        )
+    )
+    connection.execute(
+        text(
+            """
+            ALTER TABLE photos
+            ADD COLUMN IF NOT EXISTS blob_id INTEGER REFERENCES media_blobs(id) ON DELETE SET NULL
+            """
+        )
+    )
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_photos_blob_id ON photos (blob_id)"))
+    connection.execute(
+        text("INSERT INTO catalog_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING")
+    )
+    # lastmod в sitemap
+    for table in ("baths", "categories", "products"):
+        connection.execute(
+            text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()")
+        )
+
     connection.execute(
         text(
             """
@@ -434,10 +486,110 @@ with engine.begin() as connection:
             """
         )
     )
+    connection.execute(
+        text(
+            """
+            CREATE INDEX IF NOT EXISTS ix_reservations_bath_start
+            ON reservations (bath_id, start_datetime)
+            """
+        )
+    )
+    # Пересечения броней: period = [start, end + уборка) + EXCLUDE USING gist
+    connection.execute(
+        text(
+            """
+            ALTER TABLE reservations
+            ADD COLUMN IF NOT EXISTS cleaning_minutes INTEGER NOT NULL DEFAULT 30
+            """
+        )
+    )
+    connection.execute(
+        text(
+            """
+            CREATE OR REPLACE FUNCTION reservation_period(s TIMESTAMPTZ, e TIMESTAMPTZ, cleaning INTEGER)
+            RETURNS TSTZRANGE
+            LANGUAGE sql IMMUTABLE PARALLEL SAFE
+            AS $fn$ SELECT tstzrange(s, e + make_interval(mins => cleaning), '[)') $fn$
+            """
+        )
+    )
+    connection.execute(
+        text(
+            """
+            ALTER TABLE reservations
+            ADD COLUMN IF NOT EXISTS period TSTZRANGE
+            GENERATED ALWAYS AS (reservation_period(start_datetime, end_datetime, cleaning_minutes)) STORED
+            """
+        )
+    )
+    # Если расширение недоступно или в старых данных есть пересечения — ограничение
+    # не создаётся, а admin_reservations проверяет пересечения запросом по тому же
+    # правилу. Конфликтующие брони нужно исправить вручную, после чего ограничение
+    # создастся при следующем старте.
+    overlap_constraint = connection.execute(
+        text("SELECT 1 FROM pg_constraint WHERE conname = 'reservations_no_overlap'")
+    ).first() is not None
+    if not overlap_constraint:
+        overlap_conflicts = connection.execute(
+            text(
+                """
+                SELECT a.bath_id, a.reservation_id, b.reservation_id
+                FROM reservations a
+                JOIN reservations b
+                  ON b.bath_id = a.bath_id
+                 AND b.reservation_id > a.reservation_id
+                 AND b.period && a.period
+                ORDER BY a.bath_id, a.reservation_id, b.reservation_id
+                LIMIT 50
+                """
+            )
+        ).all()
+        if overlap_conflicts:
+            pairs = ", ".join(f"баня {bath_id}: {a_id} и {b_id}" for bath_id, a_id, b_id in overlap_conflicts)
+            print(f"WARNING: reservations_no_overlap не создано, пересекающиеся брони (до 50 пар): {pairs}")
+        else:
+            try:
+                with connection.begin_nested():
+                    connection.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+                    connection.execute(
+                        text(
+                            """
+                            ALTER TABLE reservations
+                              ADD CONSTRAINT reservations_no_overlap
+                              EXCLUDE USING gist (bath_id WITH =, period WITH &&)
+                            """
+                        )
+                    )
+                overlap_constraint = True
+            except Exception as e:
+                print(f"WARNING: reservations_no_overlap не создано: {e}")
+    if not overlap_constraint:
+        print(
+            "WARNING: ограничения reservations_no_overlap нет — пересечения броней "
+            "проверяются запросом с блокировкой (admin_reservations.check_overlap)"
+        )
+    # Журнал аудита: индексы под фильтры /api/audit/logs (на секционированной
+    # таблице создаются во всех секциях) и секции на ближайшие месяцы
+    for index_sql in (
+        "CREATE INDEX IF NOT EXISTS ix_audit_logs_created ON audit_logs (created_at DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_audit_logs_user_created ON audit_logs (user_id, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_audit_logs_entity_created ON audit_logs (entity_type, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_audit_logs_action_created ON audit_logs (action, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_audit_logs_entity_action_created ON audit_logs (entity_type, action, created_at DESC)",
+    ):
+        connection.execute(text(index_sql))
+    ensure_audit_partitions(connection)
+    # Лента финансовых операций (finance._ledger): фильтр по дате и сортировка (date, id)
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_entrance_documents_date_id ON entrance_documents (date, id)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_realization_documents_date_id ON realization_documents (date, id)"))
+    # Сводка для дашборда: при первом запуске строится из существующих броней
+    backfill_daily_stats(connection, only_if_empty=True)
+    # Учёт файлов фото: при первом запуске заполняется по существующим фото
+    sync_media_blobs(connection, only_if_empty=True)
 
 app = FastAPI(title='Бани')
 
-# Add middleware to increase body size limit
+# Ограничение размера тела запроса
 app.add_middleware(MaxBodySizeMiddleware)
 
 # CORS configuration - restrict to specific origins for security
@@ -452,6 +604,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[CURSOR_HEADER],
 )
 
 # Mount static files directories
@@ -460,15 +613,44 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 public_img_dir = BASE_DIR / "public" / "img"
 if public_img_dir.exists():
-    app.mount("/img", StaticFiles(directory=str(public_img_dir)), name="static_images")
+    app.mount("/img", MediaStaticFiles(directory=str(public_img_dir)), name="static_images")
 
 # Mount uploads directory for bath photos
 uploads_dir = BASE_DIR / "uploads"
 uploads_dir.mkdir(parents=True, exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=str(uploads_dir)), name="uploads")
+app.mount("/uploads", MediaStaticFiles(directory=str(uploads_dir)), name="uploads")
+
+@app.on_event("startup")
+def start_background_workers():
+    availability_cache_backend.start()
+    session_touches.start()
+    audit_sink.start()
+    audit_partitions.start()
+    media_gc.start()
+    db = SessionLocal()
+    try:
+        permission_catalog.load(db)
+    except Exception as e:
+        # Каталог дочитается при первой авторизации
+        print(f"Permission catalog load error: {e}")
+    finally:
+        db.close()
+
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    availability_cache_backend.stop()
+    session_touches.stop()
+    audit_partitions.stop()
+    media_gc.stop()
+    shutdown_image_pool()
+    # Дописать очередь аудита перед выходом
+    audit_sink.stop()
+
 
 app.include_router(api_router)
 app.include_router(seo_router)
+app.include_router(img_resize_router)
 app.include_router(promotions.router, prefix="/api", tags=["promotions"])
 app.include_router(audit_logs.router)
 
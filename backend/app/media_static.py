@@ -0,0 +1,143 @@
+"""
+Раздача статики /uploads и /img.
+
+Файлы с именем по хэшу содержимого ({hex}.ext — так сохраняют image_utils и upload_utils)
+не меняются: для них Cache-Control immutable на год и сильный ETag из хэша, повторный
+визит не перепроверяет галерею вовсе, а явная перепроверка получает 304.
+Для сжимаемых форматов (SVG, CSS, JS…) при Accept-Encoding br/gzip отдаётся заранее
+сжатая копия рядом с файлом (file.svg.br, file.svg.gz), если она есть.
+Создать копии: python -m app.media_static <каталог>
+
+Range-запросы (видео бань) и zero-copy через расширение ASGI http.response.pathsend
+обеспечивает FileResponse Starlette.
+"""
+
+from __future__ import annotations
+
+import gzip
+import os
+import re
+import stat
+import sys
+from mimetypes import guess_type
+from pathlib import Path
+from typing import Set
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+try:
+    import brotli
+except ImportError:  # br-копии не создаются, уже созданные отдаются
+    brotli = None
+
+HASHED_NAME = re.compile(r"^[0-9a-f]{16,64}$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+COMPRESSIBLE_EXTENSIONS = {".svg", ".css", ".js", ".mjs", ".json", ".map", ".txt", ".xml", ".html", ".ico"}
+# Порядок предпочтения: brotli сжимает лучше gzip
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _accepted_encodings(headers: Headers) -> Set[str]:
+    accepted = set()
+    for part in headers.get("accept-encoding", "").split(","):
+        token, _, params = part.partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.add(token)
+    return accepted
+
+
+class MediaStaticFiles(StaticFiles):
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        path = Path(full_path)
+        hashed = HASHED_NAME.match(path.stem) is not None
+        headers = {}
+        if hashed:
+            headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+
+        serve_path = full_path
+        encoding = None
+        if path.suffix.lower() in COMPRESSIBLE_EXTENSIONS:
+            headers["vary"] = "Accept-Encoding"
+            accepted = _accepted_encodings(request_headers)
+            for name, suffix in PRECOMPRESSED:
+                if name not in accepted:
+                    continue
+                try:
+                    sibling_stat = os.stat(f"{full_path}{suffix}")
+                except OSError:
+                    continue
+                # Копия старше оригинала устарела
+                if stat.S_ISREG(sibling_stat.st_mode) and sibling_stat.st_mtime >= stat_result.st_mtime:
+                    serve_path, stat_result, encoding = f"{full_path}{suffix}", sibling_stat, name
+                    headers["content-encoding"] = name
+                    break
+
+        if hashed:
+            # Сильный ETag из хэша содержимого; у сжатой копии — своё представление
+            headers["etag"] = f'"{path.stem}-{encoding}"' if encoding else f'"{path.stem}"'
+
+        response = FileResponse(
+            serve_path,
+            status_code=status_code,
+            headers=headers,
+            media_type=guess_type(path.name)[0] or "text/plain",
+            stat_result=stat_result,
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def precompress(directory: Path) -> int:
+    """Создаёт .gz (и .br при установленном brotli) рядом со сжимаемыми файлами; возвращает число созданных копий."""
+    created = 0
+    for path in directory.rglob("*"):
+        if not path.is_file() or path.suffix.lower() not in COMPRESSIBLE_EXTENSIONS:
+            continue
+        data = None
+        source_mtime = path.stat().st_mtime
+        for name, suffix in PRECOMPRESSED:
+            if name == "br" and brotli is None:
+                continue
+            sibling = path.with_name(path.name + suffix)
+            if sibling.exists() and sibling.stat().st_mtime >= source_mtime:
+                continue
+            if data is None:
+                data = path.read_bytes()
+            compressed = brotli.compress(data, quality=11) if name == "br" else gzip.compress(data, 9, mtime=0)
+            # Сжатие без выигрыша не сохраняем
+            if len(compressed) >= len(data):
+                continue
+            sibling.write_bytes(compressed)
+            created += 1
+    return created
+
+
+if __name__ == "__main__":
+    targets = [Path(arg) for arg in sys.argv[1:]] or [
+        Path(__file__).resolve().parent.parent / "public" / "img",
+        Path(__file__).resolve().parent.parent / "uploads",
+    ]
+    for target in targets:
+        if target.is_dir():
+            print(f"{target}: {precompress(target)} precompressed files")
@@ -0,0 +1,395 @@
+"""
+Учёт загруженных файлов фото и видео: таблица media_blobs (путь, SHA-256, размер, mime, refcount).
+
+Файлы в uploads/ названы по хэшу содержимого, поэтому одна и та же картинка,
+загруженная дважды, — один файл. refcount — сколько фото на него ссылаются
+(основной image_url и адаптивные варианты). Пути записи фото вызывают
+attach_photos()/detach_photos() в своей транзакции; файлы с refcount = 0
+удаляет фоновая чистка, когда со времени освобождения прошло MEDIA_GC_GRACE_HOURS.
+Загрузка и чистка одного пути упорядочены advisory-блокировкой транзакции по хэшу
+пути: загрузка берёт её (lock_paths) до записи файла и держит до commit, чистка
+удаляет файл только под ней; файл, перезаписанный после освобождения, не удаляется.
+Файлы uploads/photos с именем по хэшу, на которые нет ни записи, ни фото (загрузки
+с откатом транзакции, файлы до появления учёта), удаляются той же чисткой после
+той же паузы. Прочие файлы без записи в media_blobs чистка не трогает.
+
+Первичное заполнение из существующих фото — при старте, если таблица пуста.
+Полная сверка счётчиков и чистка файлов без учёта: python -m app.media_store
+"""
+
+from __future__ import annotations
+
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, text
+
+from app.database import SessionLocal
+from app.media_static import HASHED_NAME
+from app.models import Photo
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+MEDIA_URL_PREFIX = "/uploads/"
+MEDIA_GC_GRACE_HOURS = float(os.getenv("MEDIA_GC_GRACE_HOURS", "24"))
+MEDIA_GC_INTERVAL_SECONDS = float(os.getenv("MEDIA_GC_INTERVAL_SECONDS", "3600"))
+MEDIA_GC_BATCH_SIZE = 500
+# Сколько stop() ждёт завершения идущей чистки
+MEDIA_GC_STOP_TIMEOUT_SECONDS = 30
+PHOTOS_DIR = BASE_DIR / "uploads" / "photos"
+# Первый ключ pg_advisory_xact_lock(int, int) для путей media_blobs, второй — hashtext(path)
+MEDIA_LOCK_NAMESPACE = 7314002
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+_INSERT_BLOB_SQL = text(
+    """
+    INSERT INTO media_blobs (path, hash, size, mime, refcount, created_at, released_at)
+    VALUES (:path, :hash, :size, :mime, 0, now(), now())
+    ON CONFLICT (path) DO NOTHING
+    """
+)
+
+_LOCK_PATH_SQL = text("SELECT pg_advisory_xact_lock(:ns, hashtext(:path))").bindparams(ns=MEDIA_LOCK_NAMESPACE)
+_TRY_LOCK_PATH_SQL = text("SELECT pg_try_advisory_xact_lock(:ns, hashtext(:path))").bindparams(
+    ns=MEDIA_LOCK_NAMESPACE
+)
+
+_ACQUIRE_SQL = text(
+    """
+    UPDATE media_blobs SET refcount = refcount + :n, released_at = NULL
+    WHERE path = :path
+    """
+)
+
+_RELEASE_SQL = text(
+    """
+    UPDATE media_blobs
+    SET refcount = GREATEST(refcount - :n, 0),
+        released_at = CASE WHEN refcount - :n <= 0 THEN now() ELSE released_at END
+    WHERE path = :path
+    """
+)
+
+# Ссылки фото на файлы: image_url и url вариантов, без повторов внутри одного фото
+_PHOTO_REFS_SQL = """
+    SELECT DISTINCT p.photo_id, refs.path
+    FROM photos p
+    CROSS JOIN LATERAL (
+        SELECT p.image_url AS path
+        UNION ALL
+        SELECT v ->> 'url' FROM json_array_elements(COALESCE(p.variants, '[]'::json)) AS v
+    ) AS refs
+    WHERE refs.path LIKE '/uploads/%'
+"""
+
+_RECOUNT_SQL = text(
+    f"""
+    WITH counts AS (
+        SELECT path, COUNT(*) AS n FROM ({_PHOTO_REFS_SQL}) AS r GROUP BY path
+    )
+    UPDATE media_blobs b
+    SET refcount = COALESCE(c.n, 0),
+        released_at = CASE
+            WHEN COALESCE(c.n, 0) = 0 THEN COALESCE(b.released_at, now())
+            ELSE NULL
+        END
+    FROM media_blobs b2
+    LEFT JOIN counts c ON c.path = b2.path
+    WHERE b.id = b2.id
+    """
+)
+
+_LINK_PHOTOS_SQL = text(
+    """
+    UPDATE photos p SET blob_id = b.id
+    FROM media_blobs b
+    WHERE b.path = p.image_url AND p.blob_id IS DISTINCT FROM b.id
+    """
+)
+
+
+def file_urls(photo) -> List[str]:
+    """Локальные файлы фото: основной и варианты (основной обычно совпадает с самым широким)."""
+    urls = [photo.image_url] + [v["url"] for v in photo.variants or []]
+    return [url for url in dict.fromkeys(urls) if url and url.startswith(MEDIA_URL_PREFIX)]
+
+
+def path_for(url: str) -> Path:
+    return BASE_DIR / url.lstrip("/")
+
+
+def _describe(url: str) -> Optional[dict]:
+    path = path_for(url)
+    if not path.is_file():
+        return None
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(_HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+    return {
+        "path": url,
+        "hash": digest.hexdigest(),
+        "size": size,
+        "mime": mimetypes.guess_type(url)[0] or "application/octet-stream",
+    }
+
+
+def lock_paths(db, urls: Iterable[str]) -> None:
+    """Блокирует пути от чистки до конца транзакции. Вызывать до записи файлов."""
+    # В одном порядке во всех транзакциях — без взаимных блокировок
+    for url in sorted(set(urls)):
+        db.execute(_LOCK_PATH_SQL, {"path": url})
+
+
+def ensure_blobs(db, urls: Iterable[str], lock: bool = True) -> Dict[str, int]:
+    """
+    Заводит записи для файлов, которых ещё нет в media_blobs. Возвращает {path: id}.
+    lock — держать до конца транзакции блокировку путей от чистки.
+    """
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return {}
+    if lock:
+        lock_paths(db, urls)
+    select_ids = text("SELECT path, id FROM media_blobs WHERE path IN :paths").bindparams(
+        bindparam("paths", expanding=True)
+    )
+    known = dict(db.execute(select_ids, {"paths": urls}).all())
+    missing = [row for row in (_describe(url) for url in urls if url not in known) if row is not None]
+    if missing:
+        db.execute(_INSERT_BLOB_SQL, missing)
+        known = dict(db.execute(select_ids, {"paths": urls}).all())
+    return known
+
+
+def attach_photos(db, photos) -> None:
+    """Увеличивает refcount файлов новых фото и проставляет Photo.blob_id. Вызывать до commit."""
+    photos = list(photos)
+    refs = Counter(url for photo in photos for url in file_urls(photo))
+    if not refs:
+        return
+    blob_ids = ensure_blobs(db, refs)
+    params = [{"path": path, "n": n} for path, n in refs.items() if path in blob_ids]
+    if params:
+        db.execute(_ACQUIRE_SQL, params)
+    for photo in photos:
+        photo.blob_id = blob_ids.get(photo.image_url)
+
+
+def detach_photos(db, photos) -> None:
+    """Уменьшает refcount файлов удаляемых фото; сами файлы удалит чистка после паузы."""
+    refs = Counter(url for photo in photos for url in file_urls(photo))
+    if refs:
+        db.execute(_RELEASE_SQL, [{"path": path, "n": n} for path, n in refs.items()])
+
+
+def replace_photos(db, query, urls: Iterable[str], **owner) -> List[Photo]:
+    """
+    Заменяет фото из query (фото одного владельца) фото со списком urls.
+    У фото с прежним image_url сохраняются варианты.
+    """
+    old_photos = query.all()
+    variants_by_url = {photo.image_url: photo.variants for photo in old_photos}
+    detach_photos(db, old_photos)
+    query.delete()
+    photos = [Photo(image_url=url, variants=variants_by_url.get(url), **owner) for url in urls]
+    db.add_all(photos)
+    attach_photos(db, photos)
+    return photos
+
+
+def sync_blobs(connection, only_if_empty: bool = False) -> None:
+    """Заводит записи для всех файлов фото и пересчитывает refcount по таблице photos."""
+    if only_if_empty:
+        if connection.execute(text("SELECT EXISTS (SELECT 1 FROM media_blobs)")).scalar():
+            return
+    else:
+        connection.execute(text("LOCK TABLE media_blobs IN EXCLUSIVE MODE"))
+    paths = connection.execute(text(f"SELECT DISTINCT path FROM ({_PHOTO_REFS_SQL}) AS r")).scalars().all()
+    # Файлы, на которые ссылаются фото, чистка и так не трогает; блокировка
+    # каждого пути исчерпала бы таблицу блокировок
+    ensure_blobs(connection, paths, lock=False)
+    connection.execute(_RECOUNT_SQL)
+    connection.execute(_LINK_PHOTOS_SQL)
+
+
+def _modified_since(url: str, moment: datetime) -> bool:
+    try:
+        mtime = path_for(url).stat().st_mtime
+    except OSError:
+        return False
+    return datetime.fromtimestamp(mtime, timezone.utc) >= moment
+
+
+def _unlink(url: str) -> None:
+    try:
+        path_for(url).unlink(missing_ok=True)
+    except OSError as e:
+        print(f"Media GC: could not delete {url}: {e}")
+
+
+def collect_garbage(grace_hours: float = MEDIA_GC_GRACE_HOURS) -> int:
+    """Удаляет файлы и записи с refcount = 0, освобождённые раньше grace_hours назад."""
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=grace_hours)
+    removed = 0
+    while True:
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                text(
+                    """
+                    SELECT id, path, released_at FROM media_blobs
+                    WHERE refcount = 0 AND released_at < :cutoff
+                    ORDER BY released_at
+                    LIMIT :limit
+                    FOR UPDATE SKIP LOCKED
+                    """
+                ),
+                {"cutoff": cutoff, "limit": MEDIA_GC_BATCH_SIZE},
+            ).all()
+            delete_ids, revived_ids, paths = [], [], []
+            for blob_id, url, released_at in rows:
+                # Транзакция загрузки того же файла ещё не завершена
+                if not db.execute(_TRY_LOCK_PATH_SQL, {"path": url}).scalar():
+                    continue
+                # Файл записан заново после освобождения — загрузка ещё до ensure_blobs
+                if _modified_since(url, released_at):
+                    revived_ids.append(blob_id)
+                    continue
+                delete_ids.append(blob_id)
+                paths.append(url)
+            if delete_ids:
+                db.execute(
+                    text("DELETE FROM media_blobs WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+                    {"ids": delete_ids},
+                )
+            if revived_ids:
+                db.execute(
+                    text("UPDATE media_blobs SET released_at = now() WHERE id IN :ids").bindparams(
+                        bindparam("ids", expanding=True)
+                    ),
+                    {"ids": revived_ids},
+                )
+            # Файлы удаляются под блокировкой путей, до commit: загрузка того же
+            # файла дождётся commit и заведёт запись заново
+            for url in paths:
+                _unlink(url)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        removed += len(paths)
+        if len(rows) < MEDIA_GC_BATCH_SIZE or not (delete_ids or revived_ids):
+            return removed
+
+
+def _orphan_candidates(cutoff: float) -> List[str]:
+    urls = []
+    for path in PHOTOS_DIR.rglob("*"):
+        if not HASHED_NAME.match(path.stem):
+            continue
+        try:
+            if not path.is_file() or path.stat().st_mtime >= cutoff:
+                continue
+        except OSError:
+            continue
+        urls.append("/" + path.relative_to(BASE_DIR).as_posix())
+    return urls
+
+
+def sweep_orphans(grace_hours: float = MEDIA_GC_GRACE_HOURS) -> int:
+    """
+    Удаляет файлы uploads/photos с именем по хэшу, старше grace_hours,
+    без записи в media_blobs и без ссылок из фото.
+    """
+    cutoff = time.time() - grace_hours * 3600
+    candidates = _orphan_candidates(cutoff)
+    removed = 0
+    for i in range(0, len(candidates), MEDIA_GC_BATCH_SIZE):
+        batch = candidates[i:i + MEDIA_GC_BATCH_SIZE]
+        db = SessionLocal()
+        try:
+            params = {"paths": batch}
+            known = set(db.execute(
+                text("SELECT path FROM media_blobs WHERE path IN :paths").bindparams(
+                    bindparam("paths", expanding=True)
+                ),
+                params,
+            ).scalars())
+            known.update(db.execute(
+                text(f"SELECT DISTINCT path FROM ({_PHOTO_REFS_SQL}) AS r WHERE path IN :paths").bindparams(
+                    bindparam("paths", expanding=True)
+                ),
+                params,
+            ).scalars())
+            for url in batch:
+                if url in known or not db.execute(_TRY_LOCK_PATH_SQL, {"path": url}).scalar():
+                    continue
+                # Пока проверяли, файл могли загрузить заново
+                if _modified_since(url, datetime.fromtimestamp(cutoff, timezone.utc)):
+                    continue
+                _unlink(url)
+                removed += 1
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    return removed
+
+
+class MediaGarbageCollector:
+    def __init__(self, interval: float = MEDIA_GC_INTERVAL_SECONDS):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        while True:
+            try:
+                collect_garbage()
+                sweep_orphans()
+            except Exception as e:
+                print(f"Media GC error: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="media-gc", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=MEDIA_GC_STOP_TIMEOUT_SECONDS)
+            self._thread = None
+
+
+media_gc = MediaGarbageCollector()
+
+
+if __name__ == "__main__":
+    from app.database import engine
+
+    with engine.begin() as connection:
+        sync_blobs(connection)
+    print("media_blobs synced")
+    print(f"{sweep_orphans()} orphaned files removed")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Float, Integer, String, Text, ForeignKey, DateTime, Boolean, Date, CheckConstraint, func, Table
+from sqlalchemy import BigInteger, Column, Float, Integer, String, Text, ForeignKey, DateTime, Boolean, Date, CheckConstraint, func, Table
 from sqlalchemy.orm import relationship
 from app.database import Base
 from datetime import date
@@ -19,6 +19,7 @@ class Bath(Base):
     description = Column(Text, nullable=True)
     base_guests = Column(Integer, nullable=False)
     extra_guest_price = Column(Integer, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     photos = relationship("Photo", back_populates="bath", cascade="all, delete-orphan")
     bookings = relationship("Booking", back_populates="bath", cascade="all, delete-orphan")
@@ -26,11 +27,38 @@ class Bath(Base):
     promotions = relationship("Promotion", secondary="bath_promotions", back_populates="baths")
 
 
+class CatalogVersion(Base):
+    """Версия публичного каталога (одна строка); см. catalog_cache."""
+    __tablename__ = "catalog_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0, server_default="0")
+
+
+class MediaBlob(Base):
+    __tablename__ = "media_blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    path = Column(String(500), nullable=False, unique=True)
+    hash = Column(String(64), nullable=False, index=True)
+    size = Column(BigInteger, nullable=False)
+    mime = Column(String(100), nullable=False)
+    refcount = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Когда refcount стал 0; после паузы файл удаляет чистка
+    released_at = Column(DateTime(timezone=True), nullable=True, index=True)
+
+
 class Photo(Base):
     __tablename__ = "photos"
 
     photo_id = Column(Integer, primary_key=True, index=True)
     image_url = Column(String(500), nullable=False)
+    # Адаптивные варианты: [{"width": 320, "url": "..."}, ...] от узкого к широкому
+    variants = Column(JSON, nullable=True)
+
+    # Файл основного изображения (media_store); варианты учитываются по url
+    blob_id = Column(Integer, ForeignKey("media_blobs.id", ondelete="SET NULL"), nullable=True, index=True)
 
     bath_id = Column(Integer, ForeignKey("baths.bath_id", ondelete="CASCADE"), nullable=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=True)
@@ -40,6 +68,12 @@ class Photo(Base):
     product = relationship("Product", back_populates="photos")
     category = relationship("Category", back_populates="photos")
 
+    @property
+    def srcset(self):
+        if not self.variants:
+            return None
+        return ", ".join(f"{v['url']} {v['width']}w" for v in self.variants)
+
 
 
 # Бронирование с сайта
@@ -89,6 +123,8 @@ class Reservation(Base):
     notes = Column(Text)
     total_cost = Column(Integer, nullable=False, default=0)
     hourly_rate = Column(Integer, nullable=True)
+    # Время уборки после брони (мин.), действовавшее при записи; входит в period
+    cleaning_minutes = Column(Integer, nullable=False, default=30)
     guests = Column(Integer, nullable=False)
     status_id = Column(Integer, ForeignKey('reservation_status.id'), nullable=False, default=1)
     income_account_id = Column(Integer, ForeignKey("organization_accounts.id"), nullable=True)
@@ -104,6 +140,18 @@ class Reservation(Base):
     reservation_products = relationship("ReservationProduct", back_populates="reservation", cascade="all, delete-orphan")
 
 
+class DailyBathStat(Base):
+    """Сводка броней по дню начала и бане для дашборда (поддерживает app.daily_stats)."""
+    __tablename__ = "daily_bath_stats"
+
+    day = Column(Date, primary_key=True)
+    bath_id = Column(Integer, ForeignKey("baths.bath_id", ondelete="CASCADE"), primary_key=True)
+    reservation_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Integer, nullable=False, default=0)
+    booked_minutes = Column(Integer, nullable=False, default=0)
+    guests = Column(Integer, nullable=False, default=0)
+
+
 # === Компания: Партнёры ===
 class Partner(Base):
     __tablename__ = "partners"
@@ -140,6 +188,7 @@ class Category(Base):
     description = Column(Text, nullable=True)
     is_visible_on_website = Column(Boolean, nullable=False, default=False)
     parent_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     children = relationship("Category", back_populates="parent", cascade="all, delete-orphan")
     parent = relationship("Category", remote_side=[id], back_populates="children")
@@ -162,6 +211,7 @@ class Product(Base):
     is_price_manual = Column(Boolean, nullable=False, default=False)
     min_stock = Column(Float, default=0.0)
     unit_id = Column(Integer, ForeignKey("units_of_measurement.id"), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     category = relationship("Category", back_populates="products")
     photos = relationship("Photo", back_populates="product")
@@ -470,8 +520,11 @@ class PromotionIncompatibility(Base):
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    # Помесячные секции по created_at создаёт и архивирует app.audit_partitions.
+    # В ключ секционированной таблицы обязан входить created_at.
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     user_id = Column(Integer, ForeignKey("users.user_id", ondelete="SET NULL"), nullable=True)
     action = Column(String(50), nullable=False)  # CREATE, UPDATE, DELETE, LOGIN, LOGOUT
     entity_type = Column(String(50), nullable=False)  # reservation, user, product, etc.
@@ -479,7 +532,7 @@ class AuditLog(Base):
     details = Column(JSON, nullable=True)  # дополнительная информация
     ip_address = Column(String(45), nullable=True)
     user_agent = Column(String(500), nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
     
     # Новые поля для детальной информации
     summary = Column(Text, nullable=True)  # Человеко-читаемое описание
@@ -0,0 +1,96 @@
+"""
+Keyset-пагинация (по курсору) для длинных списков.
+
+Курсор — непрозрачная строка с ключом сортировки последней выданной строки,
+например (created_at, id). Следующая страница выбирается условием
+(created_at, id) < курсор и тем же ORDER BY ... LIMIT, поэтому время ответа
+не зависит от глубины листания (в отличие от OFFSET).
+Для списков без обёртки курсор следующей страницы отдаётся в заголовке X-Next-Cursor.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+from datetime import date, datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+
+CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _pack(value: Any) -> list:
+    if isinstance(value, datetime):
+        return ["dt", value.isoformat()]
+    if isinstance(value, date):
+        return ["d", value.isoformat()]
+    return ["v", value]
+
+
+def _unpack(item: list) -> Any:
+    kind, value = item
+    if kind == "dt":
+        return datetime.fromisoformat(value)
+    if kind == "d":
+        return date.fromisoformat(value)
+    return value
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([_pack(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> Tuple[Any, ...]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = tuple(_unpack(item) for item in json.loads(raw))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    if len(values) != size:
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    return values
+
+
+def after_cursor(columns: Sequence[Any], values: Sequence[Any], descending: bool = True):
+    """Условие «строго после курсора» в порядке ORDER BY columns."""
+    if descending:
+        return tuple_(*columns) < tuple_(*values)
+    return tuple_(*columns) > tuple_(*values)
+
+
+def order_by_keys(columns: Sequence[Any], descending: bool = True) -> List[Any]:
+    return [c.desc() if descending else c.asc() for c in columns]
+
+
+def keyset_page(
+    query,
+    columns: Sequence[Any],
+    cursor: Optional[str],
+    limit: int,
+    key: Callable[[Any], Sequence[Any]],
+    descending: bool = True,
+) -> Tuple[list, Optional[str]]:
+    """
+    Страница query после cursor, упорядоченная по columns.
+    key(row) возвращает значения columns для строки. Возвращает (строки, следующий курсор).
+    """
+    if cursor:
+        query = query.filter(after_cursor(columns, decode_cursor(cursor, len(columns)), descending))
+    rows = query.order_by(*order_by_keys(columns, descending)).limit(limit + 1).all()
+    return page_of(rows, limit, key)
+
+
+def page_of(rows: list, limit: int, key: Callable[[Any], Sequence[Any]]) -> Tuple[list, Optional[str]]:
+    """Обрезает выборку из limit + 1 строк до limit и строит курсор, если есть продолжение."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key(rows[-1]))
+
+
+def set_cursor_header(response: Response, next_cursor: Optional[str]) -> None:
+    if next_cursor:
+        response.headers[CURSOR_HEADER] = next_cursor
@@ -0,0 +1,102 @@
+"""
+Права ролей в виде битовых масок.
+
+Каждому Permission.code при старте назначается номер бита (по возрастанию id,
+новые права дописываются в конец — номера не сдвигаются). Набор прав роли
+компилируется в одно целое число и кэшируется; security.check_permission
+сводится к одному побитовому И. Маска роли сбрасывается при изменении
+role_permissions (update/delete роли); другие воркеры получают сброс через
+session_cache.invalidate_role (NOTIFY), без него — по ROLE_MASK_TTL_SECONDS.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app import models
+
+ROLE_MASK_TTL_SECONDS = int(os.getenv("ROLE_MASK_TTL_SECONDS", "60"))
+
+
+class PermissionCatalog:
+    def __init__(self, ttl_seconds: int = ROLE_MASK_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._bits: Dict[str, int] = {}
+        # Описание права по номеру бита (для UserResponse.permissions)
+        self._by_bit: List[SimpleNamespace] = []
+        self._role_masks: Dict[int, Tuple[float, int]] = {}
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._bits)
+
+    def load(self, db: Session) -> None:
+        """Дочитывает права, которых ещё нет в каталоге."""
+        rows = db.query(models.Permission).order_by(models.Permission.id).all()
+        with self._lock:
+            for p in rows:
+                if p.code in self._bits:
+                    continue
+                self._bits[p.code] = len(self._by_bit)
+                self._by_bit.append(SimpleNamespace(
+                    id=p.id,
+                    code=p.code,
+                    name=p.name,
+                    category=p.category,
+                    description=p.description,
+                ))
+
+    def bit(self, code: str) -> Optional[int]:
+        return self._bits.get(code)
+
+    def role_mask(self, db: Session, role_id: Optional[int]) -> int:
+        if role_id is None:
+            return 0
+        cached = self._role_masks.get(role_id)
+        if cached is not None and time.monotonic() - cached[0] <= self.ttl_seconds:
+            return cached[1]
+
+        codes = [
+            code for (code,) in db.query(models.Permission.code)
+            .join(models.role_permissions, models.role_permissions.c.permission_id == models.Permission.id)
+            .filter(models.role_permissions.c.role_id == role_id)
+            .all()
+        ]
+        if any(code not in self._bits for code in codes):
+            # Право создано после старта (возможно, в другом воркере)
+            self.load(db)
+        mask = 0
+        for code in codes:
+            mask |= 1 << self._bits[code]
+        with self._lock:
+            self._role_masks[role_id] = (time.monotonic(), mask)
+        return mask
+
+    def describe(self, mask: int) -> List[SimpleNamespace]:
+        """Права, соответствующие маске, в порядке номеров битов."""
+        result = []
+        bit = 0
+        while mask:
+            if mask & 1:
+                result.append(self._by_bit[bit])
+            mask >>= 1
+            bit += 1
+        return result
+
+    def invalidate_role(self, role_id: int) -> None:
+        with self._lock:
+            self._role_masks.pop(role_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._role_masks.clear()
+
+
+permission_catalog = PermissionCatalog()
@@ -2,10 +2,13 @@
 
 from __future__ import annotations
 
-from datetime import datetime, timedelta
+import json
+from datetime import datetime
 from typing import Any, Optional, Tuple, List, Dict
 
 SEGMENT_MINUTES = 30
+MINUTES_PER_DAY = 24 * 60
+SEGMENTS_PER_DAY = MINUTES_PER_DAY // SEGMENT_MINUTES
 
 
 def _parse_hm(hm: str) -> int:
@@ -46,16 +49,133 @@ def _get_slots(bath, is_weekend_day: bool) -> List[Dict[str, Any]]:
     return [{"from": "00:00", "to": "00:00", "price": price}]
 
 
-def _price_for_datetime(bath, dt: datetime) -> int:
-    is_wknd = is_weekend(dt)
-    slots = _get_slots(bath, is_wknd)
+def _compile_day_prices(bath, is_weekend_day: bool) -> List[int]:
+    """Цена за час для каждой минуты суток (0..1439)."""
+    fallback = int(bath.cost_weekend if is_weekend_day else bath.cost_weekday)
+    slots = _get_slots(bath, is_weekend_day)
     if len(slots) == 1 and slots[0].get("from") == "00:00" and slots[0].get("to") == "00:00":
-        return int(slots[0]["price"])
-    minutes = dt.hour * 60 + dt.minute
-    for slot in slots:
-        if _time_in_interval(minutes, slot["from"], slot["to"]):
-            return int(slot["price"])
-    return int(bath.cost_weekend if is_wknd else bath.cost_weekday)
+        return [int(slots[0]["price"])] * MINUTES_PER_DAY
+    parsed = [(_parse_hm(s["from"]), _parse_hm(s["to"]), int(s["price"])) for s in slots]
+    prices = []
+    for minutes in range(MINUTES_PER_DAY):
+        price = fallback
+        for from_m, to_m, slot_price in parsed:
+            inside = from_m <= minutes < to_m if from_m < to_m else (minutes >= from_m or minutes < to_m)
+            if inside:
+                price = slot_price
+                break
+        prices.append(price)
+    return prices
+
+
+def _segment_prefix_sums(prices: List[int]) -> List[List[int]]:
+    """
+    Префиксные суммы цен по шагу SEGMENT_MINUTES для каждого смещения внутри шага:
+    prefix[r][j] — сумма цен в минутах r, r + 30, ..., r + 30 * (j - 1).
+    """
+    result = []
+    for residue in range(SEGMENT_MINUTES):
+        acc = 0
+        prefix = [0]
+        for idx in range(SEGMENTS_PER_DAY):
+            acc += prices[residue + idx * SEGMENT_MINUTES]
+            prefix.append(acc)
+        result.append(prefix)
+    return result
+
+
+class CompiledTariff:
+    """
+    Скомпилированные тарифы бани: цена на каждую минуту суток для будней и выходных
+    и префиксные суммы по 30-минутным сегментам. Расчёт интервала не разбирает строки
+    "HH:MM" и не зависит от длительности брони (только от числа затронутых суток).
+    """
+
+    __slots__ = ("prices", "prefix")
+
+    def __init__(self, bath):
+        weekday = _compile_day_prices(bath, False)
+        weekend = _compile_day_prices(bath, True)
+        # Индекс 0 — будни, 1 — выходные
+        self.prices = (weekday, weekend)
+        self.prefix = (_segment_prefix_sums(weekday), _segment_prefix_sums(weekend))
+
+    def price_at(self, dt: datetime) -> int:
+        return self.prices[is_weekend(dt)][dt.hour * 60 + dt.minute]
+
+    def base_cost(self, start_dt: datetime, end_dt: datetime) -> float:
+        """
+        Стоимость интервала по тем же правилам, что и пошаговый обход: сегменты по
+        SEGMENT_MINUTES от начала брони, цена сегмента берётся по времени его начала.
+        """
+        total_seconds = (end_dt - start_dt).total_seconds()
+        if total_seconds <= 0:
+            return 0.0
+        segment_seconds = SEGMENT_MINUTES * 60
+        full_segments = int(total_seconds // segment_seconds)
+        remainder_seconds = total_seconds - full_segments * segment_seconds
+
+        minute = start_dt.hour * 60 + start_dt.minute
+        residue = minute % SEGMENT_MINUTES
+        idx = minute // SEGMENT_MINUTES
+        weekday = start_dt.weekday()
+
+        full_sum = 0
+        left = full_segments
+        while left > 0:
+            take = min(left, SEGMENTS_PER_DAY - idx)
+            prefix = self.prefix[weekday >= 4][residue]
+            full_sum += prefix[idx + take] - prefix[idx]
+            left -= take
+            idx = 0
+            weekday = (weekday + 1) % 7
+
+        total = full_sum * SEGMENT_MINUTES / 60
+        if remainder_seconds > 0:
+            pos = minute // SEGMENT_MINUTES + full_segments
+            last_weekday = (start_dt.weekday() + pos // SEGMENTS_PER_DAY) % 7
+            last_minute = residue + (pos % SEGMENTS_PER_DAY) * SEGMENT_MINUTES
+            total += self.prices[last_weekday >= 4][last_minute] * remainder_seconds / 3600
+        return total
+
+
+# bath_id -> (отпечаток тарифов, CompiledTariff)
+_compiled_tariffs: Dict[int, Tuple[str, CompiledTariff]] = {}
+
+
+def _tariff_fingerprint(bath) -> str:
+    tariffs = getattr(bath, "time_tariffs", None)
+    return json.dumps(
+        [tariffs, int(bath.cost_weekday or 0), int(bath.cost_weekend or 0)],
+        sort_keys=True,
+        default=str,
+    )
+
+
+def get_compiled_tariff(bath) -> CompiledTariff:
+    """Возвращает скомпилированные тарифы бани; пересобирает их при изменении time_tariffs."""
+    bath_id = getattr(bath, "bath_id", None)
+    fingerprint = _tariff_fingerprint(bath)
+    if bath_id is not None:
+        cached = _compiled_tariffs.get(bath_id)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+    compiled = CompiledTariff(bath)
+    if bath_id is not None:
+        _compiled_tariffs[bath_id] = (fingerprint, compiled)
+    return compiled
+
+
+def invalidate_compiled_tariff(bath_id: Optional[int] = None) -> None:
+    """Сбрасывает кэш скомпилированных тарифов (для одной бани или для всех)."""
+    if bath_id is None:
+        _compiled_tariffs.clear()
+    else:
+        _compiled_tariffs.pop(bath_id, None)
+
+
+def _price_for_datetime(bath, dt: datetime) -> int:
+    return get_compiled_tariff(bath).price_at(dt)
 
 
 def calculate_bath_base_cost(
@@ -63,6 +183,7 @@ def calculate_bath_base_cost(
     start_dt: datetime,
     end_dt: datetime,
     hourly_rate_override: Optional[int] = None,
+    compiled: Optional[CompiledTariff] = None,
 ) -> Tuple[int, int]:
     """Возвращает (bath_base_cost, effective_hourly_rate)."""
     paid_hours = (end_dt - start_dt).total_seconds() / 3600
@@ -73,15 +194,7 @@ def calculate_bath_base_cost(
         cost = int(round(hourly_rate_override * paid_hours))
         return cost, int(hourly_rate_override)
 
-    total_cost = 0.0
-    segment = timedelta(minutes=SEGMENT_MINUTES)
-    current = start_dt
-    while current < end_dt:
-        segment_end = min(current + segment, end_dt)
-        segment_hours = (segment_end - current).total_seconds() / 3600
-        price_per_hour = _price_for_datetime(bath, current)
-        total_cost += price_per_hour * segment_hours
-        current = segment_end
+    total_cost = (compiled or get_compiled_tariff(bath)).base_cost(start_dt, end_dt)
 
     effective_rate = int(round(total_cost / paid_hours)) if paid_hours > 0 else 0
     return int(round(total_cost)), effective_rate
@@ -95,6 +208,34 @@ def calculate_extra_guest_cost(bath, guests: int, paid_hours: float) -> int:
     return int(round(extra_guests * extra_price * paid_hours))
 
 
+def quote_bath_costs(
+    baths: Dict[int, Any],
+    items: List[Tuple[int, datetime, datetime, int]],
+) -> List[Dict[str, int]]:
+    """
+    Расчёт стоимости для набора (bath_id, start, end, guests).
+    Тарифы каждой бани компилируются один раз на весь набор.
+    """
+    compiled: Dict[int, CompiledTariff] = {}
+    result = []
+    for bath_id, start_dt, end_dt, guests in items:
+        bath = baths[bath_id]
+        if bath_id not in compiled:
+            compiled[bath_id] = get_compiled_tariff(bath)
+        bath_cost, hourly_rate = calculate_bath_base_cost(
+            bath, start_dt, end_dt, compiled=compiled[bath_id]
+        )
+        paid_hours = max(0.0, (end_dt - start_dt).total_seconds() / 3600)
+        extra_guest_cost = calculate_extra_guest_cost(bath, guests, paid_hours)
+        result.append({
+            "bath_cost": bath_cost,
+            "extra_guest_cost": extra_guest_cost,
+            "hourly_rate": hourly_rate,
+            "total_cost": bath_cost + extra_guest_cost,
+        })
+    return result
+
+
 def _validate_hm(value: str, field_name: str) -> None:
     try:
         _parse_hm(value)
@@ -0,0 +1,202 @@
+"""
+In-memory индекс интервалов броней по баням.
+
+Используется как быстрый отказ при проверке пересечений в admin_reservations, когда
+в БД есть ограничение reservations_no_overlap: найденные индексом кандидаты
+подтверждаются запросом по первичному ключу, а пропущенные индексом пересечения
+(брони из других воркеров uvicorn) ловит само ограничение при INSERT/UPDATE.
+Интервалы хранятся уже с учётом времени на уборку: [start, end + cleaning).
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app import models
+
+DEFAULT_CLEANING_MINUTES = 30
+# Как часто перечитывать cleaning_time_minutes из settings (изменения из других воркеров)
+SETTINGS_TTL_SECONDS = 60
+# Как часто перечитывать брони бани целиком (изменения из других воркеров)
+BATH_TTL_SECONDS = 300
+# Индекс покрывает брони, заканчивающиеся не раньше чем now - INDEX_HORIZON
+INDEX_HORIZON = timedelta(days=1)
+
+
+def to_naive_local(dt: datetime) -> datetime:
+    """Приводит дату к наивному локальному времени сервера (как сравнивает PostgreSQL)."""
+    if dt.tzinfo is not None:
+        return dt.astimezone().replace(tzinfo=None)
+    return dt
+
+
+class _BathIntervals:
+    """Отсортированный по началу список интервалов одной бани."""
+
+    def __init__(self, covered_from: datetime, buffer: timedelta):
+        self.covered_from = covered_from
+        self.buffer = buffer
+        self.loaded_at = time.monotonic()
+        self.starts: List[datetime] = []
+        self.entries: List[Tuple[datetime, datetime, int]] = []
+        self.by_id: Dict[int, Tuple[datetime, datetime]] = {}
+        self.max_length = timedelta(0)
+
+    def add(self, reservation_id: int, start: datetime, buffered_end: datetime) -> None:
+        self.remove(reservation_id)
+        entry = (start, buffered_end, reservation_id)
+        idx = bisect_right(self.entries, entry)
+        self.entries.insert(idx, entry)
+        self.starts.insert(idx, start)
+        self.by_id[reservation_id] = (start, buffered_end)
+        self.max_length = max(self.max_length, buffered_end - start)
+
+    def remove(self, reservation_id: int) -> None:
+        item = self.by_id.pop(reservation_id, None)
+        if item is None:
+            return
+        entry = (item[0], item[1], reservation_id)
+        idx = bisect_left(self.entries, entry)
+        if idx < len(self.entries) and self.entries[idx] == entry:
+            del self.entries[idx]
+            del self.starts[idx]
+
+    def overlapping(self, start: datetime, end: datetime, exclude_id: Optional[int]) -> List[int]:
+        # Интервал длиной не больше max_length может пересечь [start, end),
+        # только если начинается позже start - max_length.
+        lo = bisect_left(self.starts, start - self.max_length)
+        hi = bisect_left(self.starts, end)
+        return [
+            rid for _, buffered_end, rid in self.entries[lo:hi]
+            if buffered_end > start and rid != exclude_id
+        ]
+
+
+class ReservationIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baths: Dict[int, _BathIntervals] = {}
+        self._bath_of: Dict[int, int] = {}
+        self._cleaning_minutes: Optional[float] = None
+        self._cleaning_loaded_at = 0.0
+
+    def reset(self) -> None:
+        with self._lock:
+            self._baths.clear()
+            self._bath_of.clear()
+            self._cleaning_minutes = None
+
+    def invalidate_bath(self, bath_id: int) -> None:
+        with self._lock:
+            self._drop_bath(bath_id)
+
+    def _drop_bath(self, bath_id: int) -> None:
+        intervals = self._baths.pop(bath_id, None)
+        if intervals is not None:
+            for rid in intervals.by_id:
+                self._bath_of.pop(rid, None)
+
+    def cleaning_minutes(self, db: Session, fresh: bool = False) -> float:
+        """
+        Время уборки из настроек; кэшируется на SETTINGS_TTL_SECONDS.
+        fresh=True — всегда читать из БД (проверки пересечений и запись брони).
+        """
+        now = time.monotonic()
+        if (
+            not fresh
+            and self._cleaning_minutes is not None
+            and now - self._cleaning_loaded_at < SETTINGS_TTL_SECONDS
+        ):
+            return self._cleaning_minutes
+        setting = db.query(models.Settings).filter(models.Settings.key == "cleaning_time_minutes").first()
+        value = float(setting.value) if setting else float(DEFAULT_CLEANING_MINUTES)
+        with self._lock:
+            if self._cleaning_minutes is not None and value != self._cleaning_minutes:
+                # Буферы уборки в индексе устарели
+                self._baths.clear()
+                self._bath_of.clear()
+            self._cleaning_minutes = value
+            self._cleaning_loaded_at = now
+        return value
+
+    def _load_bath(self, db: Session, bath_id: int) -> _BathIntervals:
+        buffer = timedelta(minutes=self.cleaning_minutes(db))
+        covered_from = datetime.now() - INDEX_HORIZON
+        rows = (
+            db.query(
+                models.Reservation.reservation_id,
+                models.Reservation.start_datetime,
+                models.Reservation.end_datetime,
+            )
+            .filter(
+                models.Reservation.bath_id == bath_id,
+                models.Reservation.end_datetime > covered_from,
+            )
+            .all()
+        )
+        intervals = _BathIntervals(covered_from, buffer)
+        for rid, start, end in rows:
+            intervals.add(rid, to_naive_local(start), to_naive_local(end) + buffer)
+        with self._lock:
+            self._drop_bath(bath_id)
+            self._baths[bath_id] = intervals
+            for rid, _, _ in rows:
+                self._bath_of[rid] = bath_id
+        return intervals
+
+    def find_conflicts(
+        self,
+        db: Session,
+        bath_id: int,
+        start: datetime,
+        end: datetime,
+        exclude_id: Optional[int] = None,
+    ) -> Optional[List[int]]:
+        """
+        ID броней, пересекающихся с [start, end) с учётом уборки после каждой.
+        None — интервал раньше горизонта индекса, проверять только по БД.
+        """
+        start = to_naive_local(start)
+        end = to_naive_local(end)
+        intervals = self._baths.get(bath_id)
+        if intervals is None or time.monotonic() - intervals.loaded_at > BATH_TTL_SECONDS:
+            intervals = self._load_bath(db, bath_id)
+        # Незагруженные брони заканчиваются до covered_from и с уборкой
+        # могут задеть только интервалы, начинающиеся раньше covered_from + buffer
+        if start < intervals.covered_from + intervals.buffer:
+            return None
+        with self._lock:
+            return intervals.overlapping(start, end, exclude_id)
+
+    def add(self, reservation: models.Reservation) -> None:
+        """Добавляет или перемещает бронь после успешного commit."""
+        with self._lock:
+            self._discard(reservation.reservation_id)
+            intervals = self._baths.get(reservation.bath_id)
+            if intervals is None or self._cleaning_minutes is None:
+                return
+            buffer = timedelta(minutes=self._cleaning_minutes)
+            intervals.add(
+                reservation.reservation_id,
+                to_naive_local(reservation.start_datetime),
+                to_naive_local(reservation.end_datetime) + buffer,
+            )
+            self._bath_of[reservation.reservation_id] = reservation.bath_id
+
+    def discard(self, reservation_id: int) -> None:
+        with self._lock:
+            self._discard(reservation_id)
+
+    def _discard(self, reservation_id: int) -> None:
+        bath_id = self._bath_of.pop(reservation_id, None)
+        if bath_id is not None and bath_id in self._baths:
+            self._baths[bath_id].remove(reservation_id)
+
+
+reservation_index = ReservationIndex()
@@ -1,15 +1,28 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Form, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm  
 from sqlalchemy.orm import Session
 from datetime import datetime, timezone
 
 from app import models, schemas, security, auth, database
 from app.phone_utils import normalize_phone, is_phone_number
+from app.session_cache import session_cache
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
+
+def _find_user_by_login(db: Session, login_identifier: str):
+    """Пользователь по email или телефону"""
+    if is_phone_number(login_identifier):
+        normalized = normalize_phone(login_identifier)
+        if normalized:
+            return db.query(models.User).filter(models.User.phone == normalized).first()
+        return None
+    return db.query(models.User).filter(models.User.email == login_identifier).first()
+
+
 @router.post("/login", response_model=dict)
-def login(
+async def login(
     request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),  
     db: Session = Depends(database.get_db)
@@ -29,14 +42,8 @@ def login(
             pass
     
     # Determine if it's phone or email
-    user = None
-    if is_phone_number(login_identifier):
-        normalized = normalize_phone(login_identifier)
-        if normalized:
-            user = db.query(models.User).filter(models.User.phone == normalized).first()
-    else:
-        # Treat as email
-        user = db.query(models.User).filter(models.User.email == login_identifier).first()
+    # Обработчик async: запросы к БД — в threadpool, argon2 — в своём пуле
+    user = await run_in_threadpool(_find_user_by_login, db, login_identifier)
     
     if not user:
         raise HTTPException(
@@ -50,7 +57,7 @@ def login(
             detail="Аккаунт деактивирован"
         )
 
-    if not security.verify_password(password, user.password_hash):
+    if not await security.verify_password_async(password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный email/телефон или пароль"
@@ -62,7 +69,8 @@ def login(
     
     # Create session with tokens
     # Note: remember_me will be handled in a custom login endpoint
-    tokens = auth.create_session_tokens(
+    tokens = await run_in_threadpool(
+        auth.create_session_tokens,
         user_id=user.user_id,
         db=db,
         remember_me=False,  # Default, will be updated with custom endpoint
@@ -78,8 +86,16 @@ def get_current_user_info(current_user: models.User = Depends(auth.get_current_u
     return current_user
 
 
+@router.get("/password-hasher/stats", response_model=dict)
+def get_password_hasher_stats(current_user: models.User = Depends(auth.get_current_user)):
+    """Счётчики пула argon2: выполнено, отклонено при перегрузке, в очереди"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав")
+    return security.password_hasher.stats()
+
+
 @router.post("/login-with-remember", response_model=dict)
-def login_with_remember(
+async def login_with_remember(
     request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(database.get_db)
@@ -89,13 +105,8 @@ def login_with_remember(
     password = form_data.password
     
     # Determine if it's phone or email
-    user = None
-    if is_phone_number(login_identifier):
-        normalized = normalize_phone(login_identifier)
-        if normalized:
-            user = db.query(models.User).filter(models.User.phone == normalized).first()
-    else:
-        user = db.query(models.User).filter(models.User.email == login_identifier).first()
+    # Обработчик async: запросы к БД — в threadpool, argon2 — в своём пуле
+    user = await run_in_threadpool(_find_user_by_login, db, login_identifier)
     
     if not user:
         raise HTTPException(
@@ -109,7 +120,7 @@ def login_with_remember(
             detail="Аккаунт деактивирован"
         )
 
-    if not security.verify_password(password, user.password_hash):
+    if not await security.verify_password_async(password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный email/телефон или пароль"
@@ -120,7 +131,8 @@ def login_with_remember(
     user_agent = request.headers.get("user-agent", None)
     
     # Create session with remember_me = True (30 days)
-    tokens = auth.create_session_tokens(
+    tokens = await run_in_threadpool(
+        auth.create_session_tokens,
         user_id=user.user_id,
         db=db,
         remember_me=True,
@@ -208,6 +220,7 @@ def refresh_token(
         # Deactivate old session
         session.is_active = False
         db.commit()
+        session_cache.invalidate_session(session.id)
         
         return new_tokens
         
@@ -239,6 +252,7 @@ def logout(
         if session:
             session.is_active = False
             db.commit()
+        session_cache.invalidate_token(token_hash)
     
     return {"message": "Successfully logged out"}
 
@@ -286,5 +300,6 @@ def revoke_session(
     
     session.is_active = False
     db.commit()
+    session_cache.invalidate_session(session_id)
     
     return {"message": "Session revoked"}
\ No newline at end of file
@@ -1,14 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Request
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Request, Query, Response
+from sqlalchemy import literal_column, text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session, joinedload
+import time
 from typing import List, Optional
 from datetime import datetime, timedelta, date
 from app import models, schemas, database
 from app.auth import get_current_user
 from app.email_service import send_booking_confirmation_email
 from app.audit_logger import log_action, get_client_ip
-from app.database import SessionLocal
 from app.promotion_utils import apply_selected_promotions_to_reservation, get_snapshot_gift_product_ids, get_snapshot_discount
 from app.pricing_utils import calculate_bath_base_cost, calculate_extra_guest_cost
+from app.reservation_index import reservation_index
+from app.availability_cache import availability_cache, invalidate_reservation_span, ALL_BATHS
+from app.pagination import keyset_page, set_cursor_header
+from app.daily_stats import refresh_daily_stats
 
 
 router = APIRouter(
@@ -73,35 +79,148 @@ def _reservation_product_response(rp) -> schemas.ReservationProductResponse:
     )
 
 
-def check_overlap(db: Session, bath_id: int, start: datetime, end: datetime, exclude_id: int = None):
+def _request_cleaning_minutes(db: Session) -> int:
     """
-    Проверяет пересечение с существующими бронями, включая время на уборку после каждой.
-    Время уборки берется из настроек (по умолчанию 30 минут).
-    Использует FOR UPDATE для предотвращения race condition.
+    Время уборки для проверки и записи брони — читается из БД один раз на запрос:
+    кэш процесса мог не увидеть изменение из другого воркера.
     """
-    # Получаем время уборки из настроек
-    cleaning_setting = db.query(models.Settings).filter(models.Settings.key == "cleaning_time_minutes").first()
-    cleaning_minutes = cleaning_setting.value if cleaning_setting else 30
-    
+    return int(reservation_index.cleaning_minutes(db, fresh=True))
+
+
+def _overlap_query(
+    db: Session, bath_id: int, start: datetime, end: datetime, cleaning_minutes: int, exclude_id: int = None
+):
+    # То же правило, что у ограничения reservations_no_overlap и сетки доступности:
+    # [start, end + уборка) новой брони не пересекает [start, end + её уборка) существующей
     query = db.query(models.Reservation).filter(
         models.Reservation.bath_id == bath_id,
-        models.Reservation.start_datetime < end,
-        (models.Reservation.end_datetime + timedelta(minutes=cleaning_minutes)) > start
-    ).with_for_update(skip_locked=True)  # Блокировка для предотвращения race condition
-    
+        models.Reservation.start_datetime < end + timedelta(minutes=cleaning_minutes),
+        models.Reservation.end_datetime
+        + models.Reservation.cleaning_minutes * literal_column("INTERVAL '1 minute'") > start
+    )
     if exclude_id:
         query = query.filter(models.Reservation.reservation_id != exclude_id)
-    return query.first()
+    return query
+
+
+def check_overlap(
+    db: Session, bath_id: int, start: datetime, end: datetime, exclude_id: int = None,
+    cleaning_minutes: Optional[int] = None,
+):
+    """
+    Проверяет пересечение с существующими бронями, включая время на уборку после каждой
+    (и после новой).
+    Время уборки берется из настроек (по умолчанию 30 минут), если не передано.
+    Используется без ограничения в БД, поэтому in-memory индекс здесь не участвует:
+    пропустить бронь из другого воркера нельзя. Конфликтующие строки блокируются
+    FOR UPDATE без skip_locked: заблокированная конкурентной транзакцией бронь
+    не должна пропускаться.
+    """
+    if cleaning_minutes is None:
+        cleaning_minutes = _request_cleaning_minutes(db)
+    return _overlap_query(db, bath_id, start, end, cleaning_minutes, exclude_id).with_for_update().first()
+
+
+OVERLAP_CONSTRAINT_NAME = "reservations_no_overlap"
+OVERLAP_DETAIL = "Бронь пересекается с существующей"
+
+# Как часто перепроверять наличие ограничения (его могут создать миграцией без рестарта)
+OVERLAP_CONSTRAINT_CHECK_SECONDS = 60
+
+_overlap_constraint_enabled: Optional[bool] = None
+_overlap_constraint_checked_at = 0.0
+
+
+def _has_overlap_constraint(db: Session) -> bool:
+    """Создано ли в БД ограничение EXCLUDE на reservations.period (см. main.py)."""
+    global _overlap_constraint_enabled, _overlap_constraint_checked_at
+    now = time.monotonic()
+    if (
+        _overlap_constraint_enabled is None
+        or now - _overlap_constraint_checked_at >= OVERLAP_CONSTRAINT_CHECK_SECONDS
+    ):
+        enabled = db.execute(
+            text("SELECT 1 FROM pg_constraint WHERE conname = :name"),
+            {"name": OVERLAP_CONSTRAINT_NAME},
+        ).first() is not None
+        if not enabled and _overlap_constraint_enabled is not False:
+            print(f"WARNING: ограничения {OVERLAP_CONSTRAINT_NAME} нет — пересечения броней проверяются запросом")
+        _overlap_constraint_enabled = enabled
+        _overlap_constraint_checked_at = now
+    return _overlap_constraint_enabled
+
+
+def _find_overlap(
+    db: Session, bath_id: int, start: datetime, end: datetime, cleaning_minutes: int, exclude_id: int = None
+):
+    """
+    Проверка пересечений до записи. При наличии ограничения в БД пересечения ловит
+    сам INSERT/UPDATE, а здесь остаётся только быстрый отказ по in-memory индексу:
+    промах индекса не требует запросов, попадание подтверждается по первичному ключу.
+    cleaning_minutes — значение запроса (_request_cleaning_minutes); интервалы индекса
+    построены по кэшу настроек с TTL.
+    """
+    if not _has_overlap_constraint(db):
+        return check_overlap(db, bath_id, start, end, exclude_id=exclude_id, cleaning_minutes=cleaning_minutes)
+    # Интервалы индекса уже с уборкой; уборка после новой брони — продлением end
+    candidate_ids = reservation_index.find_conflicts(
+        db, bath_id, start, end + timedelta(minutes=cleaning_minutes), exclude_id=exclude_id
+    )
+    if not candidate_ids:
+        return None
+    confirmed = _overlap_query(db, bath_id, start, end, cleaning_minutes, exclude_id).filter(
+        models.Reservation.reservation_id.in_(candidate_ids)
+    ).first()
+    if confirmed is None:
+        # Индекс устарел (бронь изменили в другом воркере)
+        reservation_index.invalidate_bath(bath_id)
+    return confirmed
+
+
+def _flush_reservation(db: Session) -> None:
+    """flush с переводом нарушения reservations_no_overlap в 400."""
+    try:
+        db.flush()
+    except IntegrityError as exc:
+        db.rollback()
+        if OVERLAP_CONSTRAINT_NAME in str(exc.orig):
+            raise HTTPException(status_code=400, detail=OVERLAP_DETAIL)
+        raise
+
+
+def _load_reservations(query) -> List[models.Reservation]:
+    """Заполняет products и status; принимает запрос или уже загруженный список."""
+    reservations = query if isinstance(query, list) else query.all()
+
+    for res in reservations:
+        # Товары — только если объект существует
+        res.products = [
+            _reservation_product_response(rp)
+            for rp in res.reservation_products
+            if rp.product is not None
+        ]
+        
+        # Статус
+        res.status = res.status_rel.status_name if res.status_rel else "Неизвестный"
+
+    return reservations
 
 
 @router.get("/", response_model=List[schemas.ReservationResponse])
 def get_reservations(
+    response: Response,
     date: str = None, 
     bath_id: int = None,
     status: str = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
+    """
+    Без date — вся история, с date — брони, задевающие день; с limit/cursor —
+    постранично от новых к старым, курсор следующей страницы в заголовке X-Next-Cursor.
+    """
     query = db.query(models.Reservation).options(
         joinedload(models.Reservation.status_rel),
         joinedload(models.Reservation.reservation_products).joinedload(models.ReservationProduct.product)
@@ -116,36 +235,54 @@ def get_reservations(
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
 
-        start_of_day = datetime.combine(target_date, datetime.min.time())
-        end_of_day = datetime.combine(target_date, datetime.max.time())
-
-        # Используем логику пересечения: бронь пересекается с днем, если
-        # она начинается ДО конца дня и заканчивается ПОСЛЕ начала дня
-        query = query.filter(
-            models.Reservation.start_datetime < end_of_day,
-            models.Reservation.end_datetime > start_of_day
-        )
+        # Кэшируется только занятость дня — (id брони, баня) по всем баням. Товары, цены
+        # и статусы меняются мимо invalidate_reservation_span, поэтому ответ каждый раз
+        # собирается из БД по этим id.
+        day_occupancy = availability_cache.get("reservations", ALL_BATHS, target_date)
+        if day_occupancy is None:
+            generation = availability_cache.generation
+            start_of_day = datetime.combine(target_date, datetime.min.time())
+            end_of_day = datetime.combine(target_date, datetime.max.time())
+
+            # Используем логику пересечения: бронь пересекается с днем, если
+            # она начинается ДО конца дня и заканчивается ПОСЛЕ начала дня
+            day_occupancy = [
+                (reservation_id, res_bath_id)
+                for reservation_id, res_bath_id in db.query(
+                    models.Reservation.reservation_id, models.Reservation.bath_id
+                ).filter(
+                    models.Reservation.start_datetime < end_of_day,
+                    models.Reservation.end_datetime > start_of_day
+                )
+            ]
+            availability_cache.set("reservations", ALL_BATHS, target_date, day_occupancy, generation=generation)
 
-    if bath_id is not None:
+        reservation_ids = [
+            reservation_id for reservation_id, res_bath_id in day_occupancy
+            if bath_id is None or res_bath_id == bath_id
+        ]
+        if not reservation_ids:
+            return []
+        # Баня уже отфильтрована по занятости; дальше — статус и постраничность, как без date
+        query = query.filter(models.Reservation.reservation_id.in_(reservation_ids))
+    elif bath_id is not None:
         query = query.filter(models.Reservation.bath_id == bath_id)
     
     if status is not None:
         query = query.join(models.ReservationStatus).filter(models.ReservationStatus.status_name == status)
 
-    reservations = query.all()
-
-    for res in reservations:
-        # Товары — только если объект существует
-        res.products = [
-            _reservation_product_response(rp)
-            for rp in res.reservation_products
-            if rp.product is not None
-        ]
-        
-        # Статус
-        res.status = res.status_rel.status_name if res.status_rel else "Неизвестный"
+    if limit is None and cursor is None:
+        return _load_reservations(query)
 
-    return reservations
+    reservations, next_cursor = keyset_page(
+        query,
+        (models.Reservation.start_datetime, models.Reservation.reservation_id),
+        cursor,
+        limit or 50,
+        key=lambda res: (res.start_datetime, res.reservation_id),
+    )
+    set_cursor_header(response, next_cursor)
+    return _load_reservations(reservations)
 
 
 @router.post("/", response_model=schemas.ReservationResponse, status_code=status.HTTP_201_CREATED)
@@ -213,9 +350,10 @@ def create_reservation(
     promotion_discount = get_snapshot_discount(promo_snapshot)
 
     # 4. Проверяем пересечения уже с учётом бонусного времени
-    overlap = check_overlap(db, reservation.bath_id, start_dt, end_dt)
+    cleaning_minutes = _request_cleaning_minutes(db)
+    overlap = _find_overlap(db, reservation.bath_id, start_dt, end_dt, cleaning_minutes)
     if overlap:
-        raise HTTPException(status_code=400, detail="Бронь пересекается с существующей")
+        raise HTTPException(status_code=400, detail=OVERLAP_DETAIL)
 
     total_cost = max(0, bath_cost - promotion_discount)
 
@@ -256,9 +394,10 @@ def create_reservation(
         applied_promotion_id=applied_promo_ids[0] if applied_promo_ids else None,
         applied_promotion_ids=applied_promo_ids or None,
         promotion_snapshot=promo_snapshot,
+        cleaning_minutes=cleaning_minutes,
     )
     db.add(db_reservation)
-    db.flush()
+    _flush_reservation(db)
 
     if _is_closed_status(db, reservation.status_id):
         realization_doc = models.RealizationDocument(
@@ -300,8 +439,14 @@ def create_reservation(
                 sale_price=_resolve_sale_price(item, product),
             ))
 
+    db.flush()
+    refresh_daily_stats(db, (db_reservation.bath_id, db_reservation.start_datetime))
     db.commit()
     db.refresh(db_reservation)
+    reservation_index.add(db_reservation)
+    invalidate_reservation_span(
+        db_reservation.bath_id, (db_reservation.start_datetime, db_reservation.end_datetime)
+    )
 
     # === ФОРМИРУЕМ ОТВЕТ ВРУЧНУЮ ===
     response_products = []
@@ -369,7 +514,6 @@ def create_reservation(
     from app.audit_logger import log_detailed_action
     background_tasks.add_task(
         log_detailed_action,
-        db=SessionLocal(),
         user_id=current_user.user_id,
         action="CREATE",
         entity_type="reservation",
@@ -676,9 +820,13 @@ def update_reservation(
             promotion_discount = get_snapshot_discount(promo_snapshot)
 
             if reservation.start_datetime or reservation.end_datetime or reservation.bath_id or applied_promo_ids:
-                overlap = check_overlap(db, db_reservation.bath_id, start_dt, end_dt, exclude_id=id)
+                cleaning_minutes = _request_cleaning_minutes(db)
+                overlap = _find_overlap(
+                    db, db_reservation.bath_id, start_dt, end_dt, cleaning_minutes, exclude_id=id
+                )
                 if overlap:
-                    raise HTTPException(status_code=400, detail="Бронь пересекается с существующей")
+                    raise HTTPException(status_code=400, detail=OVERLAP_DETAIL)
+                db_reservation.cleaning_minutes = cleaning_minutes
 
             db_reservation.start_datetime = start_dt
             db_reservation.end_datetime = end_dt
@@ -727,8 +875,19 @@ def update_reservation(
             raise HTTPException(status_code=400, detail="Предоплата не может превышать сумму брони")
 
         print(f"\nCommitting to database...")
+        _flush_reservation(db)
+        refresh_daily_stats(
+            db,
+            (old_bath_id, old_start_datetime),
+            (db_reservation.bath_id, db_reservation.start_datetime),
+        )
         db.commit()
         db.refresh(db_reservation)
+        reservation_index.add(db_reservation)
+        invalidate_reservation_span(old_bath_id, (old_start_datetime, old_end_datetime))
+        invalidate_reservation_span(
+            db_reservation.bath_id, (db_reservation.start_datetime, db_reservation.end_datetime)
+        )
         print(f"✅ Reservation {id} updated successfully\n")
 
         # === ФОРМИРУЕМ ОТВЕТ ВРУЧНУЮ ===
@@ -788,7 +947,6 @@ def update_reservation(
         from app.audit_logger import log_detailed_action
         background_tasks.add_task(
             log_detailed_action,
-            db=SessionLocal(),
             user_id=current_user.user_id,
             action="UPDATE",
             entity_type="reservation",
@@ -876,12 +1034,15 @@ def delete_reservation(
             product.total_quantity += rp.quantity
 
     db.delete(reservation)
+    db.flush()
+    refresh_daily_stats(db, (bath_id, start_dt))
     db.commit()
+    reservation_index.discard(id)
+    invalidate_reservation_span(bath_id, (start_dt, end_dt))
 
     from app.audit_logger import log_detailed_action
     background_tasks.add_task(
         log_detailed_action,
-        db=SessionLocal(),
         user_id=current_user.user_id,
         action="DELETE",
         entity_type="reservation",
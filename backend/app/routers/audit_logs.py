@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
@@ -6,14 +6,17 @@ from app.database import get_db
 from app.models import User, AuditLog
 from app.schemas import AuditLogResponse
 from app.auth import get_current_user
+from app.pagination import keyset_page, page_of, set_cursor_header
 
 router = APIRouter(prefix="/api/audit", tags=["Audit Logs"])
 
 
 @router.get("/logs", response_model=List[AuditLogResponse])
 async def get_audit_logs(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
     user_id: Optional[int] = None,
     entity_type: Optional[str] = None,
     action: Optional[str] = None,
@@ -22,7 +25,10 @@ async def get_audit_logs(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Получить журналы аудита с фильтрацией"""
+    """
+    Получить журналы аудита с фильтрацией.
+    Курсор следующей страницы — в заголовке X-Next-Cursor; с cursor параметр skip не используется.
+    """
     
     # Только администраторы могут просматривать логи
     if not current_user.is_admin:
@@ -42,7 +48,18 @@ async def get_audit_logs(
     if date_to:
         query = query.filter(AuditLog.created_at <= date_to)
     
-    logs = query.order_by(AuditLog.created_at.desc()).offset(skip).limit(limit).all()
+    if skip and not cursor:
+        logs = query.order_by(AuditLog.created_at.desc(), AuditLog.id.desc()).offset(skip).limit(limit + 1).all()
+        logs, next_cursor = page_of(logs, limit, lambda log: (log.created_at, log.id))
+    else:
+        logs, next_cursor = keyset_page(
+            query,
+            (AuditLog.created_at, AuditLog.id),
+            cursor,
+            limit,
+            key=lambda log: (log.created_at, log.id),
+        )
+    set_cursor_header(response, next_cursor)
     
     # Добавляем full_name через JOIN
     result = []
@@ -1,19 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request
+from fastapi.concurrency import run_in_threadpool
+from functools import partial
+from sqlalchemy import func
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy.orm.attributes import flag_modified
 from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
 import os
 import uuid
-import hashlib
 from pathlib import Path
 from app.database import get_db
 from app.models import Bath, Photo, BathPromotion, Promotion, PromotionGiftProduct
 from app.schemas import BathOut, BathCreate, BathUpdate
-from app.image_utils import process_image_to_webp
+from app.image_utils import process_images_to_variants, save_image_variants
+from app.upload_utils import save_upload_streaming
+from app.media_store import attach_photos, detach_photos, lock_paths, replace_photos
+from app.catalog_cache import cached_catalog_response, touch_catalog
 from app.slug_utils import generate_slug, make_unique_slug
 from app.promotion_utils import serialize_promotion_brief, load_incompatibility_map
-from app.pricing_utils import validate_time_tariffs, sync_flat_costs_from_tariffs
+from app.pricing_utils import validate_time_tariffs, sync_flat_costs_from_tariffs, invalidate_compiled_tariff
 
 router = APIRouter(prefix="/baths", tags=["baths"])
 
@@ -36,6 +41,8 @@ def _serialize_bath(bath: Bath, incompatibility_map=None) -> dict:
             {
                 "photo_id": p.photo_id,
                 "image_url": p.image_url,
+                "variants": p.variants or [],
+                "srcset": p.srcset,
                 "bath_id": p.bath_id,
             }
             for p in bath.photos
@@ -60,9 +67,7 @@ def _serialize_baths(db: Session, baths: List[Bath]) -> List[dict]:
     return [_serialize_bath(bath, incompatibility_map) for bath in baths]
 
 
-@router.get("/")
-def get_baths(db: Session = Depends(get_db)):
-
+def _build_baths(db: Session) -> List[dict]:
     baths = db.query(Bath)\
         .options(
             joinedload(Bath.photos),
@@ -78,38 +83,28 @@ def get_baths(db: Session = Depends(get_db)):
     return _serialize_baths(db, baths)
 
 
-@router.get("/{slug_or_id}")
-def get_bath(slug_or_id: str, db: Session = Depends(get_db)):
-    bath = db.query(Bath)\
-        .options(
-            joinedload(Bath.photos),
-            joinedload(Bath.promotions)
-            .joinedload(Promotion.gift_products)
-            .joinedload(PromotionGiftProduct.product),
-        )\
-        .filter(Bath.slug == slug_or_id)\
-        .first()
+@router.get("/")
+def get_baths(request: Request, db: Session = Depends(get_db)):
+    return cached_catalog_response(request, db, ("baths",), lambda: _build_baths(db))
+
+
+def _resolve_bath_id(db: Session, slug_or_id: str) -> int:
+    row = db.query(Bath.bath_id).filter(Bath.slug == slug_or_id).first()
 
     # Поддержка /baths/1 для админки (по bath_id)
-    if not bath and slug_or_id.isdigit():
-        bath = db.query(Bath)\
-            .options(
-                joinedload(Bath.photos),
-                joinedload(Bath.promotions)
-                .joinedload(Promotion.gift_products)
-                .joinedload(PromotionGiftProduct.product),
-            )\
-            .filter(Bath.bath_id == int(slug_or_id))\
-            .first()
+    if not row and slug_or_id.isdigit():
+        row = db.query(Bath.bath_id).filter(Bath.bath_id == int(slug_or_id)).first()
 
-    if not bath:
+    if not row:
         raise HTTPException(status_code=404, detail="Баня не найдена")
+    return row[0]
 
-    incompatibility_map = load_incompatibility_map(
-        db,
-        [p.id for p in (bath.promotions or []) if p.is_active],
-    )
-    return _serialize_bath(bath, incompatibility_map)
+
+@router.get("/{slug_or_id}")
+def get_bath(slug_or_id: str, request: Request, db: Session = Depends(get_db)):
+    # Ключ кэша — bath_id: slug и id одной бани делят запись, произвольные пути её не создают
+    bath_id = _resolve_bath_id(db, slug_or_id)
+    return cached_catalog_response(request, db, ("bath", bath_id), lambda: _reload_and_serialize_bath(db, bath_id))
 
 # новые эндпоинты
 def _reload_and_serialize_bath(db: Session, bath_id: int) -> dict:
@@ -169,13 +164,14 @@ def create_bath(
         extra_guest_price=bath.extra_guest_price,
     )
     db.add(db_bath)
+    touch_catalog(db)
     db.commit()
     db.refresh(db_bath)
 
     # Добавляем фото
-    for url in bath.photo_urls:
-        db_photo = Photo(image_url=url, bath=db_bath)
-        db.add(db_photo)
+    photos = [Photo(image_url=url, bath=db_bath) for url in bath.photo_urls]
+    db.add_all(photos)
+    attach_photos(db, photos)
     
     # Добавляем связи с акциями
     for promo_id in bath.promotion_ids:
@@ -184,6 +180,7 @@ def create_bath(
             bath_promo = BathPromotion(bath_id=db_bath.bath_id, promotion_id=promo_id)
             db.add(bath_promo)
 
+    touch_catalog(db)
     db.commit()
     return _reload_and_serialize_bath(db, db_bath.bath_id)
 
@@ -237,17 +234,14 @@ def update_bath(
 
     # Обработка фото: если передано — заменяем все
     if photo_urls is not None:
-        # Удаляем старые
-        db.query(Photo).filter(Photo.bath_id == bath_id).delete()
-        # Добавляем новые
-        for url in photo_urls:
-            db_photo = Photo(image_url=url, bath=db_bath)
-            db.add(db_photo)
+        replace_photos(db, db.query(Photo).filter(Photo.bath_id == bath_id), photo_urls, bath=db_bath)
+        db_bath.updated_at = func.now()
     
     # Обновляем связи с акциями
     if promotion_ids is not None:
         # Удаляем старые связи
         db.query(BathPromotion).filter(BathPromotion.bath_id == bath_id).delete()
+        db_bath.updated_at = func.now()
         
         # Создаем новые связи
         for promo_id in promotion_ids:
@@ -256,7 +250,9 @@ def update_bath(
                 bath_promo = BathPromotion(bath_id=bath_id, promotion_id=promo_id)
                 db.add(bath_promo)
 
+    touch_catalog(db)
     db.commit()
+    invalidate_compiled_tariff(bath_id)
     return _reload_and_serialize_bath(db, bath_id)
 
 
@@ -267,8 +263,11 @@ def delete_bath(bath_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Баня не найдена")
 
     try:
+        detach_photos(db, db_bath.photos)
         db.delete(db_bath)
+        touch_catalog(db)
         db.commit()
+        invalidate_compiled_tariff(bath_id)
     except IntegrityError:
         db.rollback()
         raise HTTPException(
@@ -292,16 +291,11 @@ def delete_bath_photo(
     if not db_photo:
         raise HTTPException(status_code=404, detail="Фото не найдено")
     
-    # Delete the physical file if it exists
-    try:
-        filepath = Path(".") / db_photo.image_url.lstrip("/")
-        if filepath.exists():
-            filepath.unlink()
-    except Exception as e:
-        print(f"Warning: Could not delete file {db_photo.image_url}: {e}")
-    
-    # Delete from database
+    # Файлы удалит фоновая чистка, когда на них не останется ссылок
+    detach_photos(db, [db_photo])
+    db_photo.bath.updated_at = func.now()
     db.delete(db_photo)
+    touch_catalog(db)
     db.commit()
     
     return {"message": "Фото успешно удалено"}
@@ -333,38 +327,44 @@ async def upload_bath_photos(
     if not db_bath:
         raise HTTPException(status_code=404, detail="Баня не найдена")
 
+    # Изображения читаются в память и обрабатываются параллельно в пуле процессов;
+    # видео копируются на диск потоково и в память целиком не попадают
+    image_indexes = [i for i, file in enumerate(files) if not _is_video_upload(file)]
+    contents = [await files[i].read() for i in image_indexes]
+    processed = dict(zip(image_indexes, await process_images_to_variants(contents)))
+
     urls = []
-    for file in files:
-        content = await file.read()
+    photos = []
+    for index, file in enumerate(files):
+        variants = None
 
         if _is_video_upload(file):
             ext = Path(file.filename or "").suffix.lower()
             if ext not in VIDEO_EXTENSIONS:
                 ext = ".mp4"
-            file_hash = hashlib.sha256(content).hexdigest()[:16]
-            unique_filename = f"{file_hash}{ext}"
-            filepath = VIDEO_UPLOAD_DIR / unique_filename
-            with open(filepath, "wb") as f:
-                f.write(content)
+            unique_filename, _ = await save_upload_streaming(
+                file, VIDEO_UPLOAD_DIR, ext,
+                lock=lambda name: lock_paths(db, [f"/uploads/videos/baths/{name}"]),
+            )
             image_url = f"/uploads/videos/baths/{unique_filename}"
         else:
-            try:
-                webp_bytes = process_image_to_webp(content)
-            except Exception:
+            result = processed[index]
+            if isinstance(result, Exception):
                 raise HTTPException(
                     status_code=400,
                     detail=f"Не удалось обработать изображение: {file.filename}",
                 )
-            file_hash = hashlib.sha256(webp_bytes).hexdigest()[:16]
-            unique_filename = f"{file_hash}.webp"
-            filepath = UPLOAD_DIR / unique_filename
-            with open(filepath, "wb") as f:
-                f.write(webp_bytes)
-            image_url = f"/uploads/photos/baths/{unique_filename}"
-
-        db_photo = Photo(image_url=image_url, bath=db_bath)
+            image_url, variants = await run_in_threadpool(
+                save_image_variants, result, UPLOAD_DIR, "/uploads/photos/baths/", partial(lock_paths, db)
+            )
+
+        db_photo = Photo(image_url=image_url, variants=variants, bath=db_bath)
         db.add(db_photo)
+        photos.append(db_photo)
         urls.append(image_url)
 
+    await run_in_threadpool(attach_photos, db, photos)
+    db_bath.updated_at = func.now()
+    touch_catalog(db)
     db.commit()
     return urls
\ No newline at end of file
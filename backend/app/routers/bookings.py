@@ -3,9 +3,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional
+import base64
+import math
 
 from app import models, schemas, database
+from app.pricing_utils import quote_bath_costs
+from app.reservation_index import to_naive_local
+from app.availability_cache import availability_cache, span_dates
 
 router = APIRouter(prefix="/bookings", tags=["bookings"])
 
@@ -28,31 +33,254 @@ def get_booking_availability(
     if days < 1 or days > 3:
         raise HTTPException(status_code=400, detail="Параметр days должен быть от 1 до 3")
 
-    end_date = start_date + timedelta(days=days)
+    day_list = [start_date.date() + timedelta(days=i) for i in range(days)]
+    per_day = [availability_cache.get("availability", bath_id, d) for d in day_list]
+    if any(entry is None for entry in per_day):
+        generation = availability_cache.generation
+        end_date = start_date + timedelta(days=days)
+        reservations = (
+            db.query(
+                models.Reservation.reservation_id,
+                models.Reservation.start_datetime,
+                models.Reservation.end_datetime,
+            )
+            .filter(
+                models.Reservation.bath_id == bath_id,
+                models.Reservation.start_datetime < end_date,
+                models.Reservation.end_datetime > start_date,
+            )
+            .all()
+        )
+        by_day = {d: [] for d in day_list}
+        for rid, start, end in reservations:
+            for d in span_dates(start, end):
+                if d in by_day:
+                    by_day[d].append((rid, start.isoformat(), end.isoformat()))
+        for d, items in by_day.items():
+            availability_cache.set("availability", bath_id, d, items, generation=generation)
+        per_day = [by_day[d] for d in day_list]
+
+    occupied = {}
+    for items in per_day:
+        for rid, start, end in items:
+            occupied[rid] = (start, end)
+
+    return {
+        "bath_id": bath_id,
+        "date": date,
+        "days": days,
+        "occupied": [
+            {
+                "start_datetime": start,
+                "end_datetime": end,
+            }
+            for start, end in sorted(occupied.values())
+        ],
+    }
+
+MAX_GRID_DAYS = 60
+GRID_ENCODINGS = ("rle", "bitmap")
+
 
-    reservations = (
-        db.query(models.Reservation)
+def _grid_settings(db: Session) -> tuple:
+    rows = (
+        db.query(models.Settings)
+        .filter(models.Settings.key.in_(["booking_interval_minutes", "cleaning_time_minutes"]))
+        .all()
+    )
+    values = {r.key: r.value for r in rows}
+    interval = int(values.get("booking_interval_minutes") or 30)
+    cleaning = int(values.get("cleaning_time_minutes") if values.get("cleaning_time_minutes") is not None else 30)
+    return max(1, interval), max(0, cleaning)
+
+
+def _free_start_slots(
+    reservations: List[tuple],
+    range_start: datetime,
+    slot_count: int,
+    interval: timedelta,
+    duration: timedelta,
+    cleaning: timedelta,
+) -> bytearray:
+    """
+    1 — с начала слота можно забронировать минимальную длительность бани.
+    Старт t занят, если [t, t + duration + уборка) пересекается с [start, end + уборка) брони.
+    """
+    free = bytearray(b"\x01") * slot_count
+    for start, end in reservations:
+        blocked_after = (start - duration - cleaning - range_start) / interval
+        blocked_before = (end + cleaning - range_start) / interval
+        lo = max(0, math.floor(blocked_after) + 1)
+        hi = min(slot_count, math.ceil(blocked_before))
+        if lo < hi:
+            free[lo:hi] = bytes(hi - lo)
+    return free
+
+
+def _encode_slots(free: bytearray, encoding: str):
+    if encoding == "bitmap":
+        packed = bytearray((len(free) + 7) // 8)
+        for idx, flag in enumerate(free):
+            if flag:
+                packed[idx >> 3] |= 0x80 >> (idx & 7)
+        return base64.b64encode(bytes(packed)).decode("ascii")
+    # rle: [[первый свободный слот, длина серии], ...]
+    runs = []
+    idx = 0
+    size = len(free)
+    while idx < size:
+        if free[idx]:
+            run_start = idx
+            while idx < size and free[idx]:
+                idx += 1
+            runs.append([run_start, idx - run_start])
+        else:
+            idx += 1
+    return runs
+
+
+@router.get("/availability-grid")
+def get_availability_grid(
+    date: str,
+    days: int = 7,
+    bath_ids: Optional[str] = None,
+    encoding: str = "rle",
+    db: Session = Depends(database.get_db)
+):
+    """
+    Свободные времена начала брони для нескольких бань на период до MAX_GRID_DAYS дней.
+    Слот i начинается в date 00:00 + i * booking_interval_minutes; учитываются время
+    уборки и минимальная длительность брони каждой бани.
+    """
+    try:
+        range_start = datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="Неверный формат даты. Используйте YYYY-MM-DD"
+        )
+    if days < 1 or days > MAX_GRID_DAYS:
+        raise HTTPException(status_code=400, detail=f"Параметр days должен быть от 1 до {MAX_GRID_DAYS}")
+    if encoding not in GRID_ENCODINGS:
+        raise HTTPException(status_code=400, detail="Параметр encoding должен быть rle или bitmap")
+
+    bath_query = db.query(models.Bath)
+    if bath_ids:
+        try:
+            ids = [int(x) for x in bath_ids.split(",") if x.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="bath_ids — список ID через запятую")
+        bath_query = bath_query.filter(models.Bath.bath_id.in_(ids))
+    baths = bath_query.order_by(models.Bath.bath_id).all()
+    if not baths:
+        raise HTTPException(status_code=404, detail="Баня не найдена")
+
+    interval_minutes, cleaning_minutes = _grid_settings(db)
+    interval = timedelta(minutes=interval_minutes)
+    cleaning = timedelta(minutes=cleaning_minutes)
+    range_end = range_start + timedelta(days=days)
+    slot_count = (days * 24 * 60) // interval_minutes
+    durations = {
+        b.bath_id: timedelta(hours=max(1, int(getattr(b, "min_booking_hours", 1) or 1)))
+        for b in baths
+    }
+    max_duration = max(durations.values())
+
+    # Один запрос по диапазону для всех бань
+    rows = (
+        db.query(
+            models.Reservation.bath_id,
+            models.Reservation.start_datetime,
+            models.Reservation.end_datetime,
+        )
         .filter(
-            models.Reservation.bath_id == bath_id,
-            models.Reservation.start_datetime < end_date,
-            models.Reservation.end_datetime > start_date,
+            models.Reservation.bath_id.in_(list(durations)),
+            models.Reservation.start_datetime < range_end + max_duration + cleaning,
+            models.Reservation.end_datetime > range_start - cleaning,
         )
         .all()
     )
+    by_bath = {bath_id: [] for bath_id in durations}
+    for bath_id, start, end in rows:
+        by_bath[bath_id].append((to_naive_local(start), to_naive_local(end)))
 
     return {
-        "bath_id": bath_id,
         "date": date,
         "days": days,
-        "occupied": [
+        "interval_minutes": interval_minutes,
+        "cleaning_time_minutes": cleaning_minutes,
+        "slots_per_day": slot_count // days,
+        "encoding": encoding,
+        "baths": [
             {
-                "start_datetime": r.start_datetime.isoformat(),
-                "end_datetime": r.end_datetime.isoformat(),
+                "bath_id": b.bath_id,
+                "min_booking_hours": int(durations[b.bath_id].total_seconds() // 3600),
+                "free": _encode_slots(
+                    _free_start_slots(
+                        by_bath[b.bath_id], range_start, slot_count, interval,
+                        durations[b.bath_id], cleaning,
+                    ),
+                    encoding,
+                ),
             }
-            for r in reservations
+            for b in baths
         ],
     }
 
+
+MAX_QUOTE_ITEMS = 500
+# Стоимость считается по дням слота — длина слота ограничена, как период сетки
+MAX_QUOTE_DAYS = 7
+
+
+@router.post("/quote", response_model=List[schemas.BookingQuoteOut])
+def quote_bookings(payload: schemas.BookingQuoteRequest, db: Session = Depends(database.get_db)):
+    """Стоимость сразу для многих слотов и бань: каждая баня читается из БД один раз."""
+    if len(payload.items) > MAX_QUOTE_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Слишком много слотов в запросе (максимум {MAX_QUOTE_ITEMS})"
+        )
+    if not payload.items:
+        return []
+
+    parsed = []
+    for item in payload.items:
+        try:
+            start_dt = datetime.fromisoformat(item.start_datetime)
+            end_dt = datetime.fromisoformat(item.end_datetime)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Неверный формат даты. Используйте ISO: YYYY-MM-DDTHH:MM:SS")
+        # Даты с часовым поясом и без можно смешивать — сравниваем в локальном времени
+        start_dt = to_naive_local(start_dt)
+        end_dt = to_naive_local(end_dt)
+        if start_dt >= end_dt:
+            raise HTTPException(status_code=400, detail="Время окончания должно быть позже начала")
+        if end_dt - start_dt > timedelta(days=MAX_QUOTE_DAYS):
+            raise HTTPException(status_code=400, detail=f"Слот не может быть длиннее {MAX_QUOTE_DAYS} дней")
+        parsed.append((item.bath_id, start_dt, end_dt, item.guests))
+
+    bath_ids = {item.bath_id for item in payload.items}
+    baths = {
+        bath.bath_id: bath
+        for bath in db.query(models.Bath).filter(models.Bath.bath_id.in_(bath_ids)).all()
+    }
+    if len(baths) != len(bath_ids):
+        raise HTTPException(status_code=404, detail="Баня не найдена")
+
+    quotes = quote_bath_costs(baths, parsed)
+    return [
+        {
+            "bath_id": item.bath_id,
+            "start_datetime": item.start_datetime,
+            "end_datetime": item.end_datetime,
+            "guests": item.guests,
+            **quote,
+        }
+        for item, quote in zip(payload.items, quotes)
+    ]
+
+
 @router.post("/", response_model=schemas.BookingOut)
 def create_booking(booking: schemas.BookingCreate, db: Session = Depends(database.get_db)):
     try:
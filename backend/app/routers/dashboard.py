@@ -2,104 +2,109 @@
 
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract, and_
+from sqlalchemy import func, extract, and_, select
 from datetime import datetime, timedelta, date
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import os
 
 from app import models, database
+from app.ttl_cache import SingleFlightTTLCache
+from app.pricing_utils import get_compiled_tariff
+from app.reservation_index import reservation_index, to_naive_local
 
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
+STATISTICS_CACHE_SECONDS = float(os.getenv("DASHBOARD_STATISTICS_CACHE_SECONDS", "5"))
+_statistics_cache = SingleFlightTTLCache(STATISTICS_CACHE_SECONDS)
 
-@router.get("/statistics")
-def get_dashboard_statistics(db: Session = Depends(database.get_db)) -> Dict[str, Any]:
-    """Получить статистику для дашборда"""
-    
-    today = date.today()
+
+def _stats_sum(column, since: date, until: Optional[date] = None):
+    """SUM по сводке daily_bath_stats за дни [since, until]."""
+    condition = models.DailyBathStat.day >= since
+    if until is not None:
+        condition = and_(condition, models.DailyBathStat.day <= until)
+    return func.coalesce(func.sum(column).filter(condition), 0)
+
+
+def _count_subquery(model, *filters):
+    return select(func.count()).select_from(model).where(*filters).scalar_subquery()
+
+
+def _compute_statistics(db: Session, today: date) -> Dict[str, Any]:
     start_of_week = today - timedelta(days=today.weekday())
     start_of_month = today.replace(day=1)
-    
-    # Статистика бронирований
-    reservations_today = db.query(models.Reservation).filter(
-        func.date(models.Reservation.start_datetime) == today
-    ).count()
-    
-    reservations_this_week = db.query(models.Reservation).filter(
-        func.date(models.Reservation.start_datetime) >= start_of_week
-    ).count()
-    
-    reservations_this_month = db.query(models.Reservation).filter(
-        func.date(models.Reservation.start_datetime) >= start_of_month
-    ).count()
-    
-    # Доход сегодня
-    revenue_today = db.query(func.coalesce(func.sum(models.Reservation.total_cost), 0)).filter(
-        func.date(models.Reservation.start_datetime) == today
-    ).scalar()
-    
-    # Доход за неделю
-    revenue_this_week = db.query(func.coalesce(func.sum(models.Reservation.total_cost), 0)).filter(
-        func.date(models.Reservation.start_datetime) >= start_of_week
-    ).scalar()
-    
-    # Доход за месяц
-    revenue_this_month = db.query(func.coalesce(func.sum(models.Reservation.total_cost), 0)).filter(
-        func.date(models.Reservation.start_datetime) >= start_of_month
-    ).scalar()
-    
-    # Общее количество клиентов
-    total_clients = db.query(models.Client).count()
-    
-    # Количество бань
-    total_baths = db.query(models.Bath).count()
-    
-    # Заявки с сайта (непрочитанные)
-    unread_bookings = db.query(models.Booking).filter(
-        models.Booking.is_read == False
-    ).count()
-    
-    # Всего заявок с сайта
-    total_bookings = db.query(models.Booking).count()
-    
+    stats = models.DailyBathStat
+
+    # Один запрос: брони и доход — FILTER-агрегаты по сводке daily_bath_stats
+    # (неделя и месяц без верхней границы, как раньше), остальное — скалярные подзапросы
+    row = db.execute(
+        select(
+            _stats_sum(stats.reservation_count, today, today).label("reservations_today"),
+            _stats_sum(stats.reservation_count, start_of_week).label("reservations_this_week"),
+            _stats_sum(stats.reservation_count, start_of_month).label("reservations_this_month"),
+            _stats_sum(stats.revenue, today, today).label("revenue_today"),
+            _stats_sum(stats.revenue, start_of_week).label("revenue_this_week"),
+            _stats_sum(stats.revenue, start_of_month).label("revenue_this_month"),
+            _count_subquery(models.Client).label("total_clients"),
+            _count_subquery(models.Bath).label("total_baths"),
+            _count_subquery(models.Booking, models.Booking.is_read == False).label("unread_bookings"),
+            _count_subquery(models.Booking).label("total_bookings"),
+        ).where(stats.day >= min(start_of_week, start_of_month))
+    ).one()
+
     return {
         "reservations": {
-            "today": reservations_today,
-            "this_week": reservations_this_week,
-            "this_month": reservations_this_month,
+            "today": row.reservations_today,
+            "this_week": row.reservations_this_week,
+            "this_month": row.reservations_this_month,
         },
         "revenue": {
-            "today": revenue_today,
-            "this_week": revenue_this_week,
-            "this_month": revenue_this_month,
+            "today": row.revenue_today,
+            "this_week": row.revenue_this_week,
+            "this_month": row.revenue_this_month,
         },
         "clients": {
-            "total": total_clients,
+            "total": row.total_clients,
         },
         "baths": {
-            "total": total_baths,
+            "total": row.total_baths,
         },
         "bookings": {
-            "unread": unread_bookings,
-            "total": total_bookings,
+            "unread": row.unread_bookings,
+            "total": row.total_bookings,
         }
     }
 
 
+@router.get("/statistics")
+def get_dashboard_statistics(db: Session = Depends(database.get_db)) -> Dict[str, Any]:
+    """
+    Получить статистику для дашборда.
+    Её опрашивает каждая открытая вкладка админки, поэтому ответ кэшируется на
+    STATISTICS_CACHE_SECONDS и пересчитывается одним запросом.
+    """
+    today = date.today()
+    return _statistics_cache.get_or_compute(today, lambda: _compute_statistics(db, today))
+
+
 @router.get("/revenue-chart")
 def get_revenue_chart_data(period: str = "month", db: Session = Depends(database.get_db)) -> List[Dict[str, Any]]:
     """Получить данные для графика дохода за выбранный период"""
     
     end_date = date.today()
     chart_data = []
+    stats = models.DailyBathStat
     
     if period == "day":
-        # Доход по часам за сегодня
-        start_date = end_date
+        # Доход по часам за сегодня: сводка дневная, поэтому брони одного дня
+        # читаются напрямую по диапазону start_datetime (индекс, а не func.date)
+        start_of_day = datetime.combine(end_date, datetime.min.time())
         revenue_by_hour = db.query(
             extract('hour', models.Reservation.start_datetime).label('hour'),
             func.coalesce(func.sum(models.Reservation.total_cost), 0).label('revenue')
         ).filter(
-            func.date(models.Reservation.start_datetime) == end_date
+            models.Reservation.start_datetime >= start_of_day,
+            models.Reservation.start_datetime < start_of_day + timedelta(days=1)
         ).group_by(
             extract('hour', models.Reservation.start_datetime)
         ).all()
@@ -115,11 +120,11 @@ def get_revenue_chart_data(period: str = "month", db: Session = Depends(database
         # Доход по месяцам за последние 12 месяцев
         start_date = (end_date.replace(day=1) - timedelta(days=335)).replace(day=1)
         revenue_by_month = db.query(
-            extract('year', models.Reservation.start_datetime).label('year'),
-            extract('month', models.Reservation.start_datetime).label('month'),
-            func.coalesce(func.sum(models.Reservation.total_cost), 0).label('revenue')
+            extract('year', stats.day).label('year'),
+            extract('month', stats.day).label('month'),
+            func.coalesce(func.sum(stats.revenue), 0).label('revenue')
         ).filter(
-            func.date(models.Reservation.start_datetime) >= start_date
+            stats.day >= start_date
         ).group_by(
             'year', 'month'
         ).all()
@@ -145,12 +150,12 @@ def get_revenue_chart_data(period: str = "month", db: Session = Depends(database
         start_date = end_date - timedelta(days=days - 1)
         
         revenue_by_day = db.query(
-            func.date(models.Reservation.start_datetime).label('date'),
-            func.coalesce(func.sum(models.Reservation.total_cost), 0).label('revenue')
+            stats.day.label('date'),
+            func.coalesce(func.sum(stats.revenue), 0).label('revenue')
         ).filter(
-            func.date(models.Reservation.start_datetime) >= start_date
+            stats.day >= start_date
         ).group_by(
-            func.date(models.Reservation.start_datetime)
+            stats.day
         ).all()
         
         rev_dict = {str(row.date): row.revenue for row in revenue_by_day}
@@ -172,18 +177,19 @@ def get_reservations_chart_data(days: int = 30, db: Session = Depends(database.g
     
     end_date = date.today()
     start_date = end_date - timedelta(days=days - 1)
+    stats = models.DailyBathStat
     
-    # Получаем количество бронирований по дням
+    # Получаем количество бронирований по дням из сводки
     reservations_by_day = db.query(
-        func.date(models.Reservation.start_datetime).label('date'),
-        func.count(models.Reservation.reservation_id).label('count')
+        stats.day.label('date'),
+        func.sum(stats.reservation_count).label('count')
     ).filter(
-        func.date(models.Reservation.start_datetime) >= start_date,
-        func.date(models.Reservation.start_datetime) <= end_date
+        stats.day >= start_date,
+        stats.day <= end_date
     ).group_by(
-        func.date(models.Reservation.start_datetime)
+        stats.day
     ).order_by(
-        func.date(models.Reservation.start_datetime)
+        stats.day
     ).all()
     
     # Преобразуем в dict для быстрого доступа
@@ -247,23 +253,27 @@ def get_popular_baths(db: Session = Depends(database.get_db)) -> List[Dict[str,
     """Получить самые популярные бани за последний месяц"""
     
     start_of_month = date.today().replace(day=1)
+    stats = models.DailyBathStat
     
-    # Получаем статистику по баням
+    # Получаем статистику по баням из сводки
+    reservation_count = func.sum(stats.reservation_count)
     bath_stats = db.query(
         models.Bath.bath_id,
         models.Bath.name,
-        func.count(models.Reservation.reservation_id).label('reservation_count'),
-        func.coalesce(func.sum(models.Reservation.total_cost), 0).label('total_revenue')
+        reservation_count.label('reservation_count'),
+        func.coalesce(func.sum(stats.revenue), 0).label('total_revenue')
     ).join(
-        models.Reservation,
-        models.Bath.bath_id == models.Reservation.bath_id
+        stats,
+        models.Bath.bath_id == stats.bath_id
     ).filter(
-        func.date(models.Reservation.start_datetime) >= start_of_month
+        stats.day >= start_of_month
     ).group_by(
         models.Bath.bath_id,
         models.Bath.name
+    ).having(
+        reservation_count > 0
     ).order_by(
-        func.count(models.Reservation.reservation_id).desc()
+        reservation_count.desc()
     ).all()
     
     return [
@@ -277,6 +287,137 @@ def get_popular_baths(db: Session = Depends(database.get_db)) -> List[Dict[str,
     ]
 
 
+MAX_HEATMAP_DAYS = 366
+
+
+def _minute_prefix(prices: List[int]) -> List[int]:
+    """prefix[m] — сумма почасовых цен минут 0..m-1 суток."""
+    prefix = [0]
+    for price in prices:
+        prefix.append(prefix[-1] + price)
+    return prefix
+
+
+def _spread_by_hour(cells, start: datetime, end: datetime, field: str, price_prefix=None) -> None:
+    """
+    Раскладывает интервал [start, end) по ячейкам (день недели, час): в field — минуты,
+    в tariff_revenue — стоимость по тарифу (если передан price_prefix). Число шагов —
+    число затронутых часов, а не минут.
+    """
+    current = start
+    while current < end:
+        hour_start = current.replace(minute=0, second=0, microsecond=0)
+        chunk_end = min(hour_start + timedelta(hours=1), end)
+        minutes = (chunk_end - current).total_seconds() / 60
+        cell = cells[current.weekday()][current.hour]
+        cell[field] += minutes
+        if price_prefix is not None:
+            prefix = price_prefix[current.weekday() >= 4]
+            first = current.hour * 60 + current.minute
+            last = first + int(minutes)
+            # Цены — за час, поэтому сумма по минутам делится на 60
+            cell["tariff_revenue"] += (prefix[last] - prefix[first]) / 60
+        current = chunk_end
+
+
+@router.get("/occupancy-heatmap")
+def get_occupancy_heatmap(
+    date_from: date,
+    date_to: date,
+    bath_id: Optional[int] = None,
+    db: Session = Depends(database.get_db)
+) -> Dict[str, Any]:
+    """
+    Загрузка бань по ячейкам «день недели × час» за период [date_from, date_to].
+    utilization — забронированные минуты / минуты периода в ячейке; blocked_minutes —
+    уборка после броней (время из настроек). tariff_rate и tariff_revenue — цена часа
+    и выручка по тарифам bath.time_tariffs, чтобы сравнивать загрузку с тарифной сеткой.
+    """
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from не может быть больше date_to")
+    if (date_to - date_from).days + 1 > MAX_HEATMAP_DAYS:
+        raise HTTPException(status_code=400, detail=f"Период не может быть длиннее {MAX_HEATMAP_DAYS} дней")
+
+    range_start = datetime.combine(date_from, datetime.min.time())
+    range_end = datetime.combine(date_to + timedelta(days=1), datetime.min.time())
+    cleaning = timedelta(minutes=reservation_index.cleaning_minutes(db))
+
+    baths_query = db.query(models.Bath)
+    if bath_id is not None:
+        baths_query = baths_query.filter(models.Bath.bath_id == bath_id)
+    baths = baths_query.order_by(models.Bath.bath_id).all()
+    if bath_id is not None and not baths:
+        raise HTTPException(status_code=404, detail="Баня не найдена")
+
+    reservations_query = db.query(
+        models.Reservation.bath_id,
+        models.Reservation.start_datetime,
+        models.Reservation.end_datetime,
+    ).filter(
+        models.Reservation.start_datetime < range_end,
+        models.Reservation.end_datetime > range_start - cleaning,
+    )
+    if bath_id is not None:
+        reservations_query = reservations_query.filter(models.Reservation.bath_id == bath_id)
+    by_bath: Dict[int, list] = {}
+    for res_bath_id, start, end in reservations_query.all():
+        by_bath.setdefault(res_bath_id, []).append((to_naive_local(start), to_naive_local(end)))
+
+    # Минут периода в каждой ячейке: число таких дней недели в периоде × 60
+    weekday_counts = [0] * 7
+    for offset in range((date_to - date_from).days + 1):
+        weekday_counts[(date_from + timedelta(days=offset)).weekday()] += 1
+
+    result = []
+    for bath in baths:
+        compiled = get_compiled_tariff(bath)
+        price_prefix = (_minute_prefix(compiled.prices[0]), _minute_prefix(compiled.prices[1]))
+        cells = [
+            [{"booked_minutes": 0.0, "blocked_minutes": 0.0, "tariff_revenue": 0.0} for _ in range(24)]
+            for _ in range(7)
+        ]
+        for start, end in by_bath.get(bath.bath_id, []):
+            booked_start, booked_end = max(start, range_start), min(end, range_end)
+            if booked_start < booked_end:
+                _spread_by_hour(cells, booked_start, booked_end, "booked_minutes", price_prefix)
+            blocked_start, blocked_end = max(end, range_start), min(end + cleaning, range_end)
+            if blocked_start < blocked_end:
+                _spread_by_hour(cells, blocked_start, blocked_end, "blocked_minutes")
+
+        bath_cells = []
+        total_open = total_booked = 0.0
+        for weekday in range(7):
+            prices = compiled.prices[weekday >= 4]
+            for hour in range(24):
+                cell = cells[weekday][hour]
+                open_minutes = weekday_counts[weekday] * 60
+                total_open += open_minutes
+                total_booked += cell["booked_minutes"]
+                bath_cells.append({
+                    "weekday": weekday,
+                    "hour": hour,
+                    "open_minutes": open_minutes,
+                    "booked_minutes": round(cell["booked_minutes"], 1),
+                    "blocked_minutes": round(cell["blocked_minutes"], 1),
+                    "utilization": round(cell["booked_minutes"] / open_minutes, 4) if open_minutes else 0.0,
+                    "tariff_rate": round(sum(prices[hour * 60:(hour + 1) * 60]) / 60, 2),
+                    "tariff_revenue": round(cell["tariff_revenue"], 2),
+                })
+        result.append({
+            "bath_id": bath.bath_id,
+            "name": bath.name,
+            "utilization": round(total_booked / total_open, 4) if total_open else 0.0,
+            "cells": bath_cells,
+        })
+
+    return {
+        "date_from": date_from.isoformat(),
+        "date_to": date_to.isoformat(),
+        "cleaning_minutes": cleaning.total_seconds() / 60,
+        "baths": result,
+    }
+
+
 @router.get("/recent-activity")
 def get_recent_activity(limit: int = 10, db: Session = Depends(database.get_db)) -> List[Dict[str, Any]]:
     """Получить последнюю активность из audit logs"""
@@ -6,6 +6,7 @@ from app.database import get_db
 from app.models import EntranceDocument, EntranceDocumentItem, Product, OrganizationAccount
 from app.schemas import EntranceDocumentCreate, EntranceDocumentRead
 from app.pricing import get_markup_percent, price_from_purchase
+from app.catalog_cache import touch_catalog
 
 router = APIRouter(prefix="/admin/documents/entrance", tags=["Documents - Entrance"])
 
@@ -44,6 +45,8 @@ def _apply_stock_from_items(db: Session, items):
             product.last_purchase_price = item.purchase_price
             product.price = price_from_purchase(item.purchase_price, markup)
             product.is_price_manual = False
+    # Цены товаров видны на витрине
+    touch_catalog(db)
 
 
 @router.get("/", response_model=List[EntranceDocumentRead])
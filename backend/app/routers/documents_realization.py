@@ -4,6 +4,9 @@ from typing import List
 from app.database import get_db
 from app.models import RealizationDocument, RealizationDocumentItem, Product, Reservation
 from app.schemas import RealizationDocumentRead
+from app.reservation_index import reservation_index
+from app.availability_cache import invalidate_reservation_span
+from app.daily_stats import refresh_daily_stats
 
 router = APIRouter(prefix="/admin/documents/realization", tags=["Documents - Realization"])
 
@@ -52,13 +55,26 @@ def delete_realization_document(doc_id: int, db: Session = Depends(get_db)):
                 product.total_quantity += item.quantity
         
         # Удаляем бронь
+        reservation_span = db.query(
+            Reservation.bath_id, Reservation.start_datetime, Reservation.end_datetime
+        ).filter(
+            Reservation.reservation_id == doc.reservation_id
+        ).first()
         db.query(Reservation).filter(
             Reservation.reservation_id == doc.reservation_id
         ).delete()
         
         # Удаляем документ и элементы
+        reservation_id = doc.reservation_id
         db.delete(doc)
+        if reservation_span is not None:
+            db.flush()
+            refresh_daily_stats(db, (reservation_span[0], reservation_span[1]))
         db.commit()
+        reservation_index.discard(reservation_id)
+        if reservation_span is not None:
+            bath_id, start_dt, end_dt = reservation_span
+            invalidate_reservation_span(bath_id, (start_dt, end_dt))
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -2,10 +2,12 @@ from datetime import date, timedelta
 from typing import List, Optional, Tuple
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import case, func, literal, select, union_all
 from sqlalchemy.orm import Session, joinedload
 
 from app import database, models, schemas
 from app.auth import get_current_user
+from app.pagination import after_cursor, decode_cursor, order_by_keys, page_of
 
 
 router = APIRouter(prefix="/finance", tags=["finance"])
@@ -102,6 +104,83 @@ def delete_account(
     return
 
 
+# Порядок источников при равной дате — часть ключа курсора (id у таблиц пересекаются)
+SOURCE_RANK = {"entrance": 0, "realization": 1}
+
+
+def _ledger(with_titles: bool = False):
+    """
+    Единая лента операций (UNION ALL поступлений и реализаций) как подзапрос.
+    Фильтры по date/account_id PostgreSQL опускает внутрь каждой ветки.
+    Названия (JOIN поставщиков и бань) нужны только для списка операций.
+    """
+    entrance = models.EntranceDocument
+    realization = models.RealizationDocument
+
+    entrance_columns = [
+        literal("entrance").label("source"),
+        literal(SOURCE_RANK["entrance"]).label("source_rank"),
+        literal("expense").label("operation_type"),
+        entrance.id.label("id"),
+        entrance.date.label("date"),
+        func.coalesce(entrance.total_amount, 0).label("amount"),
+        entrance.account_id.label("account_id"),
+    ]
+    realization_columns = [
+        literal("realization").label("source"),
+        literal(SOURCE_RANK["realization"]).label("source_rank"),
+        # Отрицательные realization (корректировки по броням) считаем расходом
+        case((realization.total_amount < 0, "expense"), else_="income").label("operation_type"),
+        realization.id.label("id"),
+        realization.date.label("date"),
+        func.abs(func.coalesce(realization.total_amount, 0)).label("amount"),
+        realization.account_id.label("account_id"),
+    ]
+    if with_titles:
+        entrance_columns += [
+            func.coalesce(models.Partner.supplier_name, "Поступление").label("title"),
+            entrance.comment.label("subtitle"),
+        ]
+        realization_columns += [
+            case(
+                (realization.total_amount < 0, func.coalesce(realization.client_name, "Корректировка по брони")),
+                else_=func.coalesce(realization.client_name, "Реализация"),
+            ).label("title"),
+            case(
+                (
+                    realization.total_amount < 0,
+                    case(
+                        (models.Bath.name.isnot(None), literal("Отмена закрытия • ") + models.Bath.name),
+                        else_="Отмена закрытия",
+                    ),
+                ),
+                else_=models.Bath.name,
+            ).label("subtitle"),
+        ]
+
+    entrance_select = select(*entrance_columns).where(entrance.status == "posted")
+    realization_select = select(*realization_columns)
+    if with_titles:
+        entrance_select = entrance_select.outerjoin(
+            models.Partner, models.Partner.partner_id == entrance.supplier_id
+        )
+        realization_select = realization_select.outerjoin(
+            models.Bath, models.Bath.bath_id == realization.bath_id
+        )
+    return union_all(entrance_select, realization_select).subquery("finance_ledger")
+
+
+def _ledger_filters(ledger, period_start, period_end, account_id):
+    filters = []
+    if period_start:
+        filters.append(ledger.c.date >= period_start)
+    if period_end:
+        filters.append(ledger.c.date <= period_end)
+    if account_id is not None:
+        filters.append(ledger.c.account_id == account_id)
+    return filters
+
+
 @router.get("/operations", response_model=schemas.FinanceOperationsResponse)
 def get_operations(
     operation_type: str = Query("all", pattern="^(all|income|expense)$"),
@@ -111,83 +190,45 @@ def get_operations(
     account_id: Optional[int] = None,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user),
 ):
+    """
+    Операции от новых к старым: сортировка, LIMIT и COUNT выполняются в PostgreSQL
+    по ленте _ledger. next_cursor — для следующей страницы (с cursor параметр skip не используется).
+    """
     period_start, period_end = _resolve_period(period, date_from, date_to)
-    operations = []
-
-    if operation_type in ("all", "expense"):
-        query = db.query(models.EntranceDocument).options(joinedload(models.EntranceDocument.supplier))
-        query = query.filter(models.EntranceDocument.status == "posted")
-        if period_start:
-            query = query.filter(models.EntranceDocument.date >= period_start)
-        if period_end:
-            query = query.filter(models.EntranceDocument.date <= period_end)
-        if account_id is not None:
-            query = query.filter(models.EntranceDocument.account_id == account_id)
-        for row in query.all():
-            operations.append(
-                schemas.FinanceOperationOut(
-                    source="entrance",
-                    operation_type="expense",
-                    id=row.id,
-                    date=row.date,
-                    amount=float(row.total_amount or 0),
-                    title=row.supplier.supplier_name if row.supplier else "Поступление",
-                    subtitle=row.comment,
-                    account_id=row.account_id,
-                )
-            )
-        # Корректировки по броням: отрицательные realization считаем расходом
-        realization_expense_query = db.query(models.RealizationDocument).options(joinedload(models.RealizationDocument.bath))
-        if period_start:
-            realization_expense_query = realization_expense_query.filter(models.RealizationDocument.date >= period_start)
-        if period_end:
-            realization_expense_query = realization_expense_query.filter(models.RealizationDocument.date <= period_end)
-        if account_id is not None:
-            realization_expense_query = realization_expense_query.filter(models.RealizationDocument.account_id == account_id)
-        realization_expense_query = realization_expense_query.filter(models.RealizationDocument.total_amount < 0)
-        for row in realization_expense_query.all():
-            operations.append(
-                schemas.FinanceOperationOut(
-                    source="realization",
-                    operation_type="expense",
-                    id=row.id,
-                    date=row.date,
-                    amount=abs(float(row.total_amount or 0)),
-                    title=row.client_name or "Корректировка по брони",
-                    subtitle=(f"Отмена закрытия • {row.bath.name}" if row.bath else "Отмена закрытия"),
-                    account_id=row.account_id,
-                )
-            )
+    ledger = _ledger(with_titles=True)
+    filters = _ledger_filters(ledger, period_start, period_end, account_id)
+    if operation_type != "all":
+        filters.append(ledger.c.operation_type == operation_type)
 
-    if operation_type in ("all", "income"):
-        query = db.query(models.RealizationDocument).options(joinedload(models.RealizationDocument.bath))
-        if period_start:
-            query = query.filter(models.RealizationDocument.date >= period_start)
-        if period_end:
-            query = query.filter(models.RealizationDocument.date <= period_end)
-        if account_id is not None:
-            query = query.filter(models.RealizationDocument.account_id == account_id)
-        query = query.filter(models.RealizationDocument.total_amount >= 0)
-        for row in query.all():
-            operations.append(
-                schemas.FinanceOperationOut(
-                    source="realization",
-                    operation_type="income",
-                    id=row.id,
-                    date=row.date,
-                    amount=abs(float(row.total_amount or 0)),
-                    title=row.client_name or "Реализация",
-                    subtitle=row.bath.name if row.bath else None,
-                    account_id=row.account_id,
-                )
-            )
+    total = db.execute(select(func.count()).select_from(ledger).where(*filters)).scalar() or 0
 
-    operations.sort(key=lambda item: (item.date, item.id), reverse=True)
-    total = len(operations)
-    return schemas.FinanceOperationsResponse(items=operations[skip: skip + limit], total=total)
+    key_columns = (ledger.c.date, ledger.c.source_rank, ledger.c.id)
+    query = select(ledger).where(*filters)
+    if cursor:
+        query = query.where(after_cursor(key_columns, decode_cursor(cursor, len(key_columns))))
+    else:
+        query = query.offset(skip)
+    rows = db.execute(query.order_by(*order_by_keys(key_columns)).limit(limit + 1)).all()
+    rows, next_cursor = page_of(rows, limit, lambda row: (row.date, row.source_rank, row.id))
+
+    items = [
+        schemas.FinanceOperationOut(
+            source=row.source,
+            operation_type=row.operation_type,
+            id=row.id,
+            date=row.date,
+            amount=float(row.amount or 0),
+            title=row.title,
+            subtitle=row.subtitle,
+            account_id=row.account_id,
+        )
+        for row in rows
+    ]
+    return schemas.FinanceOperationsResponse(items=items, total=total, next_cursor=next_cursor)
 
 
 @router.get("/summary", response_model=schemas.FinanceSummaryOut)
@@ -200,28 +241,16 @@ def get_summary(
     current_user: models.User = Depends(get_current_user),
 ):
     period_start, period_end = _resolve_period(period, date_from, date_to)
+    ledger = _ledger()
 
-    expense_query = db.query(models.EntranceDocument).filter(models.EntranceDocument.status == "posted")
-    income_query = db.query(models.RealizationDocument).filter(models.RealizationDocument.total_amount >= 0)
-    realization_expense_query = db.query(models.RealizationDocument).filter(models.RealizationDocument.total_amount < 0)
-
-    if period_start:
-        expense_query = expense_query.filter(models.EntranceDocument.date >= period_start)
-        income_query = income_query.filter(models.RealizationDocument.date >= period_start)
-        realization_expense_query = realization_expense_query.filter(models.RealizationDocument.date >= period_start)
-    if period_end:
-        expense_query = expense_query.filter(models.EntranceDocument.date <= period_end)
-        income_query = income_query.filter(models.RealizationDocument.date <= period_end)
-        realization_expense_query = realization_expense_query.filter(models.RealizationDocument.date <= period_end)
-    if account_id is not None:
-        expense_query = expense_query.filter(models.EntranceDocument.account_id == account_id)
-        income_query = income_query.filter(models.RealizationDocument.account_id == account_id)
-        realization_expense_query = realization_expense_query.filter(models.RealizationDocument.account_id == account_id)
-
-    entrance_expense = sum(float(item.total_amount or 0) for item in expense_query.all())
-    realization_expense = sum(abs(float(item.total_amount or 0)) for item in realization_expense_query.all())
-    expense = entrance_expense + realization_expense
-    income = sum(float(item.total_amount or 0) for item in income_query.all())
+    income_sum, expense_sum = db.execute(
+        select(
+            func.coalesce(func.sum(ledger.c.amount).filter(ledger.c.operation_type == "income"), 0),
+            func.coalesce(func.sum(ledger.c.amount).filter(ledger.c.operation_type == "expense"), 0),
+        ).where(*_ledger_filters(ledger, period_start, period_end, account_id))
+    ).one()
+    income = float(income_sum)
+    expense = float(expense_sum)
 
     return schemas.FinanceSummaryOut(
         income=income,
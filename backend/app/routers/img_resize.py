@@ -0,0 +1,188 @@
+"""
+Уменьшенные копии фото по запросу: /img-resize/{w}/{path}.
+
+path — файл внутри uploads/photos, w — одна из разрешённых ширин. Первый запрос
+сжимает оригинал через process_image_to_webp и кладёт результат в дисковый кэш
+(имя — SHA-256 от пути, размера и mtime оригинала и параметров), следующие отдают
+готовый файл. Он читается в память целиком: вытеснение может удалить его в любой
+момент, и тогда копия просто собирается заново. Загруженные фото названы по хэшу
+содержимого и не меняются, поэтому ответ кэшируется клиентом как immutable. Размер кэша ограничен; при переполнении
+удаляются давно не запрашивавшиеся файлы (mtime обновляется при каждом попадании).
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+
+from app.image_utils import ImageProcessingError, process_image_to_webp_async
+
+router = APIRouter(tags=["images"])
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+PHOTOS_DIR = (BASE_DIR / "uploads" / "photos").resolve()
+RESIZE_CACHE_DIR = Path(os.getenv("IMAGE_RESIZE_CACHE_DIR", str(BASE_DIR / "cache" / "img-resize")))
+RESIZE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_RESIZE_CACHE_MB", "512")) * 1024 * 1024
+RESIZE_WIDTHS = {
+    int(w) for w in os.getenv("IMAGE_RESIZE_WIDTHS", "160,320,480,640,960,1280,1920").split(",") if w.strip()
+}
+RESIZE_QUALITY = 82
+SOURCE_EXTENSIONS = {".webp", ".jpg", ".jpeg", ".png"}
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class ResizeCache:
+    """Дисковый кэш с ограничением размера; вытеснение по давности последнего обращения."""
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None
+        self._pending: Dict[str, asyncio.Lock] = {}
+
+    def path_for(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.webp"
+
+    def touch(self, path: Path) -> None:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _scan(self):
+        files = []
+        for path in self.directory.glob("*/*.webp"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def store(self, path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._scan())
+            else:
+                self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Освобождаем с запасом до 90% лимита, чтобы не сканировать каталог на каждой записи
+        files = sorted(self._scan())
+        total = sum(size for _, size, _ in files)
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except OSError as e:
+                print(f"Image resize cache eviction error for {path}: {e}")
+        self._total_bytes = total
+
+    def key_lock(self, key: str) -> asyncio.Lock:
+        # Одновременные промахи по одному ключу обрабатывают изображение один раз
+        return self._pending.setdefault(key, asyncio.Lock())
+
+    def release_key(self, key: str, lock: asyncio.Lock) -> None:
+        if not lock.locked() and self._pending.get(key) is lock:
+            del self._pending[key]
+
+
+resize_cache = ResizeCache(RESIZE_CACHE_DIR, RESIZE_CACHE_MAX_BYTES)
+
+
+def _resolve_source(path: str) -> Path:
+    source = (PHOTOS_DIR / path).resolve()
+    if PHOTOS_DIR not in source.parents or source.suffix.lower() not in SOURCE_EXTENSIONS:
+        raise HTTPException(status_code=404, detail="Изображение не найдено")
+    if not source.is_file():
+        raise HTTPException(status_code=404, detail="Изображение не найдено")
+    return source
+
+
+def _cache_key(source: Path, width: int) -> str:
+    stat = source.stat()
+    identity = f"{source.relative_to(PHOTOS_DIR)}|{stat.st_size}|{stat.st_mtime_ns}|{width}|{RESIZE_QUALITY}|webp"
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+
+def _source_and_key(path: str, width: int) -> Tuple[Path, str]:
+    """Файловые операции — вызывать в threadpool."""
+    source = _resolve_source(path)
+    try:
+        return source, _cache_key(source, width)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Изображение не найдено")
+
+
+def _read_cached(path: Path) -> Optional[bytes]:
+    """
+    Содержимое готового файла или None. Читается целиком: вытеснение может удалить
+    файл в любой момент, а уменьшенные копии небольшие.
+    """
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    resize_cache.touch(path)
+    return data
+
+
+def _read_source(source: Path) -> bytes:
+    try:
+        return source.read_bytes()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Изображение не найдено")
+
+
+def _cached_response(data: bytes) -> Response:
+    return Response(
+        content=data,
+        media_type="image/webp",
+        headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL},
+    )
+
+
+@router.get("/img-resize/{w}/{path:path}")
+async def resize_image(w: int, path: str):
+    if w not in RESIZE_WIDTHS:
+        raise HTTPException(status_code=400, detail="Недопустимая ширина изображения")
+
+    source, key = await run_in_threadpool(_source_and_key, path, w)
+    cached = resize_cache.path_for(key)
+    data = await run_in_threadpool(_read_cached, cached)
+    if data is not None:
+        return _cached_response(data)
+
+    lock = resize_cache.key_lock(key)
+    try:
+        async with lock:
+            data = await run_in_threadpool(_read_cached, cached)
+            if data is None:
+                content = await run_in_threadpool(_read_source, source)
+                try:
+                    data = await process_image_to_webp_async(content, max_width=w, quality=RESIZE_QUALITY)
+                except ImageProcessingError as e:
+                    raise HTTPException(status_code=422, detail=str(e))
+                except Exception:
+                    raise HTTPException(status_code=422, detail="Не удалось обработать изображение")
+                await run_in_threadpool(resize_cache.store, cached, data)
+    finally:
+        resize_cache.release_key(key, lock)
+    return _cached_response(data)
@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta, timezone
 import random
 from app.database import get_db
 from app.models import User, PasswordReset
 from app.schemas import PasswordResetRequest, PasswordResetVerify, PasswordResetComplete
-from app.security import hash_password
+from app.security import hash_password_async
 from app.email_service import send_password_reset_email
 
 router = APIRouter(prefix="/admin/password-reset", tags=["Password Reset"])
@@ -89,7 +90,7 @@ def verify_reset_code(data: PasswordResetVerify, db: Session = Depends(get_db)):
 
 
 @router.post("/complete")
-def complete_password_reset(data: PasswordResetComplete, db: Session = Depends(get_db)):
+async def complete_password_reset(data: PasswordResetComplete, db: Session = Depends(get_db)):
     """
     Complete password reset.
     - Verify code is valid
@@ -97,6 +98,14 @@ def complete_password_reset(data: PasswordResetComplete, db: Session = Depends(g
     - Update user password
     - Mark code as used
     """
+    # Код проверяется до хеширования: неверные коды не нагружают пул argon2
+    reset, user = await run_in_threadpool(_find_valid_reset, data, db)
+    password_hash = await hash_password_async(data.new_password)
+    await run_in_threadpool(_finish_reset, reset, user, password_hash, db)
+    return {"message": "Пароль успешно изменён"}
+
+
+def _find_valid_reset(data: PasswordResetComplete, db: Session):
     # Validate password length
     if len(data.new_password) < 8:
         raise HTTPException(
@@ -132,12 +141,14 @@ def complete_password_reset(data: PasswordResetComplete, db: Session = Depends(g
             detail="Пользователь не найден"
         )
     
+    return reset, user
+
+
+def _finish_reset(reset: PasswordReset, user: User, password_hash: str, db: Session) -> None:
     # Update password
-    user.password_hash = hash_password(data.new_password)
+    user.password_hash = password_hash
     
     # Mark code as used
     reset.is_used = True
     
     db.commit()
-    
-    return {"message": "Пароль успешно изменён"}
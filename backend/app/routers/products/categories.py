@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request
+from fastapi.concurrency import run_in_threadpool
+from functools import partial
+from sqlalchemy import func
 from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
 from pathlib import Path
-import hashlib
 from app.database import get_db
 from app.models import Category, Photo, Product
 from app.schemas import Category as CategorySchema, CategoryCreate, CategoryUpdate, WebsiteCategoryPreview, WebsiteCategoryProduct
-from app.image_utils import process_image_to_webp
+from app.image_utils import process_images_to_variants, save_image_variants
+from app.media_store import attach_photos, detach_photos, lock_paths, replace_photos
+from app.catalog_cache import cached_catalog_response, touch_catalog
 
 router = APIRouter(prefix="/admin/categories", tags=["categories"])
 
@@ -43,14 +47,16 @@ def create_category(category: CategoryCreate, db: Session = Depends(get_db)):
         is_visible_on_website=category.is_visible_on_website
     )
     db.add(db_category)
+    touch_catalog(db)
     db.commit()
     db.refresh(db_category)
 
     # Добавляем фото из photo_urls
     if category.photo_urls:
-        for url in category.photo_urls:
-            db_photo = Photo(image_url=url, category=db_category)
-            db.add(db_photo)
+        photos = [Photo(image_url=url, category=db_category) for url in category.photo_urls]
+        db.add_all(photos)
+        attach_photos(db, photos)
+        touch_catalog(db)
         db.commit()
         db.refresh(db_category)
 
@@ -105,11 +111,15 @@ def update_category(
 
     # Обработка фото: если photo_urls передан — заменяем все
     if category_update.photo_urls is not None:
-        db.query(Photo).filter(Photo.category_id == category_id).delete()
-        for url in category_update.photo_urls:
-            db_photo = Photo(image_url=url, category=db_category)
-            db.add(db_photo)
+        replace_photos(
+            db,
+            db.query(Photo).filter(Photo.category_id == category_id),
+            category_update.photo_urls,
+            category=db_category,
+        )
+        db_category.updated_at = func.now()
 
+    touch_catalog(db)
     db.commit()
     db.refresh(db_category)
     return db_category
@@ -124,7 +134,9 @@ def delete_category(category_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Cannot delete category with subcategories")
     if category.products:
         raise HTTPException(status_code=400, detail="Cannot delete category with products")
+    detach_photos(db, category.photos)
     db.delete(category)
+    touch_catalog(db)
     db.commit()
     return {"ok": True}
 
@@ -140,36 +152,42 @@ async def upload_category_photos(
     if not db_category:
         raise HTTPException(status_code=404, detail="Category not found")
 
-    # Удаляем все существующие фото
-    db.query(Photo).filter(Photo.category_id == category_id).delete()
+    # Удаляем все существующие фото; их файлы удалит фоновая чистка
+    old_photos = db.query(Photo).filter(Photo.category_id == category_id)
+    detach_photos(db, old_photos.all())
+    old_photos.delete()
 
     urls = []
+    photos = []
     if files:  # только если файлы переданы
-        for file in files:
-            content = await file.read()
-
-            try:
-                webp_bytes = process_image_to_webp(content)
-            except Exception:
+        contents = [await file.read() for file in files]
+        # Файлы обрабатываются параллельно в пуле процессов
+        processed = await process_images_to_variants(contents)
+        for result in processed:
+            if isinstance(result, Exception):
                 raise HTTPException(status_code=400, detail="Не удалось обработать изображение")
 
-            file_hash = hashlib.sha256(webp_bytes).hexdigest()[:16]
-            unique_filename = f"{file_hash}.webp"
-            filepath = UPLOAD_DIR / unique_filename
-            with open(filepath, "wb") as f:
-                f.write(webp_bytes)
-
-            url = f"/uploads/photos/categories/{unique_filename}"
-            db_photo = Photo(image_url=url, category=db_category)
+            url, variants = await run_in_threadpool(
+                save_image_variants, result, UPLOAD_DIR, "/uploads/photos/categories/", partial(lock_paths, db)
+            )
+            db_photo = Photo(image_url=url, variants=variants, category=db_category)
             db.add(db_photo)
+            photos.append(db_photo)
             urls.append(url)
 
+    await run_in_threadpool(attach_photos, db, photos)
+    db_category.updated_at = func.now()
+    touch_catalog(db)
     db.commit()
     return urls
 
 
 @router.get("/website/preview", response_model=List[WebsiteCategoryPreview])
-def get_website_categories_preview(db: Session = Depends(get_db)):
+def get_website_categories_preview(request: Request, db: Session = Depends(get_db)):
+    return cached_catalog_response(request, db, ("website_preview",), lambda: _build_website_preview(db))
+
+
+def _build_website_preview(db: Session) -> List[WebsiteCategoryPreview]:
     categories = (
         db.query(Category)
         .options(joinedload(Category.photos))
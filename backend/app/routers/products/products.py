@@ -1,16 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, Request, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
+from functools import partial
+from sqlalchemy import func
 from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
 import os
 from pathlib import Path
-import hashlib
 from app.database import get_db
-from app.database import SessionLocal
 from app.models import Product as ProductModel, Category, Photo, UnitOfMeasurement, User
 from app.schemas import Product, ProductCreate, ProductWriteOff, UnitOfMeasurementResponse, StockProduct, UnitOfMeasurementBase
 from app.auth import get_current_user
 from app.audit_logger import log_detailed_action, get_client_ip
-from app.image_utils import process_image_to_webp
+from app.image_utils import process_images_to_variants, save_image_variants
+from app.upload_utils import save_upload_streaming
+from app.media_store import attach_photos, detach_photos, lock_paths
+from app.catalog_cache import touch_catalog
 
 router = APIRouter(prefix="/admin/products", tags=["products"])
 
@@ -31,6 +35,15 @@ def _is_video_upload(file: UploadFile) -> bool:
     return ext in VIDEO_EXTENSIONS
 
 
+def _touch_category(db: Session, product: ProductModel) -> None:
+    """Витрина категории видимого товара изменилась — обновляет Category.updated_at (lastmod в sitemap)."""
+    if product.category_id is None or not product.is_visible_on_website:
+        return
+    db.query(Category).filter(Category.id == product.category_id).update(
+        {Category.updated_at: func.now()}, synchronize_session=False
+    )
+
+
 def create_product_with_photos(db: Session, product_data: ProductCreate, photo_urls: List[str] = None):
     if product_data.category_id is not None:
         category = db.query(Category).filter(Category.id == product_data.category_id).first()
@@ -54,13 +67,15 @@ def create_product_with_photos(db: Session, product_data: ProductCreate, photo_u
         min_stock=0.0 if not product_data.is_countable else product_data.min_stock
     )
     db.add(db_product)
+    touch_catalog(db)
     db.commit()
     db.refresh(db_product)
 
     if photo_urls:
-        for url in photo_urls:
-            db_photo = Photo(image_url=url, product_id=db_product.id)
-            db.add(db_photo)
+        photos = [Photo(image_url=url, product_id=db_product.id) for url in photo_urls]
+        db.add_all(photos)
+        attach_photos(db, photos)
+        touch_catalog(db)
         db.commit()
         db.refresh(db_product)
 
@@ -113,10 +128,18 @@ def update_product(
             raise HTTPException(status_code=400, detail="Unit of measurement does not exist")
 
     old_price = float(db_product.price or 0)
+    # Товар ушёл из витрины прежней категории — её lastmod тоже меняется
+    old_category_id = db_product.category_id
+    was_visible = db_product.is_visible_on_website
 
     for key, value in product.model_dump().items():
         setattr(db_product, key, value)
 
+    if was_visible and (db_product.category_id != old_category_id or not db_product.is_visible_on_website):
+        db.query(Category).filter(Category.id == old_category_id).update(
+            {Category.updated_at: func.now()}, synchronize_session=False
+        )
+
     if not db_product.is_countable:
         db_product.min_stock = 0.0
 
@@ -129,7 +152,6 @@ def update_product(
         )
         background_tasks.add_task(
             log_detailed_action,
-            db=SessionLocal(),
             user_id=current_user.user_id,
             action="UPDATE",
             entity_type="product",
@@ -140,6 +162,7 @@ def update_product(
             user_agent=request.headers.get("user-agent")
         )
 
+    touch_catalog(db)
     db.commit()
     db.refresh(db_product)
     return db_product
@@ -175,7 +198,6 @@ def write_off_product(
 
     background_tasks.add_task(
         log_detailed_action,
-        db=SessionLocal(),
         user_id=current_user.user_id,
         action="UPDATE",
         entity_type="product",
@@ -204,42 +226,47 @@ async def upload_product_photos(
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
+    # Изображения читаются в память и обрабатываются параллельно в пуле процессов;
+    # видео копируются на диск потоково и в память целиком не попадают
+    image_indexes = [i for i, file in enumerate(files) if not _is_video_upload(file)]
+    contents = [await files[i].read() for i in image_indexes]
+    processed = dict(zip(image_indexes, await process_images_to_variants(contents)))
+
     urls = []
-    for file in files:
-        content = await file.read()
+    photos = []
+    for index, file in enumerate(files):
+        variants = None
 
         if _is_video_upload(file):
             ext = Path(file.filename or "").suffix.lower()
             if ext not in VIDEO_EXTENSIONS:
                 ext = ".mp4"
-            file_hash = hashlib.sha256(content).hexdigest()[:16]
-            unique_filename = f"{file_hash}{ext}"
-            filepath = VIDEO_UPLOAD_DIR / unique_filename
-            with open(filepath, "wb") as f:
-                f.write(content)
+            unique_filename, _ = await save_upload_streaming(
+                file, VIDEO_UPLOAD_DIR, ext,
+                lock=lambda name: lock_paths(db, [f"/uploads/videos/products/{name}"]),
+            )
             image_url = f"/uploads/videos/products/{unique_filename}"
         else:
-            try:
-                webp_bytes = process_image_to_webp(content)
-            except Exception:
+            result = processed[index]
+            if isinstance(result, Exception):
                 raise HTTPException(status_code=400, detail=f"Не удалось обработать изображение: {file.filename}")
 
-            file_hash = hashlib.sha256(webp_bytes).hexdigest()[:16]
-            safe_filename = f"{file_hash}.webp"
-            filepath = UPLOAD_DIR / safe_filename
-
-            with open(filepath, "wb") as f:
-                f.write(webp_bytes)
-
-            image_url = f"/uploads/photos/products/{safe_filename}"
+            image_url, variants = await run_in_threadpool(
+                save_image_variants, result, UPLOAD_DIR, "/uploads/photos/products/", partial(lock_paths, db)
+            )
 
         db_photo = Photo(
             image_url=image_url,
+            variants=variants,
             product_id=product_id
         )
         db.add(db_photo)
+        photos.append(db_photo)
         urls.append(image_url)
 
+    await run_in_threadpool(attach_photos, db, photos)
+    _touch_category(db, product)
+    touch_catalog(db)
     db.commit()
     return urls
 
@@ -258,14 +285,11 @@ def delete_product_photo(
     if not db_photo:
         raise HTTPException(status_code=404, detail="Фото не найдено")
 
-    try:
-        filepath = Path(".") / db_photo.image_url.lstrip("/")
-        if filepath.exists():
-            filepath.unlink()
-    except Exception as e:
-        print(f"Warning: Could not delete file {db_photo.image_url}: {e}")
-
+    # Файлы удалит фоновая чистка, когда на них не останется ссылок
+    detach_photos(db, [db_photo])
+    _touch_category(db, db_photo.product)
     db.delete(db_photo)
+    touch_catalog(db)
     db.commit()
 
     return {"message": "Фото успешно удалено"}
@@ -276,10 +300,14 @@ def delete_product(product_id: int, db: Session = Depends(get_db)):
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    # Удаляем связанные фото (если нужно удалить и файлы с диска — добавьте логику)
-    db.query(Photo).filter(Photo.product_id == product_id).delete()
+    # Удаляем связанные фото; файлы удалит фоновая чистка
+    photos_query = db.query(Photo).filter(Photo.product_id == product_id)
+    detach_photos(db, photos_query.all())
+    photos_query.delete()
 
+    _touch_category(db, product)
     db.delete(product)
+    touch_catalog(db)
     db.commit()
     return
 
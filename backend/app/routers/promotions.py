@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 from typing import List
 from app.database import get_db
-from app.models import Promotion, PromotionGiftProduct, Product
+from app.models import Bath, BathPromotion, Promotion, PromotionGiftProduct, Product
 from app.schemas import (
     PromotionCreate,
     PromotionUpdate,
@@ -10,6 +11,7 @@ from app.schemas import (
     PromotionGiftProductResponse
 )
 from app.auth import get_current_user
+from app.catalog_cache import touch_catalog
 from app.promotion_utils import (
     get_incompatible_promotion_ids,
     set_promotion_incompatibilities,
@@ -19,6 +21,17 @@ from datetime import date
 router = APIRouter()
 
 
+def _touch_promotion_baths(db: Session, promotion_ids) -> None:
+    """Страницы бань с этими акциями изменились — обновляет Bath.updated_at (lastmod в sitemap)."""
+    promotion_ids = {int(pid) for pid in promotion_ids}
+    if not promotion_ids:
+        return
+    linked_baths = select(BathPromotion.bath_id).where(BathPromotion.promotion_id.in_(promotion_ids))
+    db.query(Bath).filter(Bath.bath_id.in_(linked_baths)).update(
+        {Bath.updated_at: func.now()}, synchronize_session=False
+    )
+
+
 def _build_gift_products(db: Session, promo: Promotion) -> List[PromotionGiftProductResponse]:
     gift_products = []
     for gp in promo.gift_products:
@@ -260,6 +273,9 @@ def create_promotion(
         db.rollback()
         raise HTTPException(status_code=400, detail=str(exc))
 
+    # У новой акции ещё нет бань, но в карточках несовместимых с ней акций появился её id
+    _touch_promotion_baths(db, promotion_data.incompatible_promotion_ids or [])
+    touch_catalog(db)
     db.commit()
     db.refresh(promo)
     return _build_promotion_response(db, promo)
@@ -304,6 +320,12 @@ def update_promotion(
     incompatible_ids = update_data.pop('incompatible_promotion_ids', None)
     gift_products = update_data.pop('gift_products', None)
 
+    # Бани самой акции и акций, с которыми менялась несовместимость (до и после)
+    touched_promotion_ids = {promotion_id}
+    if incompatible_ids is not None:
+        touched_promotion_ids.update(get_incompatible_promotion_ids(db, promotion_id))
+        touched_promotion_ids.update(incompatible_ids)
+
     for key, value in update_data.items():
         setattr(promo, key, value)
 
@@ -334,6 +356,8 @@ def update_promotion(
             db.rollback()
             raise HTTPException(status_code=400, detail=str(exc))
 
+    _touch_promotion_baths(db, touched_promotion_ids)
+    touch_catalog(db)
     db.commit()
     db.refresh(promo)
     return _build_promotion_response(db, promo)
@@ -349,6 +373,9 @@ def delete_promotion(
     if not promo:
         raise HTTPException(status_code=404, detail="Акция не найдена")
 
+    # До удаления: вместе с акцией уйдут её связи с банями
+    _touch_promotion_baths(db, [promotion_id, *get_incompatible_promotion_ids(db, promotion_id)])
     db.delete(promo)
+    touch_catalog(db)
     db.commit()
     return None
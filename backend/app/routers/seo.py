@@ -1,68 +1,142 @@
 import os
-from datetime import date
-from typing import Optional
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 from xml.sax.saxutils import escape
 
-from fastapi import APIRouter, Depends, Response
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import func
+from sqlalchemy.orm import Session
 
+from app.catalog_cache import body_etag, catalog_cache, conditional_response
 from app.database import get_db
-from app.models import Bath, Category
+from app.models import Bath, Category, Product
 
 router = APIRouter(tags=["seo"])
 
 SITE_URL = os.getenv("SITE_URL", "https://nikolaevskie.ru").rstrip("/")
+# Ограничение протокола sitemap — 50 000 адресов в файле; больше — индекс из частей sitemap-N.xml
+SITEMAP_MAX_URLS = int(os.getenv("SITEMAP_MAX_URLS", "50000"))
+
+# (путь, changefreq, priority, время последнего изменения)
+SitemapUrl = Tuple[str, str, str, Optional[datetime]]
+
+
+def _lastmod(value: Optional[datetime]) -> Optional[str]:
+    return value.date().isoformat() if value is not None else None
+
+
+def _latest(*values: Optional[datetime]) -> Optional[datetime]:
+    present = [v for v in values if v is not None]
+    return max(present) if present else None
 
 
 def _url_entry(path: str, changefreq: str, priority: str, lastmod: Optional[str] = None) -> str:
     loc = f"{SITE_URL}{path}"
-    mod = lastmod or date.today().isoformat()
+    mod = f"    <lastmod>{lastmod}</lastmod>\n" if lastmod else ""
     return (
         "  <url>\n"
         f"    <loc>{escape(loc)}</loc>\n"
-        f"    <lastmod>{mod}</lastmod>\n"
+        f"{mod}"
         f"    <changefreq>{changefreq}</changefreq>\n"
         f"    <priority>{priority}</priority>\n"
         "  </url>"
     )
 
 
-@router.get("/sitemap.xml")
-def sitemap_xml(db: Session = Depends(get_db)):
-    entries = [
-        _url_entry("/", "weekly", "1.0"),
-        _url_entry("/baths", "weekly", "0.9"),
-        _url_entry("/booking", "monthly", "0.8"),
-    ]
-
-    baths = db.query(Bath).filter(Bath.slug.isnot(None), Bath.slug != "").all()
-    for bath in baths:
-        entries.append(_url_entry(f"/baths/{bath.slug}", "weekly", "0.8"))
-
+def _sitemap_urls(db: Session) -> List[SitemapUrl]:
+    baths = (
+        db.query(Bath.slug, Bath.updated_at)
+        .filter(Bath.slug.isnot(None), Bath.slug != "")
+        .order_by(Bath.bath_id.asc())
+        .all()
+    )
+    # Категории витрины, в которых есть видимые товары; lastmod — по категории и её товарам
     categories = (
-        db.query(Category)
-        .options(joinedload(Category.products))
-        .filter(Category.is_visible_on_website.is_(True))
+        db.query(Category.id, Category.updated_at, func.max(Product.updated_at))
+        .join(Product, Product.category_id == Category.id)
+        .filter(
+            Category.is_visible_on_website.is_(True),
+            Product.is_visible_on_website.is_(True),
+        )
+        .group_by(Category.id, Category.updated_at)
         .order_by(Category.id.asc())
         .all()
     )
 
-    for category in categories:
-        visible_products = [
-            p for p in (category.products or [])
-            if p.is_visible_on_website
-        ]
-        if not visible_products:
-            continue
-        entries.append(
-            _url_entry(f"/categories/{category.id}/products", "weekly", "0.7")
-        )
+    baths_modified = _latest(*(updated_at for _, updated_at in baths))
+    category_urls = [
+        (f"/categories/{category_id}/products", "weekly", "0.7", _latest(category_updated, products_updated))
+        for category_id, category_updated, products_updated in categories
+    ]
+    return [
+        ("/", "weekly", "1.0", _latest(baths_modified, *(url[3] for url in category_urls))),
+        ("/baths", "weekly", "0.9", baths_modified),
+        ("/booking", "monthly", "0.8", None),
+        *((f"/baths/{slug}", "weekly", "0.8", updated_at) for slug, updated_at in baths),
+        *category_urls,
+    ]
 
-    xml_body = (
+
+def _urlset(urls: List[SitemapUrl]) -> bytes:
+    entries = [
+        _url_entry(path, changefreq, priority, _lastmod(modified))
+        for path, changefreq, priority, modified in urls
+    ]
+    return (
         '<?xml version="1.0" encoding="UTF-8"?>\n'
         '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
         + "\n".join(entries)
         + "\n</urlset>"
-    )
+    ).encode()
+
+
+def _sitemap_index(parts: List[List[SitemapUrl]]) -> bytes:
+    entries = []
+    for number, part in enumerate(parts, start=1):
+        lastmod = _lastmod(_latest(*(url[3] for url in part)))
+        mod = f"    <lastmod>{lastmod}</lastmod>\n" if lastmod else ""
+        entries.append(
+            "  <sitemap>\n"
+            f"    <loc>{escape(f'{SITE_URL}/sitemap-{number}.xml')}</loc>\n"
+            f"{mod}"
+            "  </sitemap>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+        + "\n".join(entries)
+        + "\n</sitemapindex>"
+    ).encode()
+
+
+def _build_sitemaps(db: Session) -> Dict[int, Tuple[bytes, str]]:
+    """Документы sitemap: 0 — /sitemap.xml (набор адресов или индекс), N — /sitemap-N.xml."""
+    urls = _sitemap_urls(db)
+    if len(urls) <= SITEMAP_MAX_URLS:
+        documents = {0: _urlset(urls)}
+    else:
+        parts = [urls[i:i + SITEMAP_MAX_URLS] for i in range(0, len(urls), SITEMAP_MAX_URLS)]
+        documents = {0: _sitemap_index(parts)}
+        documents.update((number, _urlset(part)) for number, part in enumerate(parts, start=1))
+    return {number: (body, body_etag(body)) for number, body in documents.items()}
+
+
+def _sitemap_response(request: Request, db: Session, number: int):
+    # Пересобирается только после изменения бань, категорий или товаров (версия каталога)
+    documents = catalog_cache.get_or_compute(db, ("sitemap",), lambda: _build_sitemaps(db))
+    if number not in documents:
+        raise HTTPException(status_code=404, detail="Sitemap не найден")
+    body, etag = documents[number]
+    return conditional_response(request, body, etag, "application/xml")
+
+
+@router.get("/sitemap.xml")
+def sitemap_xml(request: Request, db: Session = Depends(get_db)):
+    return _sitemap_response(request, db, 0)
+
 
-    return Response(content=xml_body, media_type="application/xml")
+@router.get("/sitemap-{number:int}.xml")
+def sitemap_part_xml(number: int, request: Request, db: Session = Depends(get_db)):
+    if number < 1:
+        raise HTTPException(status_code=404, detail="Sitemap не найден")
+    return _sitemap_response(request, db, number)
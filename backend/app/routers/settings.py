@@ -3,10 +3,11 @@ from sqlalchemy.orm import Session
 from pathlib import Path
 from app import models, schemas, database
 from app.auth import get_current_user
-from app.database import SessionLocal
 from app.audit_logger import log_detailed_action, get_client_ip
 from app.pricing import get_markup_percent, price_from_purchase
-from app.image_utils import process_image_to_webp
+from app.catalog_cache import touch_catalog
+from app.image_utils import process_image_to_webp_async
+from app.reservation_index import reservation_index
 
 router = APIRouter(
     prefix="/admin/settings",
@@ -126,6 +127,8 @@ def update_settings(
             db.add(setting)
 
         products = db.query(models.Product).all()
+        # Цены товаров видны на витрине
+        touch_catalog(db)
         recalc_count = 0
         for p in products:
             if update_manual_prices or not p.is_price_manual:
@@ -140,7 +143,6 @@ def update_settings(
         )
         background_tasks.add_task(
             log_detailed_action,
-            db=SessionLocal(),
             user_id=current_user.user_id,
             action="UPDATE",
             entity_type="settings",
@@ -152,6 +154,8 @@ def update_settings(
         )
 
     db.commit()
+    if "cleaning_time_minutes" in updates:
+        reservation_index.reset()
 
     return {"message": "Настройки успешно обновлены"}
 
@@ -193,7 +197,7 @@ async def upload_payment_qrcode(
         raise HTTPException(status_code=400, detail="Пустой файл")
 
     try:
-        webp_bytes = process_image_to_webp(content, max_width=1024, quality=90)
+        webp_bytes = await process_image_to_webp_async(content, max_width=1024, quality=90)
     except Exception:
         raise HTTPException(status_code=400, detail="Не удалось обработать изображение")
 
@@ -211,7 +215,6 @@ async def upload_payment_qrcode(
 
     background_tasks.add_task(
         log_detailed_action,
-        db=SessionLocal(),
         user_id=current_user.user_id,
         action="UPDATE",
         entity_type="payment_qr_setting",
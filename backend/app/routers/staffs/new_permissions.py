@@ -4,6 +4,7 @@ from typing import List
 from app.database import get_db
 from app.models import Permission
 from app.schemas import PermissionResponse
+from app.permission_bits import permission_catalog
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/admin/permissions/new", tags=["New Permissions"])
@@ -55,4 +56,5 @@ def create_permission(permission_data: PermissionCreate, db: Session = Depends(g
     db.add(db_permission)
     db.commit()
     db.refresh(db_permission)
+    permission_catalog.load(db)
     return db_permission
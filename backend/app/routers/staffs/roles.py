@@ -4,6 +4,8 @@ from typing import List
 from app.database import get_db
 from app.models import Role, Permission
 from app.schemas import RoleCreate, RoleResponse, RoleUpdate
+from app.permission_bits import permission_catalog
+from app.session_cache import session_cache
 
 router = APIRouter(prefix="/admin/company/role", tags=["Roles"])
 
@@ -47,6 +49,8 @@ def update_role(id: int, role_data: RoleUpdate, db: Session = Depends(get_db)):
 
     db.commit()
     db.refresh(db_role)
+    permission_catalog.invalidate_role(id)
+    session_cache.invalidate_role(id)
     return db_role
 
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -56,4 +60,6 @@ def delete_role(id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Роль не найдена")
     db.delete(db_role)
     db.commit()
+    permission_catalog.invalidate_role(id)
+    session_cache.invalidate_role(id)
     return
\ No newline at end of file
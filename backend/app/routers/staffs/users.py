@@ -1,13 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
-from app.database import get_db, SessionLocal
+from app.database import get_db
 from app.models import User, Role
 from app.schemas import UserCreate, UserUpdate, UserResponse
-from app.security import hash_password
+from app.security import hash_password_async
 from app.phone_utils import normalize_phone
 from app.audit_logger import log_action, get_client_ip
 from app.auth import get_current_user
+from app.session_cache import session_cache
 
 router = APIRouter(prefix="/admin/company/users", tags=["Users"])
 
@@ -39,12 +41,27 @@ def get_user(user_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("/", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def create_user(
+async def create_user(
     user_data: UserCreate,
     background_tasks: BackgroundTasks,
     request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
+):
+    # Обработчик async: argon2 — в своём пуле, запросы к БД — в threadpool
+    hashed_password = await hash_password_async(user_data.password)
+    return await run_in_threadpool(
+        _create_user, user_data, hashed_password, background_tasks, request, db, current_user
+    )
+
+
+def _create_user(
+    user_data: UserCreate,
+    hashed_password: str,
+    background_tasks: BackgroundTasks,
+    request: Request,
+    db: Session,
+    current_user: User,
 ):
     # Нормализация телефона
     normalized_phone = normalize_phone(user_data.phone)
@@ -70,9 +87,6 @@ def create_user(
             detail="Для сотрудника без супердоступа роль обязательна"
         )
 
-    # Хеширование пароля
-    hashed_password = hash_password(user_data.password)
-
     # Создание пользователя
     db_user = User(
         email=user_data.email,
@@ -95,7 +109,6 @@ def create_user(
     from app.audit_logger import log_detailed_action
     background_tasks.add_task(
         log_detailed_action,
-        db=SessionLocal(),
         user_id=current_user.user_id,
         action="CREATE",
         entity_type="user",
@@ -107,17 +120,35 @@ def create_user(
         user_agent=request.headers.get("user-agent")
     )
 
-    return db_user
+    # Сериализуем здесь: ленивые role_rel/permissions не должны грузиться в event loop
+    return UserResponse.model_validate(db_user)
 
 
 @router.put("/{user_id}", response_model=UserResponse)
-def update_user(
+async def update_user(
     user_id: int,
     user_data: UserUpdate,
     background_tasks: BackgroundTasks,
     request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
+):
+    password_hash = None
+    if user_data.password is not None:
+        password_hash = await hash_password_async(user_data.password)
+    return await run_in_threadpool(
+        _update_user, user_id, user_data, password_hash, background_tasks, request, db, current_user
+    )
+
+
+def _update_user(
+    user_id: int,
+    user_data: UserUpdate,
+    password_hash: Optional[str],
+    background_tasks: BackgroundTasks,
+    request: Request,
+    db: Session,
+    current_user: User,
 ):
     db_user = db.query(User).filter(User.user_id == user_id).first()
     if not db_user:
@@ -143,8 +174,8 @@ def update_user(
 
     for key, value in update_data.items():
         if key == "password" and value is not None:
-            # Хешировать новый пароль
-            setattr(db_user, "password_hash", hash_password(value))
+            # Новый пароль уже захеширован в пуле argon2
+            setattr(db_user, "password_hash", password_hash)
         elif key == "phone" and value is not None:
             # Нормализовать телефон
             normalized = normalize_phone(value)
@@ -162,6 +193,7 @@ def update_user(
 
     db.commit()
     db.refresh(db_user)
+    session_cache.invalidate_user(user_id)
 
     # Асинхронное логирование обновления пользователя с детальной информацией
     summary = f"Изменил сотрудника: {db_user.full_name} ({_user_contact_label(db_user.email, db_user.phone)})"
@@ -169,7 +201,6 @@ def update_user(
     from app.audit_logger import log_detailed_action
     background_tasks.add_task(
         log_detailed_action,
-        db=SessionLocal(),
         user_id=current_user.user_id,
         action="UPDATE",
         entity_type="user",
@@ -181,7 +212,7 @@ def update_user(
         user_agent=request.headers.get("user-agent")
     )
 
-    return db_user
+    return UserResponse.model_validate(db_user)
 
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -203,6 +234,7 @@ def delete_user(
     
     db.delete(db_user)
     db.commit()
+    session_cache.invalidate_user(user_id)
 
     # Асинхронное логирование удаления пользователя с детальной информацией
     summary = f"Удалил сотрудника: {user_full_name} ({_user_contact_label(user_email, user_phone)})"
@@ -210,7 +242,6 @@ def delete_user(
     from app.audit_logger import log_detailed_action
     background_tasks.add_task(
         log_detailed_action,
-        db=SessionLocal(),
         user_id=current_user.user_id,
         action="DELETE",
         entity_type="user",
@@ -3,13 +3,17 @@ from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
 from datetime import datetime, timezone
 import os
+import shutil
 import uuid
 from pathlib import Path
 
+from fastapi.concurrency import run_in_threadpool
+
 from app.database import get_db
 from app import models, schemas
 from app.auth import get_current_user
 from app.websocket import manager
+from app.upload_utils import UPLOAD_CHUNK_SIZE
 
 router = APIRouter(prefix="/support", tags=["Support"])
 
@@ -56,14 +60,12 @@ async def create_ticket(
                 detail=f"Файл {file.filename} имеет недопустимый тип. Разрешены только изображения"
             )
         
-        # Проверка размера файла
-        content = await file.read()
-        if len(content) > MAX_FILE_SIZE:
+        # Проверка размера файла (размер известен после разбора multipart, без чтения в память)
+        if file.size is not None and file.size > MAX_FILE_SIZE:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Файл {file.filename} превышает максимальный размер 5 МБ"
             )
-        await file.seek(0)  # Возвращаем позицию чтения в начало
     
     # Создание обращения
     ticket = models.SupportTicket(
@@ -85,9 +87,8 @@ async def create_ticket(
         file_path = SUPPORT_UPLOADS_DIR / unique_filename
         
         # Сохранение файла
-        content = await file.read()
         with open(file_path, "wb") as f:
-            f.write(content)
+            await run_in_threadpool(shutil.copyfileobj, file.file, f, UPLOAD_CHUNK_SIZE)
         
         # Создание записи в БД
         attachment = models.SupportTicketAttachment(
@@ -17,14 +17,25 @@ class PhotoBase(BaseModel):
 class PhotoCreate(PhotoBase):
     pass
 
+class PhotoVariant(BaseModel):
+    width: int
+    url: str
+
 class PhotoOut(BaseModel):
     photo_id: int
     image_url: str
+    variants: List[PhotoVariant] = []
+    srcset: Optional[str] = None
     bath_id: Optional[int] = None
     product_id: Optional[int] = None
     category_id: Optional[int] = None
     promotion_id: Optional[int] = None
 
+    @field_validator("variants", mode="before")
+    @classmethod
+    def _variants_default(cls, value):
+        return value or []
+
     class Config:
         from_attributes = True
 
@@ -201,6 +212,33 @@ class BookingOut(BookingBase):
         from_attributes = True
 
 
+class BookingQuoteItem(BaseModel):
+    bath_id: int
+    start_datetime: str
+    end_datetime: str
+    guests: int = 1
+
+    @field_validator("guests")
+    @classmethod
+    def validate_guests(cls, v: int):
+        if v < 1:
+            raise ValueError("Количество гостей должно быть не меньше 1")
+        return v
+
+class BookingQuoteRequest(BaseModel):
+    items: List[BookingQuoteItem]
+
+class BookingQuoteOut(BaseModel):
+    bath_id: int
+    start_datetime: str
+    end_datetime: str
+    guests: int
+    bath_cost: int
+    extra_guest_cost: int
+    hourly_rate: int
+    total_cost: int
+
+
 # === Реквизиты организации ===
 class OrganizationDetailsBase(BaseModel):
     address: str = ""
@@ -289,6 +327,7 @@ class FinanceOperationOut(BaseModel):
 class FinanceOperationsResponse(BaseModel):
     items: List[FinanceOperationOut]
     total: int
+    next_cursor: Optional[str] = None
 
 
 class FinanceSummaryOut(BaseModel):
@@ -493,6 +532,13 @@ class ProductWriteOff(BaseModel):
 class ProductPhotoOut(BaseModel):
     photo_id: int
     image_url: str
+    variants: List[PhotoVariant] = []
+    srcset: Optional[str] = None
+
+    @field_validator("variants", mode="before")
+    @classmethod
+    def _variants_default(cls, value):
+        return value or []
 
     class Config:
         from_attributes = True
@@ -1,10 +1,21 @@
 from passlib.context import CryptContext
 from fastapi import HTTPException, status
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import threading
+
+from app.permission_bits import permission_catalog
 
 
 pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
 
+# argon2 считается в отдельном ограниченном пуле, а не в общем threadpool FastAPI
+ARGON2_WORKERS = int(os.getenv("ARGON2_WORKERS", "2"))
+# Сколько операций может ждать в очереди сверх выполняемых
+ARGON2_MAX_QUEUE = int(os.getenv("ARGON2_MAX_QUEUE", "16"))
+
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
@@ -12,6 +23,78 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+class PasswordHasherBusy(Exception):
+    """Пул argon2 переполнен — запрос отклоняется сразу, без ожидания."""
+
+
+class PasswordHasherPool:
+    def __init__(self, workers: int = ARGON2_WORKERS, max_queue: int = ARGON2_MAX_QUEUE):
+        self.workers = workers
+        self.limit = workers + max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="argon2")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+    def _release(self, future) -> None:
+        with self._lock:
+            self._pending -= 1
+            self._counters["failed" if future.exception() else "completed"] += 1
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.limit:
+                self._counters["rejected"] += 1
+                raise PasswordHasherBusy()
+            self._pending += 1
+            self._counters["submitted"] += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "pending": self._pending,
+                "workers": self.workers,
+                "limit": self.limit,
+            }
+
+
+password_hasher = PasswordHasherPool()
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password в пуле argon2; при переполнении — 503."""
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервер перегружен, повторите вход позже",
+            headers={"Retry-After": "1"},
+        )
+
+
+async def hash_password_async(password: str) -> str:
+    """hash_password в пуле argon2; при переполнении — 503."""
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервер перегружен, повторите попытку позже",
+            headers={"Retry-After": "1"},
+        )
+
+
 def check_permission(user, required_permission_code: str):
     """Проверяет, есть ли у пользователя нужное право"""
     if not user:
@@ -22,6 +105,12 @@ def check_permission(user, required_permission_code: str):
     if getattr(user, "is_admin", False) or getattr(user, "is_director", False):
         return True
 
+    # Снимок из auth.get_current_user несёт маску прав роли
+    mask = getattr(user, "permission_mask", None)
+    if mask is not None and permission_catalog.loaded:
+        bit = permission_catalog.bit(required_permission_code)
+        return bit is not None and bool(mask >> bit & 1)
+
     permissions = getattr(user, "permissions", None)
     if permissions is None and getattr(user, "role_rel", None):
         permissions = getattr(user.role_rel, "permissions", [])
@@ -0,0 +1,128 @@
+"""
+Кэш разрешённых сессий для auth.get_current_user.
+
+По хэшу токена хранится снимок пользователя (поля, роль, маска прав роли) — без обращения
+к БД на каждый запрос. Снимок живёт SESSION_CACHE_TTL_SECONDS и сбрасывается при
+logout, отзыве сессии и изменении пользователя или роли. Сброс рассылается другим
+воркерам uvicorn через бэкенд availability_cache (AVAILABILITY_CACHE_BACKEND=postgres —
+NOTIFY); сброс роли заодно сбрасывает её маску в permission_catalog. С бэкендом local
+другие воркеры сбрасываются только по TTL.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+from app.availability_cache import backend as invalidation_backend
+from app.permission_bits import permission_catalog
+
+SESSION_CACHE_TTL_SECONDS = int(os.getenv("SESSION_CACHE_TTL_SECONDS", "30"))
+SESSION_CACHE_MAX_ENTRIES = 10000
+SESSION_EVENT_TOPIC = "session"
+
+
+def snapshot_user(user, permission_mask: int = 0) -> SimpleNamespace:
+    """Отвязанная от ORM-сессии копия пользователя с ролью и маской прав роли."""
+    role = user.role_rel
+    permissions = permission_catalog.describe(permission_mask)
+    return SimpleNamespace(
+        user_id=user.user_id,
+        email=user.email,
+        phone=user.phone,
+        full_name=user.full_name,
+        birth_date=user.birth_date,
+        is_admin=bool(user.is_admin),
+        is_director=bool(user.is_director),
+        is_active=bool(user.is_active),
+        created_at=user.created_at,
+        role_id=user.role_id,
+        permission_mask=permission_mask,
+        role_rel=SimpleNamespace(id=role.id, name=role.name, permissions=permissions) if role else None,
+        permissions=permissions,
+    )
+
+
+class CachedSession:
+    __slots__ = ("session_id", "expires_at", "user", "cached_at")
+
+    def __init__(self, session_id: int, expires_at: datetime, user: SimpleNamespace):
+        self.session_id = session_id
+        self.expires_at = expires_at
+        self.user = user
+        self.cached_at = time.monotonic()
+
+
+class SessionCache:
+    def __init__(self, ttl_seconds: int = SESSION_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: Dict[str, CachedSession] = {}
+
+    def get(self, token_hash: str) -> Optional[CachedSession]:
+        entry = self._entries.get(token_hash)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.cached_at > self.ttl_seconds:
+            with self._lock:
+                self._entries.pop(token_hash, None)
+            return None
+        return entry
+
+    def put(
+        self, token_hash: str, session_id: int, expires_at: datetime, user, permission_mask: int = 0
+    ) -> SimpleNamespace:
+        entry = CachedSession(session_id, expires_at, snapshot_user(user, permission_mask))
+        with self._lock:
+            if len(self._entries) >= SESSION_CACHE_MAX_ENTRIES:
+                self._entries.clear()
+            self._entries[token_hash] = entry
+        return entry.user
+
+    def _drop(self, predicate) -> None:
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if predicate(e)]:
+                del self._entries[key]
+
+    def apply_event(self, event) -> None:
+        """Сброс по событию этого или другого воркера; None — сбросить всё."""
+        if event is None:
+            self.clear()
+            permission_catalog.clear()
+            return
+        kind, value = event
+        if kind == "token":
+            with self._lock:
+                self._entries.pop(value, None)
+        elif kind == "session":
+            self._drop(lambda e: e.session_id == value)
+        elif kind == "user":
+            self._drop(lambda e: e.user.user_id == value)
+        elif kind == "role":
+            permission_catalog.invalidate_role(value)
+            self._drop(lambda e: e.user.role_id == value)
+
+    # Вызывать после commit
+    def invalidate_token(self, token_hash: str) -> None:
+        invalidation_backend.publish_event(SESSION_EVENT_TOPIC, ["token", token_hash])
+
+    def invalidate_session(self, session_id: int) -> None:
+        invalidation_backend.publish_event(SESSION_EVENT_TOPIC, ["session", session_id])
+
+    def invalidate_user(self, user_id: int) -> None:
+        invalidation_backend.publish_event(SESSION_EVENT_TOPIC, ["user", user_id])
+
+    def invalidate_role(self, role_id: int) -> None:
+        invalidation_backend.publish_event(SESSION_EVENT_TOPIC, ["role", role_id])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+session_cache = SessionCache()
+invalidation_backend.register(SESSION_EVENT_TOPIC, session_cache.apply_event)
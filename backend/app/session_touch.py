@@ -0,0 +1,97 @@
+"""
+Отложенная запись UserSession.last_used_at.
+
+Обработчики только отмечают в памяти «сессия X использована в момент T»
+(session_touches.record). Фоновый поток раз в SESSION_TOUCH_FLUSH_SECONDS
+записывает все отметки одним UPDATE ... FROM (VALUES ...), так что путь чтения
+(auth.get_current_user, авторизация WebSocket) не пишет в БД.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from app.database import SessionLocal
+
+FLUSH_INTERVAL_SECONDS = float(os.getenv("SESSION_TOUCH_FLUSH_SECONDS", "5"))
+# Строк в одном UPDATE
+FLUSH_CHUNK = 1000
+
+
+def _touch_statement(rows: List[Tuple[int, datetime]]):
+    values = []
+    params = {}
+    for idx, (session_id, touched_at) in enumerate(rows):
+        values.append(f"(:id{idx}, CAST(:t{idx} AS TIMESTAMPTZ))")
+        params[f"id{idx}"] = session_id
+        params[f"t{idx}"] = touched_at
+    sql = (
+        "UPDATE user_sessions AS s SET last_used_at = v.t "
+        f"FROM (VALUES {', '.join(values)}) AS v(id, t) "
+        "WHERE s.id = v.id AND (s.last_used_at IS NULL OR s.last_used_at < v.t)"
+    )
+    return text(sql), params
+
+
+class SessionTouchFlusher:
+    def __init__(self, interval: float = FLUSH_INTERVAL_SECONDS):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending: Dict[int, datetime] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, session_id: int, at: datetime) -> None:
+        with self._lock:
+            current = self._pending.get(session_id)
+            if current is None or at > current:
+                self._pending[session_id] = at
+
+    def flush(self) -> int:
+        with self._lock:
+            rows = list(self._pending.items())
+            self._pending.clear()
+        if not rows:
+            return 0
+        db = SessionLocal()
+        try:
+            for i in range(0, len(rows), FLUSH_CHUNK):
+                stmt, params = _touch_statement(rows[i:i + FLUSH_CHUNK])
+                db.execute(stmt, params)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            # Вернуть отметки, чтобы записать при следующем сбросе
+            for session_id, at in rows:
+                self.record(session_id, at)
+            print(f"Session touch flush error: {e}")
+            return 0
+        finally:
+            db.close()
+        return len(rows)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="session-touch-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+        self.flush()
+
+
+session_touches = SessionTouchFlusher()
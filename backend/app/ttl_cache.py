@@ -0,0 +1,62 @@
+"""
+Короткий кэш результатов с защитой от «набега» (stampede).
+
+Когда запись устарела, значение пересчитывает только один поток; остальные
+запросы с тем же ключом ждут его результат, а не идут в БД параллельно.
+Устаревшие записи (и свободные блокировки их ключей) удаляются при каждой записи,
+поэтому ключи вроде «сегодняшней даты» не копятся.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlightTTLCache:
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+
+    def _fresh(self, key: Hashable):
+        item = self._entries.get(key)
+        if item is not None and time.monotonic() - item[0] < self.ttl_seconds:
+            return True, item[1]
+        return False, None
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        hit, value = self._fresh(key)
+        if hit:
+            return value
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Пока ждали блокировку, значение мог посчитать другой поток
+            hit, value = self._fresh(key)
+            if hit:
+                return value
+            value = compute()
+            with self._lock:
+                now = time.monotonic()
+                self._evict_expired(now)
+                self._entries[key] = (now, value)
+            return value
+
+    def _evict_expired(self, now: float) -> None:
+        """Под self._lock."""
+        expired = [k for k, (stored_at, _) in self._entries.items() if now - stored_at >= self.ttl_seconds]
+        for k in expired:
+            del self._entries[k]
+            key_lock = self._key_locks.get(k)
+            if key_lock is not None and not key_lock.locked():
+                del self._key_locks[k]
+
+    def invalidate(self, key: Hashable = None) -> None:
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
@@ -0,0 +1,63 @@
+"""
+Сохранение загруженных файлов без чтения целиком в память.
+
+Файл копируется кусками по UPLOAD_CHUNK_SIZE во временный *.part в целевом каталоге,
+SHA-256 считается по ходу копирования, затем файл атомарно переименовывается
+в {hash[:16]}{suffix}. Недописанный файл никогда не виден под итоговым именем.
+"""
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+
+
+def _write_chunk(out, chunk: bytes) -> None:
+    out.write(chunk)
+
+
+def _discard(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+async def save_upload_streaming(
+    file: UploadFile, directory: Path, suffix: str, lock: Optional[Callable[[str], None]] = None
+) -> Tuple[str, int]:
+    """
+    Сохраняет загрузку в directory под именем по хэшу содержимого.
+    lock(имя файла) вызывается в threadpool до переименования (media_store.lock_paths).
+    Возвращает (имя файла, размер в байтах).
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+                await run_in_threadpool(_write_chunk, out, chunk)
+            await run_in_threadpool(os.fsync, out.fileno())
+        # mkstemp создаёт файл с правами 0600, а загрузки раздаются как статика
+        os.chmod(tmp_path, 0o644)
+        filename = f"{digest.hexdigest()[:16]}{suffix}"
+        if lock is not None:
+            await run_in_threadpool(lock, filename)
+        os.replace(tmp_path, directory / filename)
+    except BaseException:
+        _discard(tmp_path)
+        raise
+    return filename, size
@@ -1,9 +1,11 @@
 from fastapi import WebSocket, WebSocketDisconnect
 from typing import Dict, List
+from datetime import datetime, timezone
 import json
 
 from app.database import SessionLocal
 from app import models
+from app.session_touch import session_touches
 
 
 class ConnectionManager:
@@ -100,6 +102,7 @@ async def websocket_endpoint(
         if not session:
             await websocket.close(code=4001, reason="Invalid session")
             return
+        session_touches.record(session.id, datetime.now(timezone.utc))
         
         # Получаем пользователя
         user = db.query(models.User).filter(
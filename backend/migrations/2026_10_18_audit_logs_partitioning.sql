@@ -0,0 +1,84 @@
+-- Перевод audit_logs на помесячное секционирование по created_at.
+-- Новые секции и архивирование старых выполняет приложение (app/audit_partitions.py,
+-- вручную: python -m app.audit_partitions).
+-- Выполнить на сервере в окно обслуживания (таблица копируется целиком):
+--   sudo -u postgres psql -d banya -f backend/migrations/2026_10_18_audit_logs_partitioning.sql
+
+BEGIN;
+
+LOCK TABLE audit_logs IN ACCESS EXCLUSIVE MODE;
+
+ALTER TABLE audit_logs RENAME TO audit_logs_legacy;
+ALTER TABLE audit_logs_legacy RENAME CONSTRAINT audit_logs_pkey TO audit_logs_legacy_pkey;
+ALTER INDEX IF EXISTS ix_audit_logs_id RENAME TO ix_audit_logs_legacy_id;
+DROP INDEX IF EXISTS ix_audit_logs_created;
+DROP INDEX IF EXISTS ix_audit_logs_user_created;
+DROP INDEX IF EXISTS ix_audit_logs_entity_created;
+DROP INDEX IF EXISTS ix_audit_logs_action_created;
+DROP INDEX IF EXISTS ix_audit_logs_entity_action_created;
+
+-- В первичный ключ секционированной таблицы обязан входить ключ секционирования
+CREATE TABLE audit_logs (
+    id INTEGER NOT NULL DEFAULT nextval('audit_logs_id_seq'),
+    user_id INTEGER REFERENCES users(user_id) ON DELETE SET NULL,
+    action VARCHAR(50) NOT NULL,
+    entity_type VARCHAR(50) NOT NULL,
+    entity_id INTEGER,
+    details JSON,
+    ip_address VARCHAR(45),
+    user_agent VARCHAR(500),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    summary TEXT,
+    bath_name VARCHAR(100),
+    client_name VARCHAR(100),
+    event_datetime TIMESTAMPTZ,
+    product_list TEXT,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE audit_logs_id_seq OWNED BY audit_logs.id;
+
+CREATE TABLE audit_logs_default PARTITION OF audit_logs DEFAULT;
+
+-- Секции на все месяцы со старыми записями и на 3 месяца вперёд (границы по UTC)
+DO $part$
+DECLARE
+  m DATE;
+BEGIN
+  FOR m IN
+    SELECT generate_series(
+      COALESCE((SELECT date_trunc('month', min(created_at) AT TIME ZONE 'UTC') FROM audit_logs_legacy),
+               date_trunc('month', now() AT TIME ZONE 'UTC')),
+      date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months',
+      interval '1 month'
+    )::date
+  LOOP
+    EXECUTE format(
+      'CREATE TABLE %I PARTITION OF audit_logs FOR VALUES FROM (%L) TO (%L)',
+      'audit_logs_' || to_char(m, 'YYYY_MM'),
+      m::text || ' 00:00:00+00',
+      (m + interval '1 month')::date::text || ' 00:00:00+00'
+    );
+  END LOOP;
+END
+$part$;
+
+INSERT INTO audit_logs (
+    id, user_id, action, entity_type, entity_id, details, ip_address, user_agent,
+    created_at, summary, bath_name, client_name, event_datetime, product_list
+)
+SELECT
+    id, user_id, action, entity_type, entity_id, details, ip_address, user_agent,
+    COALESCE(created_at, now()), summary, bath_name, client_name, event_datetime, product_list
+FROM audit_logs_legacy;
+
+CREATE INDEX ix_audit_logs_id ON audit_logs (id);
+CREATE INDEX ix_audit_logs_created ON audit_logs (created_at DESC, id DESC);
+CREATE INDEX ix_audit_logs_user_created ON audit_logs (user_id, created_at DESC);
+CREATE INDEX ix_audit_logs_entity_created ON audit_logs (entity_type, created_at DESC);
+CREATE INDEX ix_audit_logs_action_created ON audit_logs (action, created_at DESC);
+CREATE INDEX ix_audit_logs_entity_action_created ON audit_logs (entity_type, action, created_at DESC);
+
+DROP TABLE audit_logs_legacy;
+
+COMMIT;
@@ -0,0 +1,51 @@
+-- Защита от пересечения броней на уровне БД:
+-- period = [start_datetime, end_datetime + уборка), EXCLUDE по (bath_id, period).
+-- Время уборки хранится в самой брони (cleaning_minutes), т.к. генерируемая колонка
+-- не может читать таблицу settings.
+-- Выполнить на сервере:
+--   sudo -u postgres psql -d banya -f backend/migrations/2026_10_18_reservations_period_exclusion.sql
+
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE reservations
+    ADD COLUMN IF NOT EXISTS cleaning_minutes INTEGER NOT NULL DEFAULT 30;
+
+-- timestamptz + interval помечен STABLE; для интервала только из минут результат
+-- не зависит от часового пояса, поэтому обёртка безопасно объявлена IMMUTABLE.
+CREATE OR REPLACE FUNCTION reservation_period(s TIMESTAMPTZ, e TIMESTAMPTZ, cleaning INTEGER)
+RETURNS TSTZRANGE
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$ SELECT tstzrange(s, e + make_interval(mins => cleaning), '[)') $$;
+
+ALTER TABLE reservations
+    ADD COLUMN IF NOT EXISTS period TSTZRANGE
+    GENERATED ALWAYS AS (reservation_period(start_datetime, end_datetime, cleaning_minutes)) STORED;
+
+-- Уже пересекающиеся брони (допускались прежней проверкой без уборки после новой брони)
+-- не дают создать ограничение: миграция останавливается со списком пар, их нужно
+-- исправить вручную и запустить файл заново.
+DO $$
+DECLARE
+    conflicts TEXT;
+BEGIN
+    SELECT string_agg(format('баня %s: %s и %s', a.bath_id, a.reservation_id, b.reservation_id), ', ')
+    INTO conflicts
+    FROM reservations a
+    JOIN reservations b
+      ON b.bath_id = a.bath_id
+     AND b.reservation_id > a.reservation_id
+     AND b.period && a.period;
+    IF conflicts IS NOT NULL THEN
+        RAISE EXCEPTION 'Пересекающиеся брони: %', conflicts;
+    END IF;
+END
+$$;
+
+-- Индекс GiST создаётся самим ограничением
+ALTER TABLE reservations
+    ADD CONSTRAINT reservations_no_overlap
+    EXCLUDE USING gist (bath_id WITH =, period WITH &&);
+
+COMMIT;